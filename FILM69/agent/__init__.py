@@ -1,5 +1,9 @@
 from .agent import Agent
+from .tools import ParallelToolNode, ToolResultCache, pure_tool
 
 __all__ = [
     "Agent",
+    "ParallelToolNode",
+    "ToolResultCache",
+    "pure_tool",
 ]
\ No newline at end of file
@@ -1,18 +1,17 @@
-from langchain_mcp_adapters.client import MultiServerMCPClient
 from langgraph.graph import StateGraph, START, END
 from langgraph.graph.message import add_messages
-from langgraph.prebuilt import ToolNode, tools_condition
+from langgraph.prebuilt import tools_condition
 import asyncio
+import queue
+import weakref
+from threading import Lock, Thread
 from typing import Annotated
 from typing_extensions import TypedDict
 from langgraph.checkpoint.memory import MemorySaver
-import nest_asyncio
-from langchain_openai import ChatOpenAI
 from langchain_core.tools import tool
 from pydantic import BaseModel, Field
 
-nest_asyncio.apply()
-memory = MemorySaver()
+from .tools import MCP_POOL, ParallelToolNode, ToolResultCache, pure_tool
 
 
 class InputListSum(BaseModel):
@@ -23,35 +22,128 @@ def list_sum(numbers=list[int]):
     "รวมค่าใน list"
     return sum(numbers)
 
+pure_tool(list_sum)
+
 class State(TypedDict):
     messages: Annotated[list, add_messages]
 
+
+class _LoopThread:
+    """
+    Event loop running forever on a daemon thread. Agents build and run their graphs on it, so MCP sessions
+    always live on one loop, sync callers block on futures and async callers on other loops await them.
+    """
+
+    _shared = None
+    _shared_lock = Lock()
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = Thread(target=self.loop.run_forever, daemon=True, name="film69-agent-loop")
+        self._thread.start()
+
+    @classmethod
+    def shared(cls):
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def _on_loop(self):
+        try:
+            return asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            return False
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    async def _pump(self, agen, put):
+        try:
+            async for item in agen:
+                put(("item", item))
+        except Exception as e:
+            put(("error", e))
+        else:
+            put(("end", None))
+
+    def iterate(self, agen):
+        """Sync iterator over an async generator that runs on the loop thread."""
+        if self._on_loop():
+            raise RuntimeError("Blocking agent call made from the agent's event loop, use the async methods")
+        items = queue.Queue()
+        future = self.submit(self._pump(agen, items.put))
+        try:
+            while True:
+                kind, value = items.get()
+                if kind == "end":
+                    return
+                if kind == "error":
+                    raise value
+                yield value
+        finally:
+            future.cancel()
+
+    async def aiterate(self, agen):
+        """Async iterator, on the caller's loop, over an async generator that runs on the loop thread."""
+        if self._on_loop():
+            async for item in agen:
+                yield item
+            return
+        caller = asyncio.get_running_loop()
+        items = asyncio.Queue()
+        future = self.submit(self._pump(agen, lambda item: caller.call_soon_threadsafe(items.put_nowait, item)))
+        try:
+            while True:
+                kind, value = await items.get()
+                if kind == "end":
+                    return
+                if kind == "error":
+                    raise value
+                yield value
+        finally:
+            future.cancel()
+
+
 class Agent:
-    def __init__(self,model=None,tools_server:list[dict[str]]=None,memory:bool=True,tools:list=None):
+    """
+    Tool-calling agent graph. astream/ainvoke can be awaited from any event loop, stream/invoke from any
+    thread; all runs happen on one background event loop, so many conversations are served concurrently.
+    Each thread_id is a separate conversation, runs on the same thread_id are serialised.
+
+    Tool calls of one model turn run concurrently, each limited to tool_timeout seconds (tool_timeouts per
+    tool name), results of tools marked with pure_tool() are cached for tool_cache_ttl seconds. MCP server
+    connections are opened once and shared by every Agent, a lost connection is reopened on the next call.
+    """
+
+    def __init__(self,model=None,tools_server:list[dict[str]]=None,memory:bool=True,tools:list=None,
+                 tool_timeout:float=30.0,tool_timeouts:dict[str,float]=None,tool_cache_ttl:float=300,tool_cache:ToolResultCache=None):
         'model=None,tools_server:list[dict[str]]=[{"name":"sse","url":"http://localhost:8000/sse"}],memory:bool=True,tools:list=None'
-        
-        self.mcp_client = MultiServerMCPClient()
-        self.app = asyncio.run(self.make_graph(model,memory,tools_server,tools))
-        
+
+        self.mcp_pool = MCP_POOL
+        self.tool_timeout = tool_timeout
+        self.tool_timeouts = tool_timeouts
+        self.tool_cache = tool_cache if tool_cache is not None else ToolResultCache(ttl=tool_cache_ttl)
+        self.memory = MemorySaver() if memory else None
+        self._runner = _LoopThread.shared()
+        self._thread_locks = weakref.WeakValueDictionary()  # thread_id -> asyncio.Lock, dropped once no run holds it
+        # the graph is built in the background, the first run waits for it
+        self._app_future = self._runner.submit(self.make_graph(model,memory,tools_server,tools))
+
+    @property
+    def app(self):
+        return self._app_future.result()
+
     async def make_graph(self,model,used_memory,tools_server,tools):
         
         
-        if tools and tools_server:
-            for i in tools_server:
-                await self.mcp_client.connect_to_server_via_sse(i["name"], url=i["url"])
-            
-            mcp_tools = self.mcp_client.get_tools()+tools
-            llm_with_tools = model.bind_tools(mcp_tools)
-            
-        elif tools:
-            mcp_tools=tools
-            llm_with_tools = model.bind_tools(mcp_tools)
-        elif tools_server:
-            mcp_tools=tools_server
-            llm_with_tools = model.bind_tools(mcp_tools)
-        else:
+        mcp_tools=[]
+        for i in tools_server or []:
+            mcp_tools += await self.mcp_pool.get_tools(i)
+        mcp_tools += tools or []
+        if not mcp_tools:
             mcp_tools=[list_sum]
-            llm_with_tools = model.bind_tools(mcp_tools)
+        llm_with_tools = model.bind_tools(mcp_tools)
         
         graph_builder = StateGraph(State)
         
@@ -62,7 +154,7 @@ class Agent:
         
         graph_builder.add_node("chatbot", chatbot)
         
-        graph_builder.add_node('tools', ToolNode(mcp_tools))
+        graph_builder.add_node('tools', ParallelToolNode(mcp_tools,timeout=self.tool_timeout,timeouts=self.tool_timeouts,cache=self.tool_cache,mcp_pool=self.mcp_pool))
         graph_builder.add_conditional_edges(
             "chatbot",
             tools_condition,
@@ -71,65 +163,63 @@ class Agent:
         graph_builder.set_entry_point("chatbot")
 
         if used_memory:
-            app = graph_builder.compile(checkpointer=memory)
+            app = graph_builder.compile(checkpointer=self.memory)
         else:
             app = graph_builder.compile()
             
         return app
     
-    async def _gen(self,user_input):
-        async for event in self.app.astream(
-                {"messages": [{"role": "user", "content": user_input}]},
-                {"configurable": {"thread_id": "1"}},
-            ):
-                yield event
-                # print(event[list(event.keys())[0]]["messages"][-1].pretty_print())
-
-    def stream(self,text):
-        async def _run():
-            async for chunk in self.app.astream(
-                {"messages": [{"role": "user", "content": text}]},
-                {"configurable": {"thread_id": "1"}},
-            ):
-                yield chunk
-
-        # ตัวช่วยแปลง async generator -> sync generator
-        loop = asyncio.get_event_loop()
-        gen = _run().__aiter__()
-
-        async def get_next():
-            try:
-                return await gen.__anext__()
-            except StopAsyncIteration:
-                return None
-
-        while True:
-            result = loop.run_until_complete(get_next())
-            if result is None:
-                break
-            yield result
-            
-    def invoke(self,user_input):
+    async def _gen(self,user_input,thread_id="default"):
+        # runs on the agent loop
+        app = await asyncio.wrap_future(self._app_future)
+        lock = self._thread_locks.get(thread_id)
+        if lock is None:
+            lock = self._thread_locks[thread_id] = asyncio.Lock()
+        async with lock:
+            async for event in app.astream(
+                    {"messages": [{"role": "user", "content": user_input}]},
+                    {"configurable": {"thread_id": thread_id}},
+                ):
+                    yield event
+
+    async def astream(self,text,thread_id:str="default"):
+        """Yields the graph's events for one user message of conversation thread_id."""
+        async for event in self._runner.aiterate(self._gen(text,thread_id)):
+            yield event
+
+    async def ainvoke(self,user_input,thread_id:str="default"):
+        return [event async for event in self.astream(user_input,thread_id)]
+
+    def stream(self,text,thread_id:str="default"):
+        """Sync version of astream, safe to call from many threads at once."""
+        yield from self._runner.iterate(self._gen(text,thread_id))
+
+    def invoke(self,user_input,thread_id:str="default"):
         events=[]
-        for event in self.stream(user_input):
+        for event in self.stream(user_input,thread_id):
             events.append(event)
         return events
-    
+
 
 if __name__ == "__main__":
+    from langchain_openai import ChatOpenAI
+
     llm=ChatOpenAI(
         base_url="http://127.0.0.1:8080/v1/",
         model="qwen3-4b",
         api_key=""
     )
     tools_server=[{"name":"sse","url":"http://localhost:8000/sse"}]
-    
-    
+
+
     x=Agent(model=llm,memory=False,tools_server=tools_server)
     for event in x.stream("1+66="):
         print(event[list(event.keys())[0]]["messages"][-1].pretty_print())
-        
+
     print(x.invoke("1+66="))
 
-    
+    async def main():
+        # two conversations at once
+        print(await asyncio.gather(x.ainvoke("1+66=",thread_id="a"),x.ainvoke("2+3=",thread_id="b")))
 
+    asyncio.run(main())
@@ -0,0 +1,275 @@
+import argparse
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from langchain_core.messages import ToolMessage
+from langchain_mcp_adapters.client import MultiServerMCPClient
+
+
+def pure_tool(tool, ttl=None):
+    """Marks a tool as pure (same arguments, same result), so ParallelToolNode may cache its results.
+
+    Args:
+        tool (BaseTool): The tool, returned as is.
+        ttl (float | None): Seconds a result stays cached, None for the cache's default.
+    """
+    tool.metadata = {**(tool.metadata or {}), "film69_pure": True, "film69_ttl": ttl}
+    return tool
+
+
+def is_pure(tool):
+    return bool((tool.metadata or {}).get("film69_pure"))
+
+
+class ToolResultCache:
+    """
+    LRU cache of tool results with a time to live, keyed by tool name and JSON-encoded arguments.
+
+    Args:
+        ttl (float): Default seconds a result stays valid.
+        max_entries (int): Results kept.
+    """
+
+    def __init__(self, ttl=300, max_entries=1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    @staticmethod
+    def key(name, args):
+        return name, json.dumps(args, sort_keys=True, ensure_ascii=False, default=str)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self._data.pop(key, None)
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class ParallelToolNode:
+    """
+    Graph node that runs every tool call of the last AI message concurrently, each with a timeout, and caches
+    the results of pure tools. Failures and timeouts are returned to the model as error ToolMessages.
+    Sync tools run in the default executor; a timed-out sync tool keeps its thread until it returns.
+
+    Args:
+        tools (List[BaseTool]): Tools the model may call.
+        timeout (float | None): Default seconds per call, None for no limit.
+        timeouts (Dict[str, float] | None): Per tool name timeouts.
+        cache (ToolResultCache | None): Results of pure tools, pass one to share it between agents.
+        mcp_pool (MCPClientPool | None): Pool the MCP tools came from, they are looked up there again before
+            each call, so a server that reconnected is called through its new session.
+    """
+
+    def __init__(self, tools, timeout=30.0, timeouts=None, cache=None, mcp_pool=None):
+        self.tools_by_name = {tool.name: tool for tool in tools}
+        self.timeout = timeout
+        self.timeouts = timeouts or {}
+        self.cache = cache if cache is not None else ToolResultCache()
+        self.mcp_pool = mcp_pool
+
+    async def __call__(self, state):
+        message = state["messages"][-1]
+        results = await asyncio.gather(*(self._run(call) for call in message.tool_calls))
+        return {"messages": list(results)}
+
+    def _error(self, call, text):
+        return ToolMessage(content=f"Error: {text}\n Please fix your mistakes.", name=call["name"], tool_call_id=call["id"], status="error")
+
+    async def _run(self, call):
+        tool = self.tools_by_name.get(call["name"])
+        if tool is None:
+            return self._error(call, f"{call['name']} is not a valid tool, try one of [{', '.join(self.tools_by_name)}].")
+        if self.mcp_pool is not None:
+            try:
+                tool = self.tools_by_name[call["name"]] = await self.mcp_pool.current(tool)
+            except Exception as e:
+                return self._error(call, f"{call['name']} is unavailable, its MCP server could not be reached: {e!r}")
+
+        key = None
+        if is_pure(tool):
+            key = ToolResultCache.key(call["name"], call["args"])
+            cached = self.cache.get(key)
+            if cached is not None:
+                return ToolMessage(content=cached[0], artifact=cached[1], name=call["name"], tool_call_id=call["id"])
+
+        timeout = self.timeouts.get(call["name"], self.timeout)
+        try:
+            result = await asyncio.wait_for(tool.ainvoke({**call, "type": "tool_call"}), timeout)
+        except asyncio.TimeoutError:
+            return self._error(call, f"{call['name']} timed out after {timeout}s.")
+        except Exception as e:
+            return self._error(call, repr(e))
+
+        if not isinstance(result, ToolMessage):
+            result = ToolMessage(content=str(result), name=call["name"], tool_call_id=call["id"])
+        if key is not None and result.status != "error":
+            self.cache.put(key, (result.content, result.artifact), ttl=tool.metadata.get("film69_ttl"))
+        return result
+
+
+class MCPClientPool:
+    """
+    MCP tools per server, connected once and shared by every Agent. Must be used from one event loop
+    (the agents' background loop), each session is held open by a task of its own.
+    """
+
+    def __init__(self):
+        self._tools = {}
+        self._holders = []
+        self._lock = None
+
+    async def get_tools(self, server):
+        """
+        Tools of server {"name", "url", "transport" (default "sse")}, connecting on first use and again
+        after the session was lost.
+        """
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        key = (server["name"], server["url"], server.get("transport", "sse"))
+        async with self._lock:
+            tools = self._tools.get(key)
+            if tools is None:
+                tools = await self._connect(key, server)
+        return tools
+
+    async def current(self, tool):
+        """
+        Live version of a tool returned by get_tools: the tool itself while its session is open, the tool of the
+        same name from a new session once it was lost. Other tools are returned as is.
+        """
+        server = (tool.metadata or {}).get("film69_mcp_server")
+        if server is None:
+            return tool
+        tools = await self.get_tools(server)
+        if any(live is tool for live in tools):
+            return tool
+        return next((live for live in tools if live.name == tool.name), tool)
+
+    @staticmethod
+    def _tag(tools, server):
+        for tool in tools:
+            tool.metadata = {**(tool.metadata or {}), "film69_mcp_server": dict(server)}
+        return tools
+
+    async def _connect(self, key, server):
+        if hasattr(MultiServerMCPClient, "connect_to_server_via_sse"):  # langchain-mcp-adapters < 0.1
+            client = MultiServerMCPClient()
+            await client.connect_to_server_via_sse(server["name"], url=server["url"])
+            self._holders.append(client)
+            tools = self._tools[key] = self._tag(client.get_tools(), server)
+            return tools
+
+        from langchain_mcp_adapters.tools import load_mcp_tools
+
+        client = MultiServerMCPClient({server["name"]: {"url": server["url"], "transport": server.get("transport", "sse")}})
+        ready = asyncio.get_running_loop().create_future()
+
+        async def hold():
+            tools = None
+            try:
+                async with client.session(server["name"]) as session:
+                    tools = self._tools[key] = self._tag(await load_mcp_tools(session), server)
+                    ready.set_result(tools)
+                    await asyncio.Event().wait()
+            except Exception as e:
+                if not ready.done():
+                    ready.set_exception(e)
+            finally:
+                # the session is gone (server restart, dropped connection): forget its tools, the next get_tools reconnects
+                if tools is not None and self._tools.get(key) is tools:
+                    del self._tools[key]
+                if not ready.done():
+                    ready.cancel()
+                if task in self._holders:
+                    self._holders.remove(task)
+
+        task = asyncio.ensure_future(hold())
+        self._holders.append(task)
+        return await ready
+
+
+MCP_POOL = MCPClientPool()
+
+
+if __name__ == "__main__":
+    # Sequential tool execution vs ParallelToolNode vs ParallelToolNode with the pure tool cache
+    from langchain_core.messages import AIMessage
+    from langchain_core.tools import tool
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=4, help="Tool calls per AI message")
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.1, help="Seconds each stub tool takes")
+    args = parser.parse_args()
+
+    @tool
+    async def slow_lookup(query: str) -> str:
+        "Stub I/O-bound tool."
+        await asyncio.sleep(args.latency)
+        return query.upper()
+
+    @tool
+    def slow_sum(numbers: list[int]) -> int:
+        "Stub blocking tool."
+        time.sleep(args.latency)
+        return sum(numbers)
+
+    pure_tool(slow_sum)
+    tools = [slow_lookup, slow_sum]
+    calls = [
+        {"name": "slow_lookup", "args": {"query": f"q{i}"}, "id": f"l{i}"} if i % 2 else
+        {"name": "slow_sum", "args": {"numbers": [i, i]}, "id": f"s{i}"}
+        for i in range(args.calls)
+    ]
+    state = {"messages": [AIMessage(content="", tool_calls=calls)]}
+
+    async def sequential():
+        for call in calls:
+            await {t.name: t for t in tools}[call["name"]].ainvoke({**call, "type": "tool_call"})
+
+    async def main():
+        start = time.perf_counter()
+        for _ in range(args.turns):
+            await sequential()
+        sequential_time = time.perf_counter() - start
+
+        node = ParallelToolNode(tools, cache=ToolResultCache(ttl=0))
+        start = time.perf_counter()
+        for _ in range(args.turns):
+            await node(state)
+        parallel_time = time.perf_counter() - start
+
+        node = ParallelToolNode(tools)
+        start = time.perf_counter()
+        for _ in range(args.turns):
+            await node(state)
+        cached_time = time.perf_counter() - start
+
+        print(f"sequential           {sequential_time:6.2f}s")
+        print(f"parallel             {parallel_time:6.2f}s  x{sequential_time / parallel_time:.1f}")
+        print(f"parallel + cache     {cached_time:6.2f}s  x{sequential_time / cached_time:.1f}  ({node.cache.hits} hits)")
+
+    asyncio.run(main())
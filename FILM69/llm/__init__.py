@@ -4,6 +4,14 @@ warnings.simplefilter("ignore", UserWarning)
 
 with dis_print():
     from .model import LLMModel
+    from .batch_server import ContinuousBatchingServer
+    from .prefix_cache import PrefixCacheStore
+    from .session import SessionManager,DiskHistoryStore
+    from .streaming import TokenStream,StreamStats
+    from .metrics import MetricsRegistry,REGISTRY
+    from .semantic_cache import SemanticCache
+    from .context_packer import ContextPacker,PackedContext
+    from .indexer import Indexer,chunk_text
     try:from .vectordb import VectorDB
     except:print("Unable to import VectorDB")
     try:from .fast_model import FastAutoModel,FastVLLM,FastLLM,FastModel
@@ -19,6 +27,19 @@ with dis_print():
 
 __all__ =[
     "LLMModel",
+    "ContinuousBatchingServer",
+    "PrefixCacheStore",
+    "SessionManager",
+    "DiskHistoryStore",
+    "TokenStream",
+    "StreamStats",
+    "MetricsRegistry",
+    "REGISTRY",
+    "SemanticCache",
+    "ContextPacker",
+    "PackedContext",
+    "Indexer",
+    "chunk_text",
     "VectorDB",
     "LlmRagChromadb",
     "Llama",
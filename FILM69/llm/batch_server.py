@@ -0,0 +1,381 @@
+import argparse
+import queue
+import time
+from threading import Event, Lock, Thread
+
+import torch
+from transformers import DynamicCache
+
+from .streaming import IncrementalDecoder, StreamStats
+
+
+def _cache_to_layers(cache):
+    """Per-layer [key, value] tensors of a DynamicCache, shaped b x heads x t x dim."""
+    if hasattr(cache, "layers"):
+        return [[layer.keys, layer.values] for layer in cache.layers]
+    if hasattr(cache, "key_cache"):
+        return [[k, v] for k, v in zip(cache.key_cache, cache.value_cache)]
+    return [list(kv) for kv in cache]
+
+
+def _layers_to_cache(layers):
+    if hasattr(DynamicCache, "from_legacy_cache"):
+        return DynamicCache.from_legacy_cache(tuple((k, v) for k, v in layers))
+    return DynamicCache(ddp_cache_data=[(k, v) for k, v in layers])
+
+
+def _left_pad(t, length, dim=-1, value=0):
+    pad = length - t.shape[dim]
+    if pad <= 0:
+        return t
+    shape = list(t.shape)
+    shape[dim] = pad
+    return torch.cat([t.new_full(shape, value), t], dim=dim)
+
+
+def sample_next_tokens(logits, temperature, top_p):
+    """
+    Samples one token per row with per-row temperature and top-p, rows with temperature 0 are greedy.
+
+    Args:
+        logits (torch.Tensor): b x vocab.
+        temperature (torch.Tensor): b.
+        top_p (torch.Tensor): b.
+    """
+    logits = logits.float()
+    greedy = logits.argmax(dim=-1)
+    do_sample = temperature > 0
+    if not do_sample.any():
+        return greedy
+
+    logits = logits / temperature.clamp(min=1e-5)[:, None]
+    sorted_logits, sorted_idx = torch.sort(logits, descending=True, dim=-1)
+    cum_probs = sorted_logits.softmax(dim=-1).cumsum(dim=-1)
+    remove = cum_probs - sorted_logits.softmax(dim=-1) >= top_p[:, None]  # always keeps the top token
+    sorted_logits = sorted_logits.masked_fill(remove, float("-inf"))
+    sampled = sorted_idx.gather(-1, torch.multinomial(sorted_logits.softmax(dim=-1), 1)).squeeze(-1)
+    return torch.where(do_sample, sampled, greedy)
+
+
+class GenerationRequest:
+    """
+    One sequence submitted to a ContinuousBatchingServer, its tokens arrive on a queue of its own.
+
+    Args:
+        input_ids (List[int]): Prompt token ids.
+        max_new_tokens (int): Generation budget.
+        temperature (float): Sampling temperature, 0 for greedy.
+        top_p (float): Nucleus sampling threshold.
+        eos_token_id (List[int]): Ids that end the sequence.
+        model_inputs (dict | None): Extra prefill inputs, such requests are prefilled alone. Image inputs
+            (pixel_*) are rejected: rows are decoded with 1-D positions, wrong for mrope models such as Qwen2-VL.
+    """
+
+    def __init__(self, input_ids, max_new_tokens=512, temperature=0.4, top_p=0.9, eos_token_id=None, model_inputs=None):
+        self.input_ids = [int(i) for i in input_ids]
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.top_p = top_p
+        self.eos_token_id = set(eos_token_id or [])
+        self.model_inputs = model_inputs or {}
+        if any(k.startswith("pixel_") for k in self.model_inputs):
+            raise ValueError("ContinuousBatchingServer does not serve image inputs, generate them with model.generate")
+        self.generated = []
+        self.tokens = queue.Queue()
+        self.cancelled = Event()
+        self.done = Event()
+        self.stats = StreamStats(prompt_tokens=len(self.input_ids))
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def token_ids(self):
+        """Yields generated token ids as the scheduler produces them."""
+        try:
+            while True:
+                token = self.tokens.get()
+                if token is None:
+                    return
+                if isinstance(token, BaseException):
+                    raise token
+                yield token
+        finally:
+            self.cancel()
+
+    def text_stream(self, tokenizer, skip_special_tokens=True):
+        decoder = IncrementalDecoder(tokenizer, skip_special_tokens=skip_special_tokens)
+        for token in self.token_ids():
+            text = decoder.push(token)
+            if text:
+                yield text
+
+    def result(self, tokenizer=None, skip_special_tokens=True):
+        ids = list(self.token_ids())
+        if tokenizer is None:
+            return ids
+        return tokenizer.decode(ids, skip_special_tokens=skip_special_tokens)
+
+
+class ContinuousBatchingServer:
+    """
+    Token-level scheduler over a Hugging Face causal LM. New requests are prefilled and merged into the
+    running batch between decode steps, finished ones leave it, so one forward pass serves every active request.
+
+    The running batch keeps a left-padded DynamicCache, models are run with full-attention caches
+    (sliding-window layers are handled by the attention mask). Sampling supports temperature and top_p,
+    other generate() options are not applied.
+
+    Args:
+        model: Causal LM, e.g. FastLLM.model or AutoModelForCausalLM.
+        max_batch_size (int): Maximum number of sequences decoded together.
+        pad_token_id (int): Id fed for padding positions, masked out anyway.
+    """
+
+    def __init__(self, model, max_batch_size=8, pad_token_id=0):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.pad_token_id = pad_token_id
+        self.pending = queue.Queue()
+        self.steps = 0
+        self.generated_tokens = 0
+        self._lock = Lock()
+        self._running = False
+        self._thread = None
+        self._reset_batch()
+
+    def _reset_batch(self):
+        self.rows = []
+        self.layers = None
+        self.attention_mask = None
+        self.next_positions = None
+        self.next_tokens = None
+
+    @property
+    def device(self):
+        return self.model.device
+
+    def start(self):
+        with self._lock:
+            if not self._running:
+                self._running = True
+                self._thread = Thread(target=self._loop, daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops the scheduler, running and queued requests end with a RuntimeError."""
+        with self._lock:
+            self._running = False
+        self.pending.put(None)
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        error = RuntimeError("ContinuousBatchingServer was stopped")
+        live = list(self.rows)
+        while True:
+            try:
+                request = self.pending.get_nowait()
+            except queue.Empty:
+                break
+            if request is not None:
+                live.append(request)
+        for request in live:
+            if not request.done.is_set():
+                request.tokens.put(error)
+                request.done.set()
+        self._reset_batch()
+
+    def submit(self, input_ids, **kwargs):
+        """Queues a prompt, returns its GenerationRequest. See GenerationRequest for the arguments."""
+        if hasattr(input_ids, "keys"):  # BatchEncoding
+            input_ids = input_ids["input_ids"]
+        if isinstance(input_ids, torch.Tensor):
+            input_ids = input_ids.reshape(-1).tolist()
+        request = GenerationRequest(input_ids, **kwargs)
+        self.start()
+        self.pending.put(request)
+        return request
+
+    def _loop(self):
+        while self._running:
+            try:
+                self._admit()
+                if self.rows:
+                    self._step()
+            except Exception as e:
+                for request in self.rows:
+                    request.tokens.put(e)
+                    request.done.set()
+                self._reset_batch()
+
+    def _admit(self):
+        admitted = []
+        block = not self.rows  # idle: wait for work instead of spinning
+        while len(self.rows) + len(admitted) < self.max_batch_size:
+            try:
+                request = self.pending.get(block=block and not admitted)
+            except queue.Empty:
+                break
+            if request is None:
+                break
+            if not request.cancelled.is_set():
+                admitted.append(request)
+        if not admitted:
+            return
+
+        # plain text prompts are prefilled together, requests with extra inputs one by one
+        text_only = [r for r in admitted if not r.model_inputs]
+        groups = [text_only] if text_only else []
+        groups += [[r] for r in admitted if r.model_inputs]
+        for group in groups:
+            try:
+                self._merge(group, *self._prefill(group))
+            except Exception as e:
+                for request in group:
+                    request.tokens.put(e)
+                    request.done.set()
+
+    @torch.inference_mode()
+    def _prefill(self, requests):
+        length = max(len(r.input_ids) for r in requests)
+        input_ids = torch.stack(
+            [_left_pad(torch.tensor(r.input_ids), length, value=self.pad_token_id) for r in requests]
+        ).to(self.device)
+        attention_mask = torch.stack(
+            [_left_pad(torch.ones(len(r.input_ids), dtype=torch.long), length) for r in requests]
+        ).to(self.device)
+        inputs = dict(input_ids=input_ids, attention_mask=attention_mask)
+        if len(requests) > 1:
+            inputs["position_ids"] = (attention_mask.cumsum(-1) - 1).clamp(min=0)
+        inputs.update({k: v.to(self.device) if isinstance(v, torch.Tensor) else v for k, v in requests[0].model_inputs.items()})
+
+        cache = DynamicCache()
+        out = self.model(**inputs, past_key_values=cache, use_cache=True, logits_to_keep=1)
+        return _cache_to_layers(out.past_key_values), attention_mask, out.logits[:, -1]
+
+    def _merge(self, requests, layers, attention_mask, logits):
+        tokens = sample_next_tokens(logits, *self._sampling_params(requests))
+        positions = attention_mask.sum(-1)
+        if self.rows:
+            length = max(self.attention_mask.shape[-1], attention_mask.shape[-1])
+            self.layers = [
+                [torch.cat([_left_pad(a, length, dim=2), _left_pad(b, length, dim=2)]) for a, b in zip(old, new)]
+                for old, new in zip(self.layers, layers)
+            ]
+            self.attention_mask = torch.cat([_left_pad(self.attention_mask, length), _left_pad(attention_mask, length)])
+            self.next_positions = torch.cat([self.next_positions, positions])
+            self.next_tokens = torch.cat([self.next_tokens, tokens])
+        else:
+            self.layers, self.attention_mask, self.next_positions, self.next_tokens = layers, attention_mask, positions, tokens
+        offset = len(self.rows)
+        self.rows.extend(requests)
+        self._emit(tokens, offset)
+
+    def _sampling_params(self, requests):
+        temperature = torch.tensor([float(r.temperature or 0) for r in requests], device=self.device)
+        top_p = torch.tensor([float(r.top_p if r.top_p is not None else 1.0) for r in requests], device=self.device)
+        return temperature, top_p
+
+    @torch.inference_mode()
+    def _step(self):
+        self.attention_mask = torch.cat([self.attention_mask, self.attention_mask.new_ones(len(self.rows), 1)], dim=-1)
+        out = self.model(
+            input_ids=self.next_tokens[:, None],
+            attention_mask=self.attention_mask,
+            position_ids=self.next_positions[:, None],
+            past_key_values=_layers_to_cache(self.layers),
+            use_cache=True,
+        )
+        self.layers = _cache_to_layers(out.past_key_values)
+        self.next_positions = self.next_positions + 1
+        self.next_tokens = sample_next_tokens(out.logits[:, -1], *self._sampling_params(self.rows))
+        self.steps += 1
+        self._emit(self.next_tokens)
+
+    def _emit(self, tokens, offset=0):
+        """Delivers tokens to rows offset.., rows before offset (already running when tokens are the new rows' first ones) stay."""
+        keep = list(range(offset))
+        for i, token in enumerate(tokens.tolist(), start=offset):
+            request = self.rows[i]
+            finished = request.cancelled.is_set()
+            if not finished:
+                if token in request.eos_token_id:
+                    request.stats.on_token(0)
+                    finished = True
+                else:
+                    request.stats.on_token()
+                    request.generated.append(token)
+                    request.tokens.put(token)
+                    self.generated_tokens += 1
+                    finished = len(request.generated) >= request.max_new_tokens
+            if finished:
+                request.stats.finish()
+                request.tokens.put(None)
+                request.done.set()
+            else:
+                keep.append(i)
+
+        if len(keep) == len(self.rows):
+            return
+        if not keep:
+            self._reset_batch()
+            return
+        index = torch.tensor(keep, device=self.device)
+        self.rows = [self.rows[i] for i in keep]
+        self.attention_mask = self.attention_mask[index]
+        self.next_positions = self.next_positions[index]
+        self.next_tokens = self.next_tokens[index]
+        self.layers = [[k[index], v[index]] for k, v in self.layers]
+
+        # drop leading columns that are padding for every remaining row
+        start = int((self.attention_mask.cumsum(-1) == 0).all(0).sum())
+        if start:
+            self.attention_mask = self.attention_mask[:, start:]
+            self.layers = [[k[:, :, start:], v[:, :, start:]] for k, v in self.layers]
+
+
+if __name__ == "__main__":
+    # Throughput of sequential generate() vs the continuous batching scheduler, on CPU with a tiny model
+    from transformers import AutoModelForCausalLM, LlamaConfig, LlamaForCausalLM
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default=None, help="Local HF model, a tiny random Llama when omitted")
+    parser.add_argument("--requests", type=int, default=16)
+    parser.add_argument("--max_batch_size", type=int, default=8)
+    parser.add_argument("--max_new_tokens", type=int, default=32)
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    if args.model:
+        model = AutoModelForCausalLM.from_pretrained(args.model).eval()
+    else:
+        config = LlamaConfig(
+            vocab_size=1024, hidden_size=256, intermediate_size=512, num_hidden_layers=4, num_attention_heads=8, num_key_value_heads=4
+        )
+        model = LlamaForCausalLM(config).eval()
+    vocab_size = model.config.vocab_size
+    prompts = [torch.randint(1, vocab_size, (16 + 8 * (i % 5),)).tolist() for i in range(args.requests)]
+
+    start = time.perf_counter()
+    sequential_tokens = 0
+    with torch.inference_mode():
+        for prompt in prompts:
+            out = model.generate(
+                torch.tensor([prompt]), max_new_tokens=args.max_new_tokens, min_new_tokens=args.max_new_tokens, do_sample=False
+            )
+            sequential_tokens += out.shape[-1] - len(prompt)
+    sequential = time.perf_counter() - start
+
+    server = ContinuousBatchingServer(model, max_batch_size=args.max_batch_size).start()
+    start = time.perf_counter()
+    requests = [server.submit(prompt, max_new_tokens=args.max_new_tokens, temperature=0) for prompt in prompts]
+    batched_tokens = sum(len(request.result()) for request in requests)
+    batched = time.perf_counter() - start
+    ttft = [request.stats.ttft for request in requests]
+    server.stop()
+
+    print(f"sequential generate  {sequential_tokens / sequential:8.1f} tok/s  ({sequential:.2f}s)")
+    print(
+        f"continuous batching  {batched_tokens / batched:8.1f} tok/s  ({batched:.2f}s, {server.steps} steps, "
+        f"mean TTFT {sum(ttft) / len(ttft) * 1000:.0f} ms)  x{(batched_tokens / batched) / (sequential_tokens / sequential):.1f}"
+    )
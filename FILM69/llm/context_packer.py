@@ -0,0 +1,160 @@
+import math
+import re
+
+
+def _overlap(left, right, min_chars):
+    """Length of the longest suffix of left that is also a prefix of right, 0 when shorter than min_chars."""
+    if min(len(left), len(right)) < min_chars:
+        return 0
+    probe = right[:min_chars]
+    start = left.find(probe, max(0, len(left) - len(right)))
+    while start != -1:
+        if right.startswith(left[start:]):
+            return len(left) - start
+        start = left.find(probe, start + 1)
+    return 0
+
+
+class PackedContext:
+    """
+    Result of ContextPacker.pack.
+
+    Args:
+        chunks (List[str]): Packed texts in rank order, trimmed of overlaps, the last one possibly a fragment.
+        text (str): The chunks joined by the separator.
+        tokens (int): Tokens of text.
+        budget (int | None): Token budget the text was packed into.
+        sources (List[int]): Index in the input of each packed chunk.
+        duplicates (int): Chunks dropped as duplicates or contained in another chunk.
+        truncated (bool): Whether the last chunk is a fragment.
+        dropped (int): Chunks left out for lack of budget.
+    """
+
+    def __init__(self, chunks, text, tokens, budget, sources, duplicates=0, truncated=False, dropped=0):
+        self.chunks = chunks
+        self.text = text
+        self.tokens = tokens
+        self.budget = budget
+        self.sources = sources
+        self.duplicates = duplicates
+        self.truncated = truncated
+        self.dropped = dropped
+
+    def as_dict(self):
+        return {
+            "tokens": self.tokens,
+            "budget": self.budget,
+            "chunks": len(self.chunks),
+            "duplicates": self.duplicates,
+            "truncated": self.truncated,
+            "dropped": self.dropped,
+        }
+
+    def __str__(self):
+        return self.text
+
+
+class ContextPacker:
+    """
+    Packs retrieved chunks, best first, into a token budget: whole chunks while they fit, then a fragment of
+    the next one if at least min_fragment_tokens are left. Repeated chunks and chunks contained in a packed
+    one are dropped, text shared with a packed chunk (chunking overlap) is trimmed.
+
+    Args:
+        tokenizer: Model tokenizer (encode/decode, a processor's .tokenizer is used), None estimates
+            chars_per_token characters per token.
+        max_tokens (int | None): Token budget of the packed text, None for no limit.
+        separator (str): Put before every chunk.
+        min_fragment_tokens (int): Smallest fragment worth adding when the next chunk does not fit.
+        min_overlap_chars (int): Shortest shared text trimmed between two chunks.
+        chars_per_token (float): Estimate used without a tokenizer.
+    """
+
+    def __init__(self, tokenizer=None, max_tokens=2048, separator="\n", min_fragment_tokens=32, min_overlap_chars=32, chars_per_token=3.0):
+        self.tokenizer = getattr(tokenizer, "tokenizer", tokenizer)
+        self.max_tokens = max_tokens
+        self.separator = separator
+        self.min_fragment_tokens = min_fragment_tokens
+        self.min_overlap_chars = min_overlap_chars
+        self.chars_per_token = chars_per_token
+
+    def count(self, text):
+        if self.tokenizer is None:
+            return math.ceil(len(text) / self.chars_per_token)
+        return len(self.tokenizer.encode(text, add_special_tokens=False))
+
+    def truncate(self, text, max_tokens):
+        """Longest prefix of text within max_tokens, cut back to a whitespace when one is in its second half."""
+        if self.tokenizer is None:
+            head = text[: int(max_tokens * self.chars_per_token)]
+        else:
+            ids = self.tokenizer.encode(text, add_special_tokens=False)[:max_tokens]
+            head = self.tokenizer.decode(ids, skip_special_tokens=True)
+            # decoding may not round-trip (e.g. a split multi-byte character)
+            while head and self.count(head) > max_tokens:
+                head = head[:-1]
+        if len(head) < len(text):
+            cut = max(head.rfind(" "), head.rfind("\n"))
+            if cut > len(head) // 2:
+                head = head[:cut]
+        return head.rstrip()
+
+    def _dedupe(self, chunk, packed):
+        """chunk without the text it shares with packed chunks, None when it adds nothing."""
+        key = re.sub(r"\s+", " ", chunk).strip()
+        for other in packed:
+            other_key = re.sub(r"\s+", " ", other).strip()
+            if not key or key in other_key:
+                return None
+        for other in packed:
+            shared = _overlap(other, chunk, self.min_overlap_chars)
+            if shared:
+                chunk = chunk[shared:]
+            shared = _overlap(chunk, other, self.min_overlap_chars)
+            if shared:
+                chunk = chunk[:-shared]
+        return chunk if chunk.strip() else None
+
+    def pack(self, chunks, max_tokens=None):
+        """
+        Args:
+            chunks (Iterable[str]): Retrieved texts, best first.
+            max_tokens (int | None): Overrides the packer's budget.
+
+        Returns:
+            PackedContext
+        """
+        budget = self.max_tokens if max_tokens is None else max_tokens
+        separator_tokens = self.count(self.separator)
+        packed, sources = [], []
+        used = duplicates = dropped = 0
+        truncated = False
+        chunks = list(chunks)
+        for i, chunk in enumerate(chunks):
+            if chunk is None:
+                continue
+            chunk = self._dedupe(chunk, packed)
+            if chunk is None:
+                duplicates += 1
+                continue
+            if truncated:
+                dropped += 1
+                continue
+            tokens = self.count(chunk) + separator_tokens
+            if budget is None or used + tokens <= budget:
+                packed.append(chunk)
+                sources.append(i)
+                used += tokens
+                continue
+            left = budget - used - separator_tokens
+            if left >= self.min_fragment_tokens:
+                fragment = self.truncate(chunk, left)
+                if fragment:
+                    packed.append(fragment)
+                    sources.append(i)
+                    used += self.count(fragment) + separator_tokens
+                    truncated = True
+                    continue
+            dropped += 1
+        text = "".join(self.separator + chunk for chunk in packed)
+        return PackedContext(packed, text, self.count(text) if self.tokenizer is not None else used, budget, sources, duplicates, truncated, dropped)
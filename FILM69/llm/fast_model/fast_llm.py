@@ -5,16 +5,22 @@ from unsloth import FastLanguageModel
 import datasets
 import pandas as pd
 from trl import SFTTrainer
-from transformers import TrainingArguments, TextIteratorStreamer
+from transformers import TrainingArguments
 import torch
-from threading import Thread
 from unsloth import is_bfloat16_supported
 from pathlib import Path
 
+from ..batch_server import ContinuousBatchingServer
+from ..prefix_cache import PrefixCacheStore
+from ..session import SessionManager
+from ..streaming import TokenStream, TokenStreamer, start_generation
+
 
 class FastLLM:
     def __init__(self):
-        self.chat_history = []
+        self.sessions = SessionManager()
+        self.batch_server = None
+        self.prefix_cache = PrefixCacheStore()
         self.quantization_method = {
             "not_quantized": "แนะนำ คอนเวอร์ชันรวดเร็ว แต่การอนุมานช้า ไฟล์ขนาดใหญ่",
             "fast_quantized": "แนะนำ คอนเวอร์ชันรวดเร็ว การอนุมานโอเค ขนาดไฟล์โอเค",
@@ -67,6 +73,15 @@ class FastLLM:
         }
         self.chat_format = "model"
 
+    @property
+    def chat_history(self):
+        """Messages of the "default" session as a list view (append, del, ... edit it), assign a list to replace them."""
+        return self.sessions.view("default")
+
+    @chat_history.setter
+    def chat_history(self, messages):
+        self.sessions.set_messages("default", messages)
+
     def apply_chat_template(self, message):
         """Applies the selected chat template to the message."""
         if self.chat_format not in self.chat_template_model:
@@ -101,6 +116,7 @@ class FastLLM:
         ]
         formatted_chat = self.tokenizer.apply_chat_template(messages, tokenize=False)
         self.chat_template["model"] = formatted_chat
+        self.sessions.tokenizer = self.tokenizer
 
     def load_dataset(self, df=None, chat_template="model", add_eot=True, additional_information=False):
         """Loads and formats the dataset."""
@@ -204,6 +220,15 @@ class FastLLM:
         """Saves the trained model."""
         self.model.save_pretrained_merged(model_name, self.tokenizer, save_method=save_method, **kwargs)
 
+    def start_batch_server(self, max_batch_size=8):
+        """Routes generate() through a continuous batching scheduler, so concurrent calls share decode steps."""
+        FastLanguageModel.for_inference(self.model)
+        if self.batch_server is None:
+            self.batch_server = ContinuousBatchingServer(
+                self.model, max_batch_size=max_batch_size, pad_token_id=self.tokenizer.pad_token_id or 0
+            )
+        return self.batch_server.start()
+
     def generate(
         self,
         text: str,
@@ -214,41 +239,75 @@ class FastLLM:
         top_p=0.9,
         end: list[str] = None,
         apply_chat_template=True,
+        session_id: str = "default",
+        coalesce_chars=0,
+        coalesce_ms=0,
+        return_stats=False,
         **kwargs,
     ):
-        """Generates text based on the input."""
+        """Generates text based on the input. With history_save, the conversation is kept in self.sessions
+        under session_id and its key/values in self.prefix_cache, so only the new turn is prefilled.
+
+        With stream=True a TokenStream of text deltas is returned (one per token unless coalesce_chars /
+        coalesce_ms group them), its .stats hold token counts, TTFT and inter-token latency. Otherwise the
+        text, or (text, StreamStats) with return_stats=True."""
         FastLanguageModel.for_inference(self.model)
 
         if end is None:
             end = [self.tokenizer.eos_token]
 
         if history_save:
-            self.chat_history.append({"role": "user", "content": text})
+            self.sessions.append(session_id, "user", text)
+            messages = self.sessions.messages(session_id)
+        else:
+            messages = [{"role": "user", "content": text}]
 
-        self.streamer = TextIteratorStreamer(
-            self.tokenizer, skip_prompt=False, skip_special_tokens=True, do_sample=True, temperature=temperature, top_p=top_p
-        )
+        # one streamer per call, concurrent calls must not share it, without stream it only counts tokens
+        streamer = self.streamer = TokenStreamer(self.tokenizer if stream else None)
+
+        def save(text_out):
+            if history_save:
+                self.sessions.append(session_id, "assistant", text_out)
 
         if apply_chat_template:
             input_ids = self.tokenizer.apply_chat_template(
-                self.chat_history if history_save else [{"role": "user", "content": text}],
+                messages,
                 add_generation_prompt=True,
                 return_tensors="pt",
             ).to(self.model.device)
         else:
             self.chat_format = apply_chat_template
             input_ids = self.tokenizer(
-                self.apply_chat_template(self.chat_history if history_save else [{"role": "user", "content": text}]),
+                self.apply_chat_template(messages),
                 return_tensors="pt",
             ).to(self.model.device)
 
         terminators = [self.tokenizer.eos_token_id] + [self.tokenizer.convert_tokens_to_ids(i) for i in end]
 
+        if self.batch_server is not None:
+            request = self.batch_server.submit(
+                input_ids, max_new_tokens=max_new_tokens, temperature=temperature, top_p=top_p, eos_token_id=terminators
+            )
+            if stream:
+                return TokenStream(
+                    request.text_stream(self.tokenizer), request.stats, coalesce_chars, coalesce_ms,
+                    on_close=save, cancel=request.cancel,
+                )
+            text_out = request.result(self.tokenizer)
+            save(text_out)
+            return (text_out, request.stats) if return_stats else text_out
+
+        prompt_ids = input_ids if apply_chat_template else input_ids["input_ids"]
+
         def generate_with_params(input_ids,**kwargs):
-            return self.model.generate(input_ids,**kwargs)
+            if not history_save:
+                return self.model.generate(input_ids,**kwargs)
+            kwargs["past_key_values"] = self.prefix_cache.take(session_id, input_ids)
+            outputs = self.model.generate(input_ids, return_dict_in_generate=True, **kwargs)
+            self.prefix_cache.put(session_id, outputs.sequences[0], outputs.past_key_values)
+            return outputs.sequences
 
         generate_params = {
-            "streamer": self.streamer,
             "max_new_tokens": max_new_tokens,
             "eos_token_id": terminators,
             "do_sample": True,
@@ -258,32 +317,16 @@ class FastLLM:
         }
 
         if stream:
-            thread = Thread(target=generate_with_params, kwargs={"input_ids":input_ids,**generate_params} if apply_chat_template else {**input_ids,**generate_params})
-            thread.start()
-
-            def inner():
-                text_out = ""
-                if history_save:
-                    self.chat_history.append({"role": "assistant", "content": text_out})
-                index=0
-                for new_text in self.streamer:
-                    text_out += new_text
-                    index+=1
-                    if index>=2:
-                        if history_save:
-                            self.chat_history[-1] = {"role": "assistant", "content": text_out}
-                        yield new_text
-                thread.join()
-
-            return inner()
+            deltas = start_generation(generate_with_params, streamer, input_ids=prompt_ids, **generate_params)
+            return TokenStream(
+                deltas, streamer.stats, coalesce_chars, coalesce_ms, on_close=save, cancel=streamer.cancel
+            )
         else:
-            outputs = generate_with_params(input_ids,**generate_params)
-            response = outputs[0][input_ids.shape[-1] :]
+            outputs = generate_with_params(prompt_ids, streamer=streamer, **generate_params)
+            response = outputs[0][prompt_ids.shape[-1] :]
             text_out = self.tokenizer.decode(response, skip_special_tokens=True)
-
-            if history_save:
-                self.chat_history.append({"role": "assistant", "content": text_out})
-            return text_out
+            save(text_out)
+            return (text_out, streamer.stats) if return_stats else text_out
 
     def export_to_GGUF(
         self,
@@ -3,20 +3,27 @@ import os
 import shutil
 from pathlib import Path
 import json
-from threading import Thread
 
 import torch
 from PIL import Image
 from datasets import load_dataset
-from transformers import TextIteratorStreamer
 from trl import SFTTrainer, SFTConfig
 
 from unsloth import FastModel as _FastModel
 from unsloth import UnslothVisionDataCollator, is_bf16_supported
 from unsloth_zoo.vision_utils import process_vision_info, get_padding_tokens_ids, _get_dtype
 
+from ..batch_server import ContinuousBatchingServer
+from ..prefix_cache import PrefixCacheStore
+from ..session import SessionManager
+from ..streaming import TokenStream, TokenStreamer, start_generation
+from .image_cache import ImagePreprocessor
+
 warnings.simplefilter("ignore", SyntaxWarning)
 
+# processor outputs that belong to the images of a prompt
+_IMAGE_INPUTS = ("pixel_", "image_", "video_", "token_type_ids", "mm_token_type_ids", "aspect_ratio_", "cross_attention_mask")
+
 
 class FastModel:
     """
@@ -25,9 +32,8 @@ class FastModel:
     """
 
     def __init__(self) -> None:
-        """Initializes the FastModel with empty chat and image histories."""
-        self.chat_history = []
-        self.images_history = []
+        """Initializes the FastModel with an empty session manager."""
+        self.sessions = SessionManager()
         self.model = None
         self.processor = None
         self.converted_dataset = None
@@ -35,6 +41,23 @@ class FastModel:
         self.load_in_4bit = False
         self.load_in_8bit = False
         self.streamer = None
+        self.batch_server = None
+        self.prefix_cache = PrefixCacheStore()
+        self.image_preprocessor = ImagePreprocessor()
+
+    @property
+    def chat_history(self):
+        """Messages of the "default" session as a list view (append, del, ... edit it), assign a list to replace them."""
+        return self.sessions.view("default", parts=True)
+
+    @chat_history.setter
+    def chat_history(self, messages):
+        self.sessions.set_messages("default", messages)
+
+    @property
+    def images_history(self):
+        """Images still in the "default" session's history."""
+        return self.sessions.images("default")
 
     def load_model(self, model_name, dtype=None, load_in_4bit=False, load_in_8bit=False, **kwargs):
         """Loads a pre-trained model and processor.
@@ -55,6 +78,8 @@ class FastModel:
         )
         self.load_in_4bit = load_in_4bit
         self.load_in_8bit = load_in_8bit
+        self.sessions.tokenizer = getattr(self.processor, "tokenizer", self.processor)
+        self.image_preprocessor.wrap_processor(self.processor)
 
     def load_dataset(self, dataset):
         """Loads a dataset for training.
@@ -217,18 +242,46 @@ class FastModel:
         self._trainer.train()
 
     def resize_image_pil(self, image, max_size=1100):
-        """Resizes a PIL image while maintaining aspect ratio.
+        """Resizes an image while maintaining aspect ratio, results are cached by content hash.
 
         Args:
-            image (PIL.Image): The input image.
+            image (PIL.Image | str | bytes | Future): The input image, a path, encoded bytes or a prefetch_image() result.
             max_size (int, optional): The maximum size for the image's width or height. Defaults to 1100.
 
         Returns:
             PIL.Image: The resized image.
         """
-        img_copy = image.copy()
-        img_copy.thumbnail((max_size, max_size))
-        return img_copy
+        return self.image_preprocessor.get(image, max_size)
+
+    def prefetch_image(self, image, max_images_size=1000):
+        """Starts decoding/resizing an image on the preprocessing thread pool, e.g. while another request generates.
+
+        Args:
+            image (PIL.Image | str | bytes): The input image, a path or encoded bytes.
+            max_images_size (int, optional): Maximum size for image resizing. Defaults to 1000.
+
+        Returns:
+            Future: Pass it as the image argument of generate().
+        """
+        return self.image_preprocessor.submit(image, max_images_size)
+
+    def start_batch_server(self, max_batch_size=8):
+        """Routes text-only generate() calls through a continuous batching scheduler, so concurrent calls share
+        decode steps. Prompts with an image still run model.generate.
+
+        Args:
+            max_batch_size (int, optional): Maximum number of sequences decoded together. Defaults to 8.
+
+        Returns:
+            ContinuousBatchingServer: The running scheduler.
+        """
+        _FastModel.for_inference(self.model)
+        if self.batch_server is None:
+            tokenizer = getattr(self.processor, "tokenizer", self.processor)
+            self.batch_server = ContinuousBatchingServer(
+                self.model, max_batch_size=max_batch_size, pad_token_id=tokenizer.pad_token_id or 0
+            )
+        return self.batch_server.start()
 
     def generate(
         self,
@@ -241,13 +294,18 @@ class FastModel:
         top_p=0.9,
         max_images_size=1000,
         end: list[str] = None,
+        session_id: str = "default",
+        coalesce_chars: int = 0,
+        coalesce_ms: float = 0,
+        return_stats: bool = False,
         **kwargs
     ):
         """Generates text based on a prompt and optional image.
 
         Args:
             text (str, optional): The text prompt. Defaults to "".
-            image (PIL.Image, optional): An optional image. Defaults to None.
+            image (PIL.Image | str | bytes | Future, optional): An optional image, path, encoded bytes or
+                prefetch_image() result. Defaults to None.
             max_new_tokens (int, optional): Maximum number of new tokens to generate. Defaults to 512.
             stream (bool, optional): Whether to stream the output. Defaults to False.
             history_save (bool, optional): Whether to save the conversation history. Defaults to True.
@@ -255,10 +313,16 @@ class FastModel:
             top_p (float, optional): Top-p sampling. Defaults to 0.9.
             max_images_size (int, optional): Maximum size for image resizing. Defaults to 1000.
             end (list[str], optional): List of end tokens. Defaults to None.
+            session_id (str, optional): Conversation key in self.sessions and self.prefix_cache, used with
+                history_save. Defaults to "default".
+            coalesce_chars (int, optional): Streamed deltas are held back until this many characters are pending. Defaults to 0.
+            coalesce_ms (float, optional): Streamed deltas are held back until this long after the previous one. Defaults to 0.
+            return_stats (bool, optional): Without stream, return (text, StreamStats). Defaults to False.
             **kwargs: Additional keyword arguments for `model.generate`.
 
         Returns:
-            str or generator: The generated text or a generator for streaming output.
+            str or TokenStream: The generated text, or an iterator of text deltas (one per token unless coalesced)
+            whose .stats hold token counts, TTFT and inter-token latency.
         """
         _FastModel.for_inference(self.model)
         if end is None:
@@ -269,16 +333,24 @@ class FastModel:
             messages = {"role": "user", "content": [{"type": "text", "text": text}]}
         else:
             image = self.resize_image_pil(image, max_images_size)
-            self.images_history.append(image)
             messages = {
                 "role": "user",
                 "content": [{"type": "image", "image": image}, {"type": "text", "text": text}],
             }
 
-        self.chat_history.append(messages)
+        if history_save:
+            self.sessions.append(session_id, "user", messages["content"])
+            chat = self.sessions.messages(session_id, parts=True)
+        else:
+            chat = [messages]
+
+        # one streamer per call, concurrent calls must not share it, without stream it only counts tokens
+        streamer = self.streamer = TokenStreamer(self.processor if stream else None)
+
+        def save(text_out):
+            if history_save:
+                self.sessions.append(session_id, "assistant", text_out)
 
-        self.streamer = TextIteratorStreamer(self.processor, skip_prompt=True, skip_special_tokens=True)
-        
         try:
             terminators = [self.processor.tokenizer.eos_token_id] + [
                 self.processor.tokenizer.convert_tokens_to_ids(i) for i in end
@@ -290,14 +362,14 @@ class FastModel:
             
 
         input_ids = self.processor.apply_chat_template(
-            self.chat_history if history_save else [messages],
+            chat,
             add_generation_prompt=True,
             tokenize=True,
             return_dict=True,
             return_tensors="pt",
         ).to(self.model.device)
 
-        # check_image = self.chat_history[-1]["content"] if history_save else messages["content"]
+        # check_image = chat[-1]["content"]
         # if not any(i["type"] == "image" for i in check_image):
         #     input_ids["input_ids"] = torch.tensor([[2] + input_ids["input_ids"].cpu().numpy().tolist()[0]]).to("cuda")
         #     input_ids["attention_mask"] = torch.tensor([[1] + input_ids["attention_mask"].cpu().numpy().tolist()[0]]).to(self.model.device)
@@ -306,57 +378,76 @@ class FastModel:
         #     except:...
                 
 
-        if not history_save and text != "":
-            del self.chat_history[-1]
-
-        if stream:
-            thread = Thread(
-                target=self.model.generate,
-                kwargs={
-                    **input_ids,
-                    "streamer": self.streamer,
-                    "max_new_tokens": max_new_tokens,
-                    "do_sample": True,
-                    "temperature": temperature,
-                    "top_p": top_p,
-                    "eos_token_id": terminators,
-                    **kwargs,
-                },
-            )
-            thread.start()
-
-            def inner():
-                i = 0
-                text_out = ""
-                for new_text in self.streamer:
-                    i += 1
-                    if i != 1:
-                        text_out += new_text
-                        for te in new_text:
-                            yield te
-                if history_save:
-                    self.chat_history.append({"role": "assistant", "content": [{"type": "text", "text": text_out}]})
-
-                thread.join()
-
-            return inner()
-        else:
-            outputs = self.model.generate(
-                **input_ids,
+        # the batch server decodes with 1-D positions, image prompts (mrope, image masks) take the generate() path
+        if self.batch_server is not None and not any(k.startswith("pixel_") for k in input_ids):
+            request = self.batch_server.submit(
+                input_ids["input_ids"],
                 max_new_tokens=max_new_tokens,
-                do_sample=True,
                 temperature=temperature,
                 top_p=top_p,
                 eos_token_id=terminators,
-                **kwargs
             )
+            if stream:
+                return TokenStream(
+                    request.text_stream(self.processor), request.stats, coalesce_chars, coalesce_ms,
+                    on_close=save, cancel=request.cancel,
+                )
+            text_out = request.result(self.processor)
+            save(text_out)
+            return (text_out, request.stats) if return_stats else text_out
+
+        cache_session = session_id if history_save else None
+        generate_params = {
+            "max_new_tokens": max_new_tokens,
+            "do_sample": True,
+            "temperature": temperature,
+            "top_p": top_p,
+            "eos_token_id": terminators,
+            **kwargs,
+        }
+        if stream:
+            deltas = start_generation(self._generate, streamer, input_ids, cache_session, **generate_params)
+            return TokenStream(
+                deltas, streamer.stats, coalesce_chars, coalesce_ms, on_close=save, cancel=streamer.cancel
+            )
+        else:
+            outputs = self._generate(input_ids, cache_session, streamer=streamer, **generate_params)
 
             response = outputs[0][input_ids["input_ids"].shape[-1]:]
             text_out = self.processor.decode(response, skip_special_tokens=True)
-            if history_save:
-                self.chat_history.append({"role": "assistant", "content": [{"type": "text", "text": text_out}]})
+            save(text_out)
+            return (text_out, streamer.stats) if return_stats else text_out
+
+    def _generate(self, model_inputs, session_id=None, **kwargs):
+        """Runs model.generate, continuing from the session's cached prefix when session_id is given.
+
+        Args:
+            model_inputs (dict): Processor outputs (input_ids, attention_mask, pixel_values, ...).
+            session_id (str, optional): Prefix cache key. Defaults to None.
+            **kwargs: Additional keyword arguments for `model.generate`.
 
-            return text_out
+        Returns:
+            torch.Tensor: The generated sequences, prompt included.
+        """
+        if session_id is None:
+            return self.model.generate(**model_inputs, **kwargs)
+
+        # pixel values are only consumed at the first prefill position, so every image token must be in the reused prefix
+        input_ids = model_inputs["input_ids"]
+        image_token_id = getattr(self.model.config, "image_token_id", getattr(self.model.config, "image_token_index", None))
+        image_positions = (input_ids[0] == image_token_id).nonzero() if image_token_id is not None else []
+        min_prefix = int(image_positions[-1]) + 1 if len(image_positions) else 1
+
+        past_key_values = self.prefix_cache.take(session_id, input_ids, min_prefix=min_prefix)
+        if len(image_positions) and past_key_values.get_seq_length() >= min_prefix:
+            # every image is already in the cached key/values, skip the vision tower; inputs aligned with the
+            # images or the full prompt (grid sizes, token types) would not match the cropped suffix either
+            model_inputs = {k: v for k, v in model_inputs.items() if not k.startswith(_IMAGE_INPUTS)}
+        outputs = self.model.generate(
+            **model_inputs, past_key_values=past_key_values, return_dict_in_generate=True, **kwargs
+        )
+        self.prefix_cache.put(session_id, outputs.sequences[0], outputs.past_key_values)
+        return outputs.sequences
 
     def export_to_GGUF(
         self,
@@ -1,14 +1,15 @@
 import warnings
 from unsloth import FastVisionModel,UnslothVisionDataCollator
-from transformers import TrainingArguments, TextIteratorStreamer
+from transformers import TrainingArguments
 from unsloth_zoo.vision_utils import process_vision_info, get_padding_tokens_ids, _get_dtype
 import torch
 import json
 from unsloth import is_bf16_supported
 from trl import SFTTrainer, SFTConfig
-from threading import Thread
 from PIL import Image
 from datasets import load_dataset
+from .image_cache import ImagePreprocessor
+from ..streaming import TokenStream, TokenStreamer, start_generation
 
 
 warnings.simplefilter("ignore", SyntaxWarning)
@@ -29,6 +30,7 @@ class FastVLLM:
         self.load_in_4bit = False
         self.load_in_8bit = False
         self.streamer = None
+        self.image_preprocessor = ImagePreprocessor()
 
     def load_model(self, model_name, dtype=None, load_in_4bit=False, load_in_8bit=False, **kwargs):
         """Loads the FastVisionModel and its processor."""
@@ -41,6 +43,7 @@ class FastVLLM:
         )
         self.load_in_4bit = load_in_4bit
         self.load_in_8bit = load_in_8bit
+        self.image_preprocessor.wrap_processor(self.processor)
 
     def load_dataset(self, dataset):
         """Loads and sets the dataset for training."""
@@ -160,10 +163,12 @@ class FastVLLM:
         self._trainer.train()
 
     def resize_image_pil(self, image, max_size=1100):
-        """Resizes an image using PIL."""
-        img_copy = image.copy()
-        img_copy.thumbnail((max_size, max_size))
-        return img_copy
+        """Resizes an image (PIL, path, bytes or prefetch_image() Future), cached by content hash."""
+        return self.image_preprocessor.get(image, max_size)
+
+    def prefetch_image(self, image, max_images_size=1000):
+        """Starts decoding/resizing an image in the background, pass the returned Future as images to generate()."""
+        return self.image_preprocessor.submit(image, max_images_size)
 
     def generate(
         self,
@@ -178,9 +183,14 @@ class FastVLLM:
         end=None,
         add_images_to_model_history=False,
         max_images_size=1000,
+        coalesce_chars=0,
+        coalesce_ms=0,
+        return_stats=False,
         **kwargs
     ):
-        """Generates text based on the given input and model."""
+        """Generates text based on the given input and model. With stream=True a TokenStream of text deltas
+        is returned, one per token unless coalesce_chars / coalesce_ms group them, with token counts and
+        TTFT / inter-token latency in .stats. Without stream, return_stats=True returns (text, StreamStats)."""
         if end is None:
             end = [self.processor.tokenizer.eos_token]
 
@@ -206,9 +216,7 @@ class FastVLLM:
             else:
                 imagess = []
 
-        self.streamer = TextIteratorStreamer(
-            self.processor, skip_prompt=True, skip_special_tokens=True, do_sample=True, temperature=temperature, top_p=top_p
-        )
+        self.streamer = TokenStreamer(self.processor if stream else None)
         if apply_chat_template:
             input_text = self.processor.apply_chat_template(chat, add_generation_prompt=True)
             input_ids = self.processor(
@@ -225,39 +233,29 @@ class FastVLLM:
             self.processor.tokenizer.convert_tokens_to_ids(i) for i in end
         ]
         if stream:
-            thread = Thread(
-                target=self.model.generate,
-                kwargs={
-                    **input_ids,
-                    "streamer": self.streamer,
-                    "max_new_tokens": max_new_tokens,
-                    "eos_token_id": terminators,
-                    "do_sample": True,
-                    "temperature": temperature,
-                    "top_p": top_p,
-                    **kwargs,
-                },
+            deltas = start_generation(
+                self.model.generate,
+                self.streamer,
+                **input_ids,
+                max_new_tokens=max_new_tokens,
+                eos_token_id=terminators,
+                do_sample=True,
+                temperature=temperature,
+                top_p=top_p,
+                **kwargs,
             )
-            thread.start()
-
-            def inner():
-                i = 0
-                text_out = ""
-                for new_text in self.streamer:
-                    i += 1
-                    if i != 1:
-                        text_out += new_text
-                        for te in new_text:
-                            yield te
+
+            def save(text_out):
                 if history_save:
                     self.chat_history.append({"role": "assistant", "content": [{"type": "text", "text": text_out}]})
 
-                thread.join()
-
-            return inner()
+            return TokenStream(
+                deltas, self.streamer.stats, coalesce_chars, coalesce_ms, on_close=save, cancel=self.streamer.cancel
+            )
         else:
             outputs = self.model.generate(
                 **input_ids,
+                streamer=self.streamer,
                 max_new_tokens=max_new_tokens,
                 eos_token_id=terminators,
                 do_sample=True,
@@ -270,7 +268,7 @@ class FastVLLM:
             if history_save:
                 self.chat_history.append({"role": "assistant", "content": [{"type": "text", "text": text_out}]})
 
-            return text_out
+            return (text_out, self.streamer.stats) if return_stats else text_out
 
 
 if __name__ == "__main__":
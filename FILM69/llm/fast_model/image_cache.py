@@ -0,0 +1,210 @@
+import copy
+import hashlib
+import io
+import os
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Lock
+
+import numpy as np
+import torch
+from PIL import Image
+
+
+def image_hash(image):
+    """Content hash of a PIL image, remembered on images produced by ImagePreprocessor."""
+    key = getattr(image, "_film69_hash", None)
+    if key is None:
+        md5 = hashlib.md5(f"{image.mode}{image.size}".encode("utf-8"))
+        md5.update(image.tobytes())
+        key = md5.hexdigest()
+    return key
+
+
+class _LRU:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+
+class CachedImageProcessor:
+    """
+    Wraps a processor's image_processor and caches its output per image content hash, so images that
+    stay in the chat history are not resized and normalised again on every turn. Outputs are computed
+    one image at a time and concatenated, inputs it cannot split (several samples) go to the wrapped processor.
+
+    Processors stack the images of a sample on dim 0 (Gemma3, Qwen2-VL) or dim 1 (Mllama): the first
+    multi-image call (per input form, flat or nested) is also run unsplit, and the axis whose merge reproduces
+    that output is kept. Processors matching neither always get the unsplit input.
+    """
+
+    def __init__(self, image_processor, max_entries=256):
+        self.image_processor = image_processor
+        self.cache = _LRU(max_entries)
+        self.hits = 0
+        self.misses = 0
+        self.axes = {}  # nested -> 0, 1 or False (never merged), learned on the first multi-image call
+
+    def __getattr__(self, name):
+        return getattr(self.__dict__["image_processor"], name)
+
+    def __call__(self, images=None, *args, **kwargs):
+        leaves, nested = self._leaves(images)
+        axis = self.axes.get(nested)
+        if not leaves or (len(leaves) > 1 and axis is False):
+            return self.image_processor(images, *args, **kwargs)
+        settings = repr((args, sorted(kwargs.items(), key=lambda item: item[0])))
+
+        outputs = []
+        for image in leaves:
+            key = (image_hash(image), settings)
+            output = self.cache.get(key)
+            if output is None:
+                self.misses += 1
+                output = self.image_processor([[image]] if nested else [image], *args, **kwargs)
+                self.cache.put(key, output)
+            else:
+                self.hits += 1
+            outputs.append(output)
+        if len(outputs) == 1:
+            return copy.copy(outputs[0])  # processors pop/move entries of what they get back
+        if axis is None:
+            return self._learn_axis(outputs, nested, self.image_processor(images, *args, **kwargs))
+        try:
+            return self._merge(outputs, nested, axis)
+        except (TypeError, ValueError, RuntimeError, IndexError):
+            return self.image_processor(images, *args, **kwargs)
+
+    def _learn_axis(self, outputs, nested, reference):
+        self.axes[nested] = False
+        for axis in (0, 1):
+            try:
+                if self._same(self._merge(outputs, nested, axis), reference):
+                    self.axes[nested] = axis
+                    break
+            except (TypeError, ValueError, RuntimeError, IndexError):
+                pass
+        return reference
+
+    @staticmethod
+    def _same(merged, reference):
+        if list(merged.keys()) != list(reference.keys()):
+            return False
+        for name in reference.keys():
+            a, b = merged[name], reference[name]
+            if isinstance(b, torch.Tensor):
+                if not isinstance(a, torch.Tensor) or a.shape != b.shape or not torch.allclose(a.float(), b.float(), atol=1e-4):
+                    return False
+            elif isinstance(b, np.ndarray):
+                if not isinstance(a, np.ndarray) or a.shape != b.shape or not np.allclose(a, b, atol=1e-4):
+                    return False
+            elif a != b:
+                return False
+        return True
+
+    @staticmethod
+    def _leaves(images):
+        # one image, a flat list, or one sample's nested list, anything else is not split
+        if isinstance(images, Image.Image):
+            return [images], False
+        if isinstance(images, (list, tuple)) and images:
+            if all(isinstance(image, Image.Image) for image in images):
+                return list(images), False
+            if len(images) == 1 and isinstance(images[0], (list, tuple)) and images[0]:
+                if all(isinstance(image, Image.Image) for image in images[0]):
+                    return list(images[0]), True
+        return [], False
+
+    @staticmethod
+    def _merge(outputs, nested, axis=0):
+        merged = outputs[0].__class__()
+        for name in outputs[0].keys():
+            values = [output[name] for output in outputs]
+            if all(isinstance(value, torch.Tensor) for value in values):
+                merged[name] = torch.cat(values, dim=axis)
+            elif all(isinstance(value, np.ndarray) for value in values):
+                merged[name] = np.concatenate(values, axis=axis)
+            elif all(isinstance(value, list) for value in values):
+                if nested and all(len(value) == 1 and isinstance(value[0], list) for value in values):
+                    merged[name] = [[item for value in values for item in value[0]]]
+                else:
+                    merged[name] = [item for value in values for item in value]
+            else:
+                raise TypeError(f"Cannot merge image processor output {name}")
+        return merged
+
+
+class ImagePreprocessor:
+    """
+    Decodes and resizes prompt images on a thread pool, with an LRU cache keyed by content hash.
+    Submit the next image while the current request is still generating, pass the Future to generate().
+
+    Args:
+        max_workers (int): Decode/resize threads.
+        max_entries (int): Resized images of encoded inputs, and processor outputs per wrapped processor, kept in memory.
+    """
+
+    def __init__(self, max_workers=4, max_entries=256):
+        self.max_entries = max_entries
+        self.cache = _LRU(max_entries)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="film69-image")
+
+    @staticmethod
+    def _thumbnail(image, max_size):
+        resized = image.copy()
+        resized.thumbnail((max_size, max_size))
+        resized._film69_hash = image_hash(resized)
+        return resized
+
+    def _resize(self, image, max_size):
+        if isinstance(image, Image.Image):
+            # hashing a full size PIL image costs about as much as resizing it, only encoded inputs are cached
+            return self._thumbnail(image, max_size)
+        if isinstance(image, (str, os.PathLike)):
+            with open(image, "rb") as f:
+                image = f.read()
+        if not isinstance(image, (bytes, bytearray)):
+            raise TypeError(f"Unsupported image type {type(image).__name__}")
+
+        key = (hashlib.md5(image).hexdigest(), max_size)
+        resized = self.cache.get(key)
+        if resized is None:
+            decoded = Image.open(io.BytesIO(image))
+            decoded.load()
+            resized = self._thumbnail(decoded, max_size)
+            self.cache.put(key, resized)
+        return resized
+
+    def submit(self, image, max_size=1000):
+        """Starts decoding/resizing in the background, returns a Future of the resized PIL image."""
+        return self._pool.submit(self._resize, image, max_size)
+
+    def get(self, image, max_size=1000):
+        """Resized PIL image of a PIL image, path, encoded bytes or a Future from submit()."""
+        if isinstance(image, Future):
+            return image.result()
+        return self.submit(image, max_size).result()
+
+    def wrap_processor(self, processor):
+        """Installs a CachedImageProcessor on processor (or returns the one already installed)."""
+        image_processor = getattr(processor, "image_processor", None)
+        if image_processor is None or isinstance(image_processor, CachedImageProcessor):
+            return image_processor
+        cached = CachedImageProcessor(image_processor, max_entries=self.max_entries)
+        processor.image_processor = cached
+        return cached
@@ -0,0 +1,228 @@
+import argparse
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import tee
+from operator import itemgetter
+
+TEXT_EXTENSIONS = (".txt", ".md", ".markdown", ".rst", ".pdf")
+
+# preferred cut points, best first: before a markdown heading, paragraph, line, sentence, word
+_SEPARATORS = ("\n#", "\n\n", "\n", ". ", " ")
+
+
+def chunk_text(text, chunk_size=1000, overlap=200):
+    """
+    Splits text into chunks of at most chunk_size characters, consecutive chunks sharing about overlap
+    characters. Chunks end at a heading, paragraph, line, sentence or word boundary when one lies in the second
+    half of the window.
+    """
+    text = text.strip()
+    if len(text) <= chunk_size:
+        return [text] if text else []
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + chunk_size, len(text))
+        if end < len(text):
+            for separator in _SEPARATORS:
+                cut = text.rfind(separator, start + chunk_size // 2, end)
+                if cut != -1:
+                    end = cut + (1 if separator[0] == "\n" else len(separator))
+                    break
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= len(text):
+            break
+        next_start = max(end - overlap, start + 1)
+        # begin the overlap on a word
+        space = text.find(" ", next_start, end)
+        start = space + 1 if overlap and space != -1 else next_start
+    return chunks
+
+
+def read_text(path, data=None):
+    """Text of a file, PDF text pages via pypdf."""
+    if data is None:
+        with open(path, "rb") as f:
+            data = f.read()
+    if path.lower().endswith(".pdf"):
+        from pypdf import PdfReader
+
+        return "\n\n".join(page.extract_text() or "" for page in PdfReader(io.BytesIO(data)).pages)
+    return data.decode("utf-8", errors="replace")
+
+
+def chunk_ids(source, chunks):
+    """Ids derived from the source and the chunk text, so unchanged chunks of an edited file keep their id."""
+    seen = {}
+    ids = []
+    for chunk in chunks:
+        n = seen[chunk] = seen.get(chunk, -1) + 1
+        ids.append(hashlib.sha256(f"{source}\0{n}\0{chunk}".encode("utf-8")).hexdigest()[:32])
+    return ids
+
+
+def _process_file(job):
+    # runs in a worker process
+    path, source, chunk_size, overlap = job
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        file_hash = hashlib.sha256(data).hexdigest()
+        chunks = chunk_text(read_text(path, data), chunk_size, overlap)
+        return source, file_hash, chunks, chunk_ids(source, chunks), None
+    except Exception as e:
+        return source, None, None, None, repr(e)
+
+
+class Indexer:
+    """
+    Keeps a VectorDB collection in sync with a directory of text, markdown and PDF files. A manifest maps each
+    file to its hash and chunk ids: unchanged files (same size and mtime, or same hash) are skipped, changed
+    files are re-chunked in a process pool and only their new chunks are embedded, chunks and files that are
+    gone are deleted from the collection.
+
+    Args:
+        db (VectorDB): Target collection, written through db.ingest and db.delete.
+        manifest_path (str): JSON manifest of the last sync.
+        chunk_size (int): Characters per chunk.
+        overlap (int): Characters shared by consecutive chunks.
+        extensions (Tuple[str]): File types indexed.
+        workers (int | None): Chunking processes, None for one per CPU, 0 to chunk in this process. Workers are
+            spawned, so a script calling sync needs an if __name__ == "__main__" guard.
+        batch_size (int): Documents per upsert, see VectorDB.ingest.
+        encode_batch_size (int): Batch size of the embedding model.
+    """
+
+    def __init__(self, db, manifest_path="index_manifest.json", chunk_size=1000, overlap=200, extensions=TEXT_EXTENSIONS,
+                 workers=None, batch_size=1024, encode_batch_size=64):
+        self.db = db
+        self.manifest_path = manifest_path
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.extensions = tuple(e.lower() for e in extensions)
+        self.workers = workers
+        self.batch_size = batch_size
+        self.encode_batch_size = encode_batch_size
+
+    def load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return {"files": {}}
+        with open(self.manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("chunk_size") != self.chunk_size or manifest.get("overlap") != self.overlap:
+            # other chunking, every file gets new chunks; keep the ids to delete the old ones
+            for entry in manifest["files"].values():
+                entry["hash"] = entry["mtime_ns"] = entry["size"] = None
+        return manifest
+
+    def save_manifest(self, manifest):
+        manifest.update(chunk_size=self.chunk_size, overlap=self.overlap, updated=time.time())
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(tmp, self.manifest_path)
+
+    def scan(self, root):
+        """(path, source, stat) of the indexed files under root, source being the path relative to root."""
+        for directory, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if filename.lower().endswith(self.extensions):
+                    path = os.path.join(directory, filename)
+                    yield path, os.path.relpath(path, root).replace(os.sep, "/"), os.stat(path)
+
+    def _map(self, jobs):
+        if self.workers == 0:
+            yield from map(_process_file, jobs)
+            return
+        # spawned, not forked: this runs on ingest's embedding thread, in a process already holding torch and Chroma threads
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            yield from pool.map(_process_file, jobs, chunksize=16)
+
+    def sync(self, root):
+        """
+        Brings the collection in line with the files under root.
+
+        Returns:
+            dict: files, unchanged, changed, removed, errors, chunks_added, chunks_deleted and seconds.
+        """
+        start = time.perf_counter()
+        manifest = self.load_manifest()
+        files = manifest["files"]
+        stats = {"files": 0, "unchanged": 0, "changed": 0, "removed": 0, "errors": {}, "chunks_added": 0, "chunks_deleted": 0}
+
+        jobs, stat_of, seen = [], {}, set()
+        for path, source, stat in self.scan(root):
+            stats["files"] += 1
+            seen.add(source)
+            entry = files.get(source)
+            if entry and entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+                stats["unchanged"] += 1
+                continue
+            stat_of[source] = stat
+            jobs.append((path, source, self.chunk_size, self.overlap))
+
+        stale = []
+        for source in [source for source in files if source not in seen]:
+            stale += files.pop(source)["chunks"]
+            stats["removed"] += 1
+
+        def pending():
+            # chunks of changed files not stored yet, the manifest is updated as files come back from the workers
+            for source, file_hash, chunks, ids, error in self._map(jobs):
+                if error is not None:
+                    stats["errors"][source] = error
+                    continue
+                stat = stat_of[source]
+                entry = files.get(source)
+                old = set(entry["chunks"]) if entry else set()
+                files[source] = {"hash": file_hash, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "chunks": ids}
+                if entry and entry["hash"] == file_hash:
+                    stats["unchanged"] += 1
+                    continue
+                stats["changed"] += 1
+                new = set(ids)
+                stale.extend(old - new)
+                for chunk, id_ in zip(chunks, ids):
+                    if id_ not in old:
+                        stats["chunks_added"] += 1
+                        yield chunk, id_, {"source": source}
+
+        documents, ids, metadatas = (map(itemgetter(i), rows) for i, rows in enumerate(tee(pending(), 3)))
+        # dedup: chunks stored by an interrupted run are not embedded again
+        self.db.ingest(documents, ids=ids, metadatas=metadatas, batch_size=self.batch_size,
+                       encode_batch_size=self.encode_batch_size, dedup=True)
+
+        for i in range(0, len(stale), self.batch_size):
+            self.db.delete(ids=stale[i : i + self.batch_size])
+        stats["chunks_deleted"] = len(stale)
+        self.save_manifest(manifest)
+        stats["seconds"] = time.perf_counter() - start
+        return stats
+
+
+if __name__ == "__main__":
+    from FILM69.llm.vectordb import VectorDB
+
+    parser = argparse.ArgumentParser(description="Incrementally index a directory into a VectorDB collection")
+    parser.add_argument("root")
+    parser.add_argument("--path", default="database")
+    parser.add_argument("--collection_name", default="data")
+    parser.add_argument("--embedding_name", default="sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
+    parser.add_argument("--manifest", default=None, help="Default: <path>/<collection_name>.manifest.json")
+    parser.add_argument("--chunk_size", type=int, default=1000)
+    parser.add_argument("--overlap", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    db = VectorDB(path=args.path, collection_name=args.collection_name, embedding_name=args.embedding_name)
+    manifest = args.manifest or os.path.join(args.path, f"{args.collection_name}.manifest.json")
+    indexer = Indexer(db, manifest, chunk_size=args.chunk_size, overlap=args.overlap, workers=args.workers)
+    print(indexer.sync(args.root))
@@ -0,0 +1,145 @@
+import math
+import re
+from collections import Counter
+from threading import Lock
+
+try:
+    from pythainlp.tokenize import word_tokenize as _thai_word_tokenize
+except ImportError:
+    _thai_word_tokenize = None
+
+# Thai runs, and non-Thai letter/digit runs where "-", "_", "." and "/" inside a run keep product codes (AB-12/3)
+# whole; Thai is excluded from \w so a code glued to Thai text ("รุ่นAB-123ราคา") stays a term of its own
+_TOKEN = re.compile(r"[\u0E00-\u0E7F]+|[^\W_\u0E00-\u0E7F](?:(?:[^\W\u0E00-\u0E7F]|[\-./])*[^\W_\u0E00-\u0E7F])?")
+_THAI = re.compile(r"[\u0E00-\u0E7F]")
+# a Thai character with the vowel and tone marks written above or below it
+_THAI_CLUSTER = re.compile(r"[\u0E00-\u0E7F][\u0E31\u0E34-\u0E3A\u0E47-\u0E4E]*")
+_PARTS = re.compile(r"[^\W_\u0E00-\u0E7F]+")
+
+
+def tokenize(text):
+    """
+    Lowercased terms of text. Thai, written without spaces, is split into words with pythainlp when it is
+    installed, otherwise into bigrams of characters, each kept with its vowel and tone marks. Codes such as
+    "AB-123" give the whole code plus its parts.
+    """
+    terms = []
+    for run in _TOKEN.findall(text.lower()):
+        if _THAI.match(run):
+            if _thai_word_tokenize is not None:
+                terms += [word for word in _thai_word_tokenize(run, keep_whitespace=False) if word.strip()]
+            else:
+                clusters = _THAI_CLUSTER.findall(run)
+                if len(clusters) < 3:
+                    terms.append(run)
+                else:
+                    terms += [clusters[i] + clusters[i + 1] for i in range(len(clusters) - 1)]
+        else:
+            terms.append(run)
+            parts = _PARTS.findall(run)
+            if len(parts) > 1:
+                terms += parts
+    return terms
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """
+    Fuses ranked id lists: each id scores sum(1 / (k + rank)) over the lists it appears in.
+
+    Returns:
+        List[Tuple[str, float]]: (id, score), best first.
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, id_ in enumerate(ranking, start=1):
+            scores[id_] = scores.get(id_, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class BM25Index:
+    """
+    In-memory inverted index with Okapi BM25 scoring, updated per document id.
+
+    Args:
+        k1 (float): Term frequency saturation.
+        b (float): Document length normalisation.
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings = {}  # term -> {id: term frequency}
+        self._lengths = {}  # id -> number of terms
+        self._terms = {}  # id -> distinct terms, to remove a document
+        self._total_length = 0
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._lengths)
+
+    def __contains__(self, id_):
+        return id_ in self._lengths
+
+    def add(self, ids, documents):
+        """Indexes documents, replacing the ones already indexed under the same ids."""
+        with self._lock:
+            for id_, document in zip(ids, documents):
+                self._remove(id_)
+                if document is None:
+                    continue
+                counts = Counter(tokenize(document))
+                for term, count in counts.items():
+                    self._postings.setdefault(term, {})[id_] = count
+                length = sum(counts.values())
+                self._lengths[id_] = length
+                self._terms[id_] = list(counts)
+                self._total_length += length
+
+    def remove(self, ids):
+        with self._lock:
+            for id_ in ids:
+                self._remove(id_)
+
+    def _remove(self, id_):
+        terms = self._terms.pop(id_, None)
+        if terms is None:
+            return
+        self._total_length -= self._lengths.pop(id_)
+        for term in terms:
+            postings = self._postings[term]
+            del postings[id_]
+            if not postings:
+                del self._postings[term]
+
+    def clear(self):
+        with self._lock:
+            self._postings.clear()
+            self._lengths.clear()
+            self._terms.clear()
+            self._total_length = 0
+
+    def search(self, query, n_results=10, ids=None):
+        """
+        Best n_results documents for query, optionally restricted to ids.
+
+        Returns:
+            List[Tuple[str, float]]: (id, score), best first, documents sharing no term are left out.
+        """
+        allowed = set(ids) if ids is not None else None
+        with self._lock:
+            n = len(self._lengths)
+            if not n:
+                return []
+            average = self._total_length / n
+            scores = {}
+            for term, query_count in Counter(tokenize(query)).items():
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for id_, count in postings.items():
+                    if allowed is not None and id_ not in allowed:
+                        continue
+                    norm = count + self.k1 * (1 - self.b + self.b * self._lengths[id_] / average)
+                    scores[id_] = scores.get(id_, 0.0) + query_count * idf * count * (self.k1 + 1) / norm
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:n_results]
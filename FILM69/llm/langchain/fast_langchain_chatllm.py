@@ -54,8 +54,8 @@ from ollama import AsyncClient, Client, Message, Options
 from pydantic import BaseModel, PrivateAttr, model_validator
 from pydantic.json_schema import JsonSchemaValue
 from typing_extensions import Self, is_typeddict
-# from ..fast_model.auto_model import FastAutoModel
-from fast_langchain_llm import FastLangchainLLM
+from .fast_langchain_llm import FastLangchainLLM
+from FILM69.llm.metrics import record_generation
 from PIL import Image
 import base64
 from io import BytesIO
@@ -235,21 +235,21 @@ class LangChainFastChat(BaseChatModel):
     ) -> ChatResult:
         text=messages[-1].content
         print(text)
-        tokens = self.model_llm.invoke(text,max_new_tokens=max_new_tokens,max_images_size=max_images_size)
+        tokens,stats = self.model_llm.generate_with_stats(text,max_new_tokens=max_new_tokens,max_image_size=max_images_size)
         
-        ct_input_tokens = sum(len(message.content) for message in messages)
-        ct_output_tokens = len(tokens)
         message = AIMessage(
             content=tokens,
             additional_kwargs={},
             response_metadata={
-                "time_in_seconds": 3,
-            },
-            usage_metadata={
-                "input_tokens": ct_input_tokens,
-                "output_tokens": ct_output_tokens,
-                "total_tokens": ct_input_tokens + ct_output_tokens,
+                "model_name": self.model_name,
+                "time_in_seconds": stats.total_seconds,
+                **stats.as_dict(),
             },
+            usage_metadata=UsageMetadata(
+                input_tokens=stats.prompt_tokens,
+                output_tokens=stats.completion_tokens,
+                total_tokens=stats.prompt_tokens + stats.completion_tokens,
+            ),
         )
 
         generation = ChatGeneration(message=message)
@@ -266,32 +266,46 @@ class LangChainFastChat(BaseChatModel):
     ) -> Iterator[ChatGenerationChunk]:
         text=messages[-1].content
         
-        tokens = self.model_llm.stream(text,max_new_tokens=max_new_tokens,max_images_size=max_images_size)
-    
-        ct_input_tokens = sum(len(message.content) for message in messages)
-        for token in tokens:
-            usage_metadata = UsageMetadata(
-                {
-                    "input_tokens": ct_input_tokens,
-                    "output_tokens": 1,
-                    "total_tokens": ct_input_tokens + 1,
-                }
-            )
-            ct_input_tokens = 0
-            chunk = ChatGenerationChunk(
-                message=AIMessageChunk(content=token, usage_metadata=usage_metadata)
-            )
+        tokens = self.model_llm.stream_tokens(text,max_new_tokens=max_new_tokens,max_image_size=max_images_size)
+
+        # one chunk per text delta, usage counts the tokens the model produced since the previous chunk
+        input_tokens, output_tokens = 0, 0
+        try:
+            for token in tokens:
+                stats = tokens.stats
+                usage_metadata = UsageMetadata(
+                    input_tokens=stats.prompt_tokens - input_tokens,
+                    output_tokens=stats.completion_tokens - output_tokens,
+                    total_tokens=stats.prompt_tokens - input_tokens + stats.completion_tokens - output_tokens,
+                )
+                input_tokens, output_tokens = stats.prompt_tokens, stats.completion_tokens
+                chunk = ChatGenerationChunk(
+                    message=AIMessageChunk(content=token, usage_metadata=usage_metadata)
+                )
 
-            if run_manager:
-                run_manager.on_llm_new_token(token, chunk=chunk)
+                if run_manager:
+                    run_manager.on_llm_new_token(token, chunk=chunk)
 
-            yield chunk
+                yield chunk
+        finally:
+            tokens.close()
+            record_generation(tokens.stats, self.model_name)
 
+        stats = tokens.stats
+        usage_metadata = UsageMetadata(
+            input_tokens=stats.prompt_tokens - input_tokens,
+            output_tokens=stats.completion_tokens - output_tokens,
+            total_tokens=stats.prompt_tokens - input_tokens + stats.completion_tokens - output_tokens,
+        )
         chunk = ChatGenerationChunk(
-            message=AIMessageChunk(content="", response_metadata={"time_in_sec": 3})
+            message=AIMessageChunk(
+                content="",
+                usage_metadata=usage_metadata,
+                response_metadata={"model_name": self.model_name, "time_in_seconds": stats.total_seconds, **stats.as_dict()},
+            )
         )
         if run_manager:
-            run_manager.on_llm_new_token(token, chunk=chunk)
+            run_manager.on_llm_new_token("", chunk=chunk)
         yield chunk
 
     @property
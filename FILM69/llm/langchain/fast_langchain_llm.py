@@ -2,8 +2,9 @@ from typing import Any, Dict, Iterator, List, Mapping, Optional
 
 from langchain_core.callbacks.manager import CallbackManagerForLLMRun
 from langchain_core.language_models.llms import LLM
-from langchain_core.outputs import GenerationChunk
+from langchain_core.outputs import Generation, GenerationChunk, LLMResult
 from FILM69.llm import FastAutoModel
+from FILM69.llm.metrics import record_generation
 from PIL import Image
 import base64
 from io import BytesIO
@@ -38,11 +39,13 @@ class FastLangchainLLM(LLM):
     format_message:list=[]
     images:list=[]
     model_type:Literal["text","image"]="text"
+    coalesce_chars:int=0
+    coalesce_ms:float=0
     
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        del kwargs["model_name"]
-        kwargs_model=kwargs
+        # fields of this adapter are not load_model options
+        kwargs_model={k:v for k,v in kwargs.items() if k not in ("model_name","model_type","coalesce_chars","coalesce_ms")}
         self.model_llm=FastAutoModel(model_name=self.model_name,**kwargs_model)
     
     def base64_to_pil_image(self,base64_str):
@@ -80,6 +83,22 @@ class FastLangchainLLM(LLM):
             self.format_message.append({'role': _type,'content':content})
             
     
+    def generate_with_stats(self,prompt:str,max_new_tokens=8092,max_image_size=1000,image=None):
+        """(text, StreamStats) of one non-streamed generation, the stats are also added to the metrics registry."""
+        _kwargs={
+            "history_save":False,
+            "stream":False,
+            "max_new_tokens":max_new_tokens,
+            "return_stats":True,
+        }
+        if self.model_type=="image":
+            _kwargs["max_images_size"]=max_image_size
+            _kwargs["images"]= image
+        
+        text,stats = self.model_llm.generate(prompt,**_kwargs)
+        record_generation(stats,self.model_name)
+        return text,stats
+
     def _call(
        self,
         prompt:str,
@@ -90,19 +109,25 @@ class FastLangchainLLM(LLM):
         image=None,
         **kwargs: Any,
     ) -> str:
-      
-        _kwargs={
-            "history_save":False,
-            "stream":False,
-            "max_new_tokens":max_new_tokens,
-        }
-        if self.model_type=="image":
-            _kwargs["max_images_size"]=max_image_size
-            _kwargs["images"]= image
-        
-        tokens = self.model_llm.generate(prompt,**_kwargs)
-        
-        return tokens
+        return self.generate_with_stats(prompt,max_new_tokens=max_new_tokens,max_image_size=max_image_size,image=image)[0]
+
+    def _generate(
+        self,
+        prompts: List[str],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> LLMResult:
+        generations=[]
+        token_usage={"prompt_tokens":0,"completion_tokens":0,"total_tokens":0}
+        params={k:v for k,v in kwargs.items() if k in ("max_new_tokens","max_image_size","image")}
+        for prompt in prompts:
+            text,stats = self.generate_with_stats(prompt,**params)
+            generations.append([Generation(text=text,generation_info=stats.as_dict())])
+            token_usage["prompt_tokens"]+=stats.prompt_tokens
+            token_usage["completion_tokens"]+=stats.completion_tokens
+            token_usage["total_tokens"]+=stats.prompt_tokens+stats.completion_tokens
+        return LLMResult(generations=generations,llm_output={"token_usage":token_usage,"model_name":self.model_name})
     
 
     def _stream(
@@ -116,23 +141,34 @@ class FastLangchainLLM(LLM):
         **kwargs: Any,
     ) -> Iterator[GenerationChunk]:
 
+        tokens = self.stream_tokens(prompt,max_new_tokens=max_new_tokens,max_image_size=max_image_size,image=image)
+        
+        try:
+            for text in tokens:
+                chunk = GenerationChunk(text=text)
+                if run_manager:
+                    run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+
+                yield chunk
+        finally:
+            tokens.close()
+            record_generation(tokens.stats,self.model_name)
+
+        yield GenerationChunk(text="", generation_info=tokens.stats.as_dict())
+
+    def stream_tokens(self,prompt:str,max_new_tokens=8092,max_image_size=1000,image=None):
+        """TokenStream of the model's text deltas for prompt, token counts and TTFT / inter-token latency in .stats."""
         _kwargs={
             "history_save":False,
             "stream":True,
             "max_new_tokens":max_new_tokens,
+            "coalesce_chars":self.coalesce_chars,
+            "coalesce_ms":self.coalesce_ms,
         }
         if self.model_type=="image":
             _kwargs["max_images_size"]=max_image_size
             _kwargs["images"]=image
-        
-        tokens = self.model_llm.generate(prompt,**_kwargs)
-        
-        for char in tokens:
-            chunk = GenerationChunk(text=char)
-            if run_manager:
-                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
-
-            yield chunk
+        return self.model_llm.generate(prompt,**_kwargs)
 
     @property
     def _identifying_params(self) -> Dict[str, Any]:
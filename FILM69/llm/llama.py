@@ -1,8 +1,9 @@
 from llama_cpp import Llama as Llama_cpp
+from .session import SessionManager
 
 class Llama():
     def __init__(self):
-        self.history=[]
+        self.sessions=SessionManager()
         self.chat_template_model={
             "Llama3":{
                 "before_system":"<|start_header_id|>system<|end_header_id|>\n\n",
@@ -31,6 +32,15 @@ class Llama():
             verbose=verbose,
             **kwargs
         )
+        self.sessions.count_tokens=lambda text:len(self.llm.tokenize(text.encode("utf-8"),add_bos=False))
+
+    @property
+    def history(self):
+        # messages of the "default" session as a list view (append, del, ... edit it), assign a list to replace them
+        return self.sessions.view("default")
+
+    @history.setter
+    def history(self,messages):self.sessions.set_messages("default",messages)
     
     def chat_template(self,message):
         
@@ -62,4 +72,20 @@ class Llama():
         else:
             out=self.llm(text,max_tokens=max_tokens,**kwargs)
             return out["choices"][0]["text"] if not show_all else out
-        
\ No newline at end of file
+
+    def chat(self,text,session_id="default",stream=False,max_tokens=512,**kwargs):
+        """Generates a reply to text in the conversation kept under session_id."""
+        self.sessions.append(session_id,"user",text)
+        out=self.generate(self.sessions.messages(session_id),stream=stream,max_tokens=max_tokens,**kwargs)
+        if stream==True:
+            def inner():
+                text_out=""
+                try:
+                    for new_text in out:
+                        text_out+=new_text
+                        yield new_text
+                finally:
+                    self.sessions.append(session_id,"assistant",text_out)
+            return inner()
+        self.sessions.append(session_id,"assistant",out)
+        return out
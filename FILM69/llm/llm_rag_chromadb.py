@@ -1,6 +1,10 @@
 
+import json
 from openai import OpenAI
 from .vectordb import VectorDB
+from .semantic_cache import SemanticCache, replay
+from .keyword_index import tokenize
+from .context_packer import ContextPacker
 
 class LlmRagChromadb(VectorDB):
     def __init__(self,
@@ -10,9 +14,36 @@ class LlmRagChromadb(VectorDB):
             model:str ="typhoon-v1.5-instruct",
             local:bool=False,
             api_key:str=None,
+            answer_cache:bool=False,
+            cache_threshold:float=0.95,
+            cache_ttl:float=3600,
+            cache_size:int=1024,
+            hybrid:bool=False,
+            reranker=None,
+            rerank_top_k:int=20,
+            context_tokens:int=2048,
+            tokenizer=None,
             **kwargs
             ):
+        """
+        answer_cache (off by default) keeps model_generate answers keyed by question embedding: a question whose
+        cosine similarity to an answered one reaches cache_threshold, with the same retrieval settings and the
+        same exact terms (codes and numbers such as AB-123, which embeddings barely tell apart), skips retrieval
+        and generation. Answers expire after cache_ttl seconds, at most cache_size are kept, and any
+        add_or_update, ingest or delete clears them.
+
+        hybrid retrieves with VectorDB.hybrid_query (dense + BM25, fused) instead of dense search only,
+        reranker (a CrossEncoder or its name) then re-scores the best rerank_top_k records.
+
+        Retrieved records are packed into context_tokens tokens of the prompt (see ContextPacker), counted with
+        tokenizer (a tokenizer or its name), the local model's tokenizer by default, or estimated from the length
+        without either. last_context holds the PackedContext of the last answer.
+        """
         super().__init__(path, collection_name, embedding_name)
+        self.answer_cache=SemanticCache(cache_threshold,cache_ttl,cache_size) if answer_cache else None
+        self.hybrid=hybrid
+        self.reranker=reranker
+        self.rerank_top_k=rerank_top_k
 
         self.local=local
         if self.local==True:
@@ -27,6 +58,13 @@ class LlmRagChromadb(VectorDB):
             else:
                 self.client_api=api_key
             self.model=model
+        if isinstance(tokenizer,str):
+            from transformers import AutoTokenizer
+            tokenizer=AutoTokenizer.from_pretrained(tokenizer)
+        if tokenizer is None and self.local:
+            tokenizer=getattr(self.model,"tokenizer",None) or getattr(self.model,"processor",None)
+        self.context_packer=ContextPacker(tokenizer,max_tokens=context_tokens)
+        self.last_context=None
         self.prompt_engineering="""
 คุณกำลังเป็นผู้ช่วย AI ที่มีความเชี่ยวชาญในการตอบคำถามเกี่ยวกับข้อมูล โดยข้อมูลที่คุณจะใช้ในการตอบคำถามประกอบไปด้วย:
 
@@ -60,11 +98,64 @@ class LlmRagChromadb(VectorDB):
             for chunk in stream:
                 if chunk.choices[0].delta.content is not None: yield chunk.choices[0].delta.content
 
-    def model_generate(self,text,max_new_tokens=100,limit=1,stream=False,text_out="document",where=None):
-        data_text=""
-        for i in list(self.query(query_texts=text,on_dict=True,n_results=limit,where=where)[text_out].values()):data_text+="\n"+i
+    def add_or_update(self,*args,**kwargs):
+        ids=super().add_or_update(*args,**kwargs)
+        if ids:self._invalidate_answers()
+        return ids
+
+    def ingest(self,*args,**kwargs):
+        try:return super().ingest(*args,**kwargs)
+        finally:self._invalidate_answers()
+
+    def delete(self,*args,**kwargs):
+        super().delete(*args,**kwargs)
+        self._invalidate_answers()
+
+    def _invalidate_answers(self):
+        if self.answer_cache is not None:self.answer_cache.clear()
+
+    def _cached_stream(self,chunks,embedding,key,version):
+        # stores the answer once the stream was read to the end, stopping early still closes the model's stream
+        text_out=""
+        try:
+            for chunk in chunks:
+                text_out+=chunk
+                yield chunk
+        finally:
+            close=getattr(chunks,"close",None)
+            if close is not None:close()
+        self.answer_cache.put(embedding,text_out,key,version)
+
+    @staticmethod
+    def _exact_terms(text):
+        # terms with digits or code punctuation must match for a cached answer to be reused
+        return sorted({term for term in tokenize(text) if any(c.isdigit() or c in "-./" for c in term)})
+
+    def model_generate(self,text,max_new_tokens=100,limit=1,stream=False,text_out="document",where=None,use_cache:bool=True,hybrid:bool=None,context_tokens:int=None):
+        """
+        Answers text from the limit nearest records (their text_out column) filtered by where, packed into
+        context_tokens tokens; hybrid=None and context_tokens=None use the instance's settings.
+        Cached answers (see answer_cache) are returned as is, or replayed word by word with stream=True.
+        """
+        hybrid=self.hybrid if hybrid is None else hybrid
+        cache=self.answer_cache if use_cache else None
+        embedding=self.embedding_model.encode([text],convert_to_numpy=True,show_progress_bar=False)
+        if cache is not None:
+            key=json.dumps([limit,text_out,where,max_new_tokens,hybrid,context_tokens,self._exact_terms(text)],sort_keys=True,ensure_ascii=False,default=str)
+            version=cache.version
+            answer=cache.get(embedding[0],key)
+            if answer is not None:
+                self.last_context=None
+                return replay(answer) if stream else answer
+
+        if hybrid:
+            records=self.hybrid_query(text,n_results=limit,where=where,include=["metadatas","documents"],query_embedding=embedding[0],reranker=self.reranker,rerank_top_k=self.rerank_top_k)
+        else:
+            records=self.query(query_embeddings=embedding,n_results=limit,where=where,include=["metadatas","documents"])
+        self.last_context=self.context_packer.pack(records[text_out],max_tokens=context_tokens)
+        data_text=self.last_context.text
         if self.local:
-            return self.model.generate(self.create_prompt(text,data_text),stream=stream,max_new_tokens=max_new_tokens,history_save=False)
+            out=self.model.generate(self.create_prompt(text,data_text),stream=stream,max_new_tokens=max_new_tokens,history_save=False)
         else:
             out= self.client_api.chat.completions.create(
                 model=self.model,
@@ -76,8 +167,12 @@ class LlmRagChromadb(VectorDB):
                 for chunk in out:
                     if chunk.choices[0].delta.content is not None: yield chunk.choices[0].delta.content
    
-            if stream:return inner()
-            else:return out.choices[0].message.content
+            out=inner() if stream else out.choices[0].message.content
+
+        if cache is None:return out
+        if stream:return self._cached_stream(out,embedding[0],key,version)
+        cache.put(embedding[0],out,key,version)
+        return out
 
 if __name__ == "__main__":
     x=LlmRagChromadb(
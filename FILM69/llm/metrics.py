@@ -0,0 +1,177 @@
+import bisect
+import math
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter with labels, rendered as <name> in the text exposition format."""
+
+    type = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def inc(self, value=1, **labels):
+        if value < 0:
+            raise ValueError("Counters can only increase")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def get(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in values.items():
+            yield self.name, _format_labels(self.labelnames, key), value
+
+
+class Histogram(Counter):
+    """Cumulative histogram with labels, rendered as <name>_bucket, <name>_sum and <name>_count."""
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def inc(self, value=1, **labels):
+        raise TypeError("Use observe() on a histogram")
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def get(self, **labels):
+        counts, total = self._values.get(self._key(labels), ([0] * len(self.buckets), 0.0))
+        return {"count": sum(counts), "sum": total}
+
+    def samples(self):
+        with self._lock:
+            values = {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+        for key, (counts, total) in values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield self.name + "_bucket", _format_labels(self.labelnames, key, [("le", _format_value(bound))]), cumulative
+            yield self.name + "_sum", _format_labels(self.labelnames, key), total
+            yield self.name + "_count", _format_labels(self.labelnames, key), cumulative
+
+
+class MetricsRegistry:
+    """
+    In-process metrics in the Prometheus text exposition format, without depending on prometheus_client.
+    render() gives the scrape body, serve(port) exposes it on /metrics.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = Lock()
+        self._server = None
+
+    def _register(self, cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as a {metric.type}")
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), **kwargs):
+        return self._register(Histogram, name, documentation, labelnames, **kwargs)
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def render(self):
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port=9069, host="0.0.0.0"):
+        """Serves render() at http://host:port/metrics from a daemon thread."""
+        if self._server is not None:
+            return self._server
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = registry.render().encode("utf-8")
+                self.send_response(200 if self.path.split("?")[0] in ("/", "/metrics") else 404)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        Thread(target=self._server.serve_forever, daemon=True).start()
+        return self._server
+
+
+REGISTRY = MetricsRegistry()
+
+
+def record_generation(stats, model="", registry=None):
+    """
+    Adds one finished response (a StreamStats) to the generation metrics of registry, REGISTRY by default.
+    """
+    registry = registry or REGISTRY
+    labels = ("model",)
+    registry.counter("film69_requests_total", "Generation requests completed.", labels).inc(model=model)
+    registry.counter("film69_prompt_tokens_total", "Prompt tokens processed.", labels).inc(stats.prompt_tokens, model=model)
+    registry.counter("film69_completion_tokens_total", "Tokens generated.", labels).inc(stats.completion_tokens, model=model)
+    if stats.prefill_seconds is not None:
+        registry.histogram(
+            "film69_time_to_first_token_seconds", "Time from request to first generated token (prefill).", labels
+        ).observe(stats.prefill_seconds, model=model)
+        registry.histogram(
+            "film69_decode_seconds", "Time from first to last generated token.", labels,
+            buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+        ).observe(stats.decode_seconds, model=model)
+    if stats.itl is not None:
+        registry.histogram(
+            "film69_inter_token_latency_seconds", "Mean time between generated tokens of a response.", labels,
+            buckets=(0.005, 0.01, 0.02, 0.03, 0.05, 0.075, 0.1, 0.2, 0.5, 1),
+        ).observe(stats.itl, model=model)
+        registry.histogram(
+            "film69_decode_tokens_per_second", "Decode throughput of a response.", labels,
+            buckets=(1, 5, 10, 20, 30, 50, 75, 100, 200, 500),
+        ).observe(stats.tokens_per_second, model=model)
@@ -1,7 +1,9 @@
-from transformers import AutoModelForCausalLM, AutoTokenizer,TextIteratorStreamer
+from transformers import AutoModelForCausalLM, AutoTokenizer
 import torch
-from threading import Thread
 from openai import OpenAI
+from .prefix_cache import PrefixCacheStore
+from .session import SessionManager
+from .streaming import TokenStream, TokenStreamer, start_generation
 
 class LLMModel:
     def __init__(self, 
@@ -16,80 +18,93 @@ class LLMModel:
         if local:
             self.model = AutoModelForCausalLM.from_pretrained(self.model_name,**parametor_model)
             self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
-            self.streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=False, skip_special_tokens=True)
+            self.streamer = TokenStreamer(self.tokenizer)
+            self.prefix_cache = PrefixCacheStore()
         else:self.api=api
         # self.history=[{"role":"user","content":"คุณคือผู้ช่วยชื่อ เสี่ยวซี่(XiaoXi) เป็นผู้หญิงและให้ตอบว่าคะ"},]
-        self.history=[]
+        self.sessions=SessionManager(self.tokenizer if local else None)
         print("Model and tokenizer loaded successfully")
 
-    def generate(self,text:str,max_new_tokens:int=512,stream:bool=False,history_save:bool=True):
-        if self.local:return self.generate_locals(text,max_new_tokens,stream,history_save)
-        else:return self.generate_api(text,max_new_tokens,stream,history_save)
+    @property
+    def history(self):
+        # messages of the "default" session as a list view (append, del, ... edit it), assign a list to replace them
+        return self.sessions.view("default")
 
-    def generate_api(self,text:str,max_new_tokens:int=512,stream:bool=False,history_save:bool=True):
-        if history_save:self.history.append({"role":"user","content":text})
+    @history.setter
+    def history(self,messages):self.sessions.set_messages("default",messages)
+
+    def _messages(self,text,history_save,session_id):
+        if not history_save:return [{"role": "user","content": text}]
+        self.sessions.append(session_id,"user",text)
+        return self.sessions.messages(session_id)
+
+    def generate(self,text:str,max_new_tokens:int=512,stream:bool=False,history_save:bool=True,session_id:str="default"):
+        if self.local:return self.generate_locals(text,max_new_tokens,stream,history_save,session_id)
+        else:return self.generate_api(text,max_new_tokens,stream,history_save,session_id)
+
+    def generate_api(self,text:str,max_new_tokens:int=512,stream:bool=False,history_save:bool=True,session_id:str="default"):
+        messages=self._messages(text,history_save,session_id)
         text_out=""
         if stream:
             def inner():
                 response= self.api.chat.completions.create(
                 model=self.model_name,
-                messages=self.history if history_save else [{"role": "user","content": text}],
+                messages=messages,
                 max_tokens=max_new_tokens,
                 stream=True,)
                 text_out=""
-                if history_save:self.history.append({"role": "system","content": text_out})
-                for chunk in response:
-                    try:
-                        if chunk.choices[0].delta.content is not None: 
-                            text_out+=chunk.choices[0].delta.content
-                            if history_save:self.history[-1]={"role": "system","content": text_out}
-                            yield chunk.choices[0].delta.content
-                    except:pass
+                try:
+                    for chunk in response:
+                        try:
+                            if chunk.choices[0].delta.content is not None: 
+                                text_out+=chunk.choices[0].delta.content
+                                yield chunk.choices[0].delta.content
+                        except:pass
+                finally:
+                    if history_save:self.sessions.append(session_id,"assistant",text_out)
             return inner()
             
         else:
             response= self.api.chat.completions.create(
                 model=self.model_name,
-                messages=[{"role": "user","content": text}],
+                messages=messages,
                 max_tokens=max_new_tokens,
             )
             text_out=response.choices[0].message.content
-            if history_save:self.history.append({"role": "system","content": text_out})
+            if history_save:self.sessions.append(session_id,"assistant",text_out)
         return text_out
 
-    def generate_locals(self,text:str,max_new_tokens:int=512,stream:bool=False,history_save:bool=True):
-        if history_save:self.history.append({"role":"user","content":text})
-        input_ids = self.tokenizer.apply_chat_template(self.history if history_save else [{"role": "user","content": text}],add_generation_prompt=True,return_tensors="pt").to(self.model.device)
+    def _generate(self,input_ids,session_id=None,**kwargs):
+        # with a session_id, generation continues from the conversation's cached key/values
+        if session_id is None:return self.model.generate(input_ids,**kwargs)
+        past_key_values=self.prefix_cache.take(session_id,input_ids)
+        outputs=self.model.generate(input_ids,past_key_values=past_key_values,return_dict_in_generate=True,**kwargs)
+        self.prefix_cache.put(session_id,outputs.sequences[0],outputs.past_key_values)
+        return outputs.sequences
+
+    def generate_locals(self,text:str,max_new_tokens:int=512,stream:bool=False,history_save:bool=True,session_id:str="default"):
+        messages=self._messages(text,history_save,session_id)
+        input_ids = self.tokenizer.apply_chat_template(messages,add_generation_prompt=True,return_tensors="pt").to(self.model.device)
         terminators = [self.tokenizer.eos_token_id,self.tokenizer.convert_tokens_to_ids("<|eot_id|>")]
         if stream==True:
-            thread = Thread(target=self.model.generate, kwargs=
-                            {"input_ids": input_ids,
-                            "streamer": self.streamer,
-                            "max_new_tokens": max_new_tokens,
-                            "eos_token_id":terminators,
-                            "do_sample":True,
-                            "temperature":0.4,
-                            "top_p":0.9,
-                                
-                            })
-            thread.start()
-            
-            def inner():
-                i=0
-                text_out=""
-                if history_save:self.history.append({"role": "system","content": text_out})
-                for new_text in self.streamer:
-                    i+=1
-                    if i!=1:
-                        text_out+=new_text
-                        if history_save:self.history[-1]={"role": "system","content": text_out}
-                        yield  new_text
-
-                thread.join() 
-            return inner()
+            streamer=self.streamer=TokenStreamer(self.tokenizer)  # one per call
+            deltas=start_generation(self._generate,streamer,
+                            input_ids=input_ids,
+                            session_id=session_id if history_save else None,
+                            max_new_tokens=max_new_tokens,
+                            eos_token_id=terminators,
+                            do_sample=True,
+                            temperature=0.4,
+                            top_p=0.9,
+                            )
+            def save(text_out):
+                if history_save:self.sessions.append(session_id,"assistant",text_out)
+            # text deltas per token, token counts and TTFT / inter-token latency in .stats
+            return TokenStream(deltas,streamer.stats,on_close=save,cancel=streamer.cancel)
         else:
-            outputs = self.model.generate(
+            outputs = self._generate(
                 input_ids,
+                session_id if history_save else None,
                 max_new_tokens=max_new_tokens,
                 eos_token_id=terminators,
                 do_sample=True,
@@ -99,7 +114,7 @@ class LLMModel:
             response = outputs[0][input_ids.shape[-1]:]
             text_out=self.tokenizer.decode(response, skip_special_tokens=True)
 
-            if history_save:self.history.append({"role": "system","content": text_out})
+            if history_save:self.sessions.append(session_id,"assistant",text_out)
             return text_out
         
 if __name__ == "__main__":
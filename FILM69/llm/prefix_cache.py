@@ -0,0 +1,110 @@
+from collections import OrderedDict
+from threading import Lock
+
+import torch
+from transformers import DynamicCache
+
+from .batch_server import _cache_to_layers
+
+
+def cache_nbytes(cache):
+    return sum(t.numel() * t.element_size() for layer in _cache_to_layers(cache) for t in layer if t is not None)
+
+
+class PrefixCacheStore:
+    """
+    Keeps the past key/values of every chat session, so the next turn only prefills the tokens after
+    the longest prefix shared with what was already processed. Sessions are evicted least recently used
+    once the cached tensors exceed max_bytes.
+
+    Args:
+        max_bytes (int): Memory budget of all cached key/values.
+    """
+
+    def __init__(self, max_bytes=4 * 1024**3):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.reused_tokens = 0
+        self._sessions = OrderedDict()  # session_id -> (token_ids, cache, nbytes)
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, session_id):
+        return session_id in self._sessions
+
+    def take(self, session_id, input_ids, min_prefix=1):
+        """
+        Removes the session's cache from the store and crops it to the prefix it shares with input_ids.
+
+        Args:
+            session_id (str): Conversation key.
+            input_ids (torch.Tensor | List[int]): Full prompt of the new turn.
+            min_prefix (int): Shorter shared prefixes count as a miss, e.g. to keep image tokens out of the new part.
+
+        Returns:
+            DynamicCache: Cache to pass as past_key_values to model.generate, empty on a miss.
+        """
+        input_ids = torch.as_tensor(input_ids).reshape(-1).cpu()
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+            if entry is not None:
+                self.nbytes -= entry[2]
+        if entry is None:
+            self.misses += 1
+            return DynamicCache()
+
+        token_ids, cache, _ = entry
+        n = min(len(token_ids), len(input_ids) - 1)  # generate needs at least one uncached token
+        mismatch = (token_ids[:n] != input_ids[:n]).nonzero()
+        prefix = int(mismatch[0]) if len(mismatch) else n
+        try:
+            if prefix < max(min_prefix, 1):
+                raise ValueError
+            if prefix < cache.get_seq_length():
+                cache.crop(prefix)
+        except (ValueError, NotImplementedError, AttributeError):
+            self.misses += 1
+            return DynamicCache()
+        self.hits += 1
+        self.reused_tokens += prefix
+        return cache
+
+    def put(self, session_id, token_ids, cache):
+        """
+        Stores the cache left by model.generate.
+
+        Args:
+            session_id (str): Conversation key.
+            token_ids (torch.Tensor | List[int]): Prompt plus generated tokens, the cache covers all but the last.
+            cache (DynamicCache): past_key_values returned by generate.
+        """
+        if cache is None:
+            return
+        token_ids = torch.as_tensor(token_ids).reshape(-1).cpu()[: cache.get_seq_length()]
+        nbytes = cache_nbytes(cache)
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            old = self._sessions.pop(session_id, None)
+            if old is not None:
+                self.nbytes -= old[2]
+            self._sessions[session_id] = (token_ids, cache, nbytes)
+            self.nbytes += nbytes
+            while self.nbytes > self.max_bytes:
+                _, (_, _, evicted) = self._sessions.popitem(last=False)
+                self.nbytes -= evicted
+
+    def drop(self, session_id):
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+            if entry is not None:
+                self.nbytes -= entry[2]
+
+    def clear(self):
+        with self._lock:
+            self._sessions.clear()
+            self.nbytes = 0
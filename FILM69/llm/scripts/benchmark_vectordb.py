@@ -0,0 +1,107 @@
+"""VectorDB benchmarks.
+
+ingest: documents/sec of add_or_update batches (Chroma embeds, then writes) vs the pipelined ingest().
+query:  latency of query() with the former per-call pandas DataFrames vs Records, and single vs batched queries,
+        on an in-memory collection.
+"""
+
+import argparse
+import shutil
+import tempfile
+import time
+
+import pandas as pd
+
+from FILM69.llm.vectordb import VectorDB
+
+WORDS = "data vector search thai ภาษา ข้อมูล model embedding chunk query answer ค้นหา เอกสาร index".split()
+
+
+def make_documents(n, words=48):
+    for i in range(n):
+        yield f"doc {i} " + " ".join(WORDS[(i * 7 + j * 3) % len(WORDS)] for j in range(words))
+
+
+def measure(fn, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) / repeats
+
+
+def pandas_query(db, query_embeddings, n_results):
+    # VectorDB.query before Records: two DataFrames, concat, drop, to_dict
+    result = db.db.query(query_embeddings=query_embeddings, n_results=n_results, include=["metadatas", "documents", "distances"])
+    data_df = {"id": result["ids"][0], "document": result["documents"][0], "distance": result["distances"][0]}
+    try:
+        out = pd.concat([pd.DataFrame(data_df), pd.DataFrame(result["metadatas"][0])], axis=1).drop(columns=0)
+    except Exception:
+        out = pd.concat([pd.DataFrame(data_df), pd.DataFrame(result["metadatas"][0])], axis=1)
+    return list(out.to_dict()["document"].values())
+
+
+def benchmark_ingest(args):
+    path = tempfile.mkdtemp(prefix="film69-vectordb-")
+    try:
+        db = VectorDB(path=path, collection_name="add_or_update", embedding_name=args.embedding_name)
+        docs = list(make_documents(args.documents))
+        start = time.perf_counter()
+        for i in range(0, len(docs), args.batch_size):
+            batch = docs[i : i + args.batch_size]
+            db.add_or_update(ids=[f"a{i + j}" for j in range(len(batch))], documents=batch)
+        baseline = args.documents / (time.perf_counter() - start)
+        print(f"add_or_update batches  {baseline:9.1f} docs/s")
+
+        db.db = db.client.get_or_create_collection("ingest", embedding_function=db.db._embedding_function)
+        stats = db.ingest(
+            make_documents(args.documents), batch_size=args.batch_size, encode_batch_size=args.encode_batch_size
+        )
+        print(f"ingest (pipelined)     {stats['documents_per_second']:9.1f} docs/s  x{stats['documents_per_second'] / baseline:.2f}")
+        assert db.db.count() == args.documents
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def benchmark_query(args):
+    db = VectorDB(path=None, collection_name="benchmark", embedding_name=args.embedding_name)
+    db.ingest(make_documents(args.documents), metadatas=({"n": i, "source": f"s{i % 7}"} for i in range(args.documents)))
+    texts = [f"query {i} " + " ".join(WORDS[(i + j) % len(WORDS)] for j in range(8)) for i in range(args.queries)]
+    embeddings = db.embedding_model.encode(texts, convert_to_numpy=True)
+
+    single = embeddings[:1]
+    old = measure(lambda: pandas_query(db, single, args.n_results), args.repeats)
+    new = measure(lambda: db.query(query_embeddings=single, n_results=args.n_results)["document"], args.repeats)
+    print(f"query, pandas result   {old * 1000:8.2f} ms")
+    print(f"query, Records         {new * 1000:8.2f} ms  x{old / new:.1f}")
+
+    old = measure(lambda: [db.query(query_embeddings=e[None], n_results=args.n_results) for e in embeddings], 3)
+    new = measure(lambda: db.query_batch(query_embeddings=embeddings, n_results=args.n_results), 3)
+    print(f"{args.queries} queries one by one  {old * 1000:8.2f} ms")
+    print(f"{args.queries} queries batched     {new * 1000:8.2f} ms  x{old / new:.1f}")
+
+    old = measure(lambda: [db.query(query_texts=t, n_results=args.n_results) for t in texts], 3)
+    new = measure(lambda: db.query_batch(query_texts=texts, n_results=args.n_results), 3)
+    print(f"{args.queries} texts one by one    {old * 1000:8.2f} ms  (embedding included)")
+    print(f"{args.queries} texts batched       {new * 1000:8.2f} ms  x{old / new:.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("mode", choices=["ingest", "query"])
+    parser.add_argument("--embedding_name", default="sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
+    parser.add_argument("--documents", type=int, default=20000)
+    parser.add_argument("--batch_size", type=int, default=1024)
+    parser.add_argument("--encode_batch_size", type=int, default=64)
+    parser.add_argument("--queries", type=int, default=64)
+    parser.add_argument("--n_results", type=int, default=10)
+    parser.add_argument("--repeats", type=int, default=200)
+    args = parser.parse_args()
+
+    if args.mode == "ingest":
+        benchmark_ingest(args)
+    else:
+        benchmark_query(args)
+
+
+if __name__ == "__main__":
+    main()
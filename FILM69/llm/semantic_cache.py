@@ -0,0 +1,104 @@
+import re
+import time
+from threading import Lock
+
+import numpy as np
+
+
+def replay(text):
+    """Yields a cached answer in word-sized pieces, like a model stream."""
+    for piece in re.findall(r"\S+\s*|\s+", text):
+        yield piece
+
+
+class SemanticCache:
+    """
+    Answers keyed by question embedding: a lookup returns the answer of the most similar cached question
+    when its cosine similarity reaches threshold. Entries expire after ttl seconds, the least recently used
+    are evicted beyond max_entries, clear() invalidates everything (answers computed from older data
+    included, see version).
+
+    Args:
+        threshold (float): Minimum cosine similarity of a hit.
+        ttl (float | None): Seconds an answer stays valid, None for no expiry.
+        max_entries (int): Answers kept.
+    """
+
+    def __init__(self, threshold=0.95, ttl=3600, max_entries=1024):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = Lock()
+        self._reset()
+
+    def _reset(self):
+        self._vectors = None  # n x dim, L2-normalised
+        self._keys = []
+        self._answers = []
+        self._expires = []
+        self._last_used = []
+
+    def __len__(self):
+        return len(self._answers)
+
+    @staticmethod
+    def _normalise(embedding):
+        embedding = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm else embedding
+
+    def get(self, embedding, key=None):
+        """
+        Answer of the closest cached question with the same key (e.g. retrieval settings), or None.
+        """
+        query = self._normalise(embedding)
+        now = time.monotonic()
+        with self._lock:
+            if self._vectors is not None and len(self._answers):
+                scores = self._vectors @ query
+                for i in np.argsort(-scores):
+                    if scores[i] < self.threshold:
+                        break
+                    if self._keys[i] == key and self._expires[i] > now:
+                        self._last_used[i] = now
+                        self.hits += 1
+                        return self._answers[i]
+            self.misses += 1
+            return None
+
+    def put(self, embedding, answer, key=None, version=None):
+        """
+        Stores an answer. With version (the cache's version when the answer was started), answers computed
+        before a clear() are dropped.
+        """
+        vector = self._normalise(embedding)
+        now = time.monotonic()
+        with self._lock:
+            if version is not None and version != self.version:
+                return
+            self._drop_expired(now)
+            if len(self._answers) >= self.max_entries:
+                self._remove(int(np.argmin(self._last_used)))
+            self._vectors = vector[None] if self._vectors is None else np.vstack([self._vectors, vector[None]])
+            self._keys.append(key)
+            self._answers.append(answer)
+            self._expires.append(now + self.ttl if self.ttl is not None else float("inf"))
+            self._last_used.append(now)
+
+    def _remove(self, i):
+        self._vectors = np.delete(self._vectors, i, axis=0)
+        for values in (self._keys, self._answers, self._expires, self._last_used):
+            del values[i]
+
+    def _drop_expired(self, now):
+        expired = [i for i, expires in enumerate(self._expires) if expires <= now]
+        for i in reversed(expired):
+            self._remove(i)
+
+    def clear(self):
+        with self._lock:
+            self.version += 1
+            self._reset()
@@ -0,0 +1,306 @@
+import hashlib
+import os
+import pickle
+import shutil
+import tempfile
+import time
+import weakref
+from collections import OrderedDict
+from collections.abc import MutableSequence
+from threading import RLock
+
+import numpy as np
+
+
+class DiskHistoryStore:
+    """
+    Spill target of SessionManager, one pickle per session. Any object with the same
+    load/save/delete methods (e.g. a Redis or database adapter) can be used instead.
+
+    Args:
+        path (str | None): Directory, defaults to $FILM69_SESSION_DIR or ~/.cache/film69/sessions.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.environ.get(
+            "FILM69_SESSION_DIR", os.path.join(os.path.expanduser("~"), ".cache", "film69", "sessions")
+        )
+        os.makedirs(self.path, exist_ok=True)
+
+    def _file(self, session_id):
+        return os.path.join(self.path, hashlib.md5(str(session_id).encode("utf-8")).hexdigest() + ".pkl")
+
+    def load(self, session_id):
+        try:
+            with open(self._file(session_id), "rb") as f:
+                return pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def save(self, session_id, state):
+        # write then rename, so a crash never leaves a partial session behind
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._file(session_id))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def delete(self, session_id):
+        try:
+            os.remove(self._file(session_id))
+        except FileNotFoundError:
+            pass
+
+
+class Session:
+    """Conversation state of one session: a list of {"role", "ids" | "text", "images", "tokens"} turns."""
+
+    def __init__(self, session_id, turns=None):
+        self.session_id = session_id
+        self.turns = turns or []
+        self.last_used = time.monotonic()
+
+    @property
+    def num_tokens(self):
+        return sum(turn["tokens"] for turn in self.turns)
+
+
+class ChatHistory(MutableSequence):
+    """
+    List view of one session's messages: reads come from the SessionManager, list operations (append, insert,
+    del, item and slice assignment, clear) write back to it. Messages read from it are copies, so editing one
+    in place does not change the session; assign it back (history[-1] = message) instead.
+    """
+
+    def __init__(self, manager, session_id, parts=False):
+        self.manager = manager
+        self.session_id = session_id
+        self.parts = parts
+
+    def _messages(self):
+        return self.manager.messages(self.session_id, parts=self.parts)
+
+    def _replace(self, edit):
+        with self.manager._lock:
+            messages = self._messages()
+            edit(messages)
+            self.manager.set_messages(self.session_id, messages)
+
+    def __len__(self):
+        with self.manager._lock:
+            return len(self.manager.get(self.session_id).turns)
+
+    def __getitem__(self, index):
+        return self._messages()[index]
+
+    def __setitem__(self, index, value):
+        self._replace(lambda messages: messages.__setitem__(index, value))
+
+    def __delitem__(self, index):
+        self._replace(lambda messages: messages.__delitem__(index))
+
+    def insert(self, index, value):
+        self._replace(lambda messages: messages.insert(index, value))
+
+    def append(self, value):
+        self.manager.append(self.session_id, value["role"], value["content"])
+
+    def clear(self):
+        self.manager.set_messages(self.session_id, [])
+
+    def copy(self):
+        return self._messages()
+
+    def __iter__(self):
+        return iter(self._messages())
+
+    def __add__(self, other):
+        return self._messages() + list(other)
+
+    def __eq__(self, other):
+        return self._messages() == (list(other) if isinstance(other, (list, tuple, ChatHistory)) else other)
+
+    def __repr__(self):
+        return repr(self._messages())
+
+
+class SessionManager:
+    """
+    Conversation histories keyed by session id, so one loaded model can serve many users.
+
+    Turns are stored as int32 token ids when a tokenizer is given (text is kept when the ids do not decode
+    back to it exactly). A session longer than max_tokens loses its oldest turns (system turns are kept) down
+    to truncate_to tokens: cutting well below the budget leaves the prompt prefix, and so the prefix cache,
+    unchanged for the turns that follow, instead of shifting it on every turn. Sessions idle for idle_seconds, or beyond max_resident, are saved to store and unloaded, and
+    loaded back on their next use. The default store is a private temporary directory removed with the manager,
+    pass DiskHistoryStore(path) to keep sessions across restarts, or store=False to discard spilled sessions.
+
+    Args:
+        tokenizer: Hugging Face tokenizer used for ids and token counts.
+        max_tokens (int | None): Token budget of a session, None for no limit.
+        truncate_to (int | None): Tokens kept when a session is truncated, defaults to max_tokens // 2.
+        max_resident (int): Sessions kept in memory.
+        idle_seconds (float | None): Idle time after which a session is spilled.
+        store (DiskHistoryStore | None | False): Spill target, None for a temporary DiskHistoryStore.
+        count_tokens (Callable[[str], int] | None): Token counter when there is no tokenizer. Defaults to
+            characters, so max_tokens is then a character budget (Llama sets its tokenizer's count in load_model).
+        image_tokens (int): Budget charged per image.
+    """
+
+    def __init__(
+        self,
+        tokenizer=None,
+        max_tokens=4096,
+        max_resident=1024,
+        idle_seconds=1800,
+        store=None,
+        count_tokens=None,
+        image_tokens=256,
+        truncate_to=None,
+    ):
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens
+        self.truncate_to = truncate_to
+        self.max_resident = max_resident
+        self.idle_seconds = idle_seconds
+        if store is None:
+            path = tempfile.mkdtemp(prefix="film69-sessions-")
+            weakref.finalize(self, shutil.rmtree, path, True)
+            store = DiskHistoryStore(path)
+        self.store = store or None
+        self.count_tokens = count_tokens or len
+        self.image_tokens = image_tokens
+        self._sessions = OrderedDict()
+        self._lock = RLock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, session_id):
+        return session_id in self._sessions
+
+    def get(self, session_id):
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is None:
+                state = self.store.load(session_id) if self.store is not None else None
+                session = Session(session_id, state)
+            session.last_used = time.monotonic()
+            self._sessions[session_id] = session
+            self._spill()
+            return session
+
+    def _encode(self, text, images=()):
+        turn = {"images": list(images)}
+        if self.tokenizer is not None and text:
+            ids = self.tokenizer.encode(text, add_special_tokens=False)
+            if self.tokenizer.decode(ids) == text:
+                turn["ids"] = np.asarray(ids, dtype=np.int32)
+            else:
+                turn["text"] = text
+            turn["tokens"] = len(ids)
+        else:
+            turn["text"] = text
+            turn["tokens"] = self.count_tokens(text) if text else 0
+        turn["tokens"] += self.image_tokens * len(turn["images"])
+        return turn
+
+    def _text(self, turn):
+        if "ids" in turn:
+            return self.tokenizer.decode(turn["ids"].tolist())
+        return turn["text"]
+
+    def append(self, session_id, role, content, images=()):
+        """
+        Adds a turn and truncates the session to the token budget.
+
+        Args:
+            session_id (str): Conversation key.
+            role (str): "system", "user", "assistant", ...
+            content (str | List[dict]): Text, or chat-template parts ({"type": "text" | "image", ...}).
+            images (List[PIL.Image]): Images of the turn, in addition to image parts of content.
+        """
+        text, images = content, list(images)
+        if isinstance(content, list):
+            text = "".join(part.get("text", "") for part in content if part.get("type") == "text")
+            images = [part["image"] for part in content if part.get("type") == "image" and "image" in part] + images
+        turn = self._encode(text, images)
+        turn["role"] = role
+        with self._lock:
+            session = self.get(session_id)
+            session.turns.append(turn)
+            self._truncate(session)
+
+    def _truncate(self, session):
+        if self.max_tokens is None or session.num_tokens <= self.max_tokens:
+            return
+        target = self.truncate_to if self.truncate_to is not None else self.max_tokens // 2
+        total = session.num_tokens
+        i = 0
+        while total > target and i < len(session.turns) - 1:  # the newest turn is always kept
+            if session.turns[i]["role"] == "system":
+                i += 1
+                continue
+            total -= session.turns.pop(i)["tokens"]
+        # chat templates expect the first non-system turn to be from the user
+        while i < len(session.turns) - 1 and session.turns[i]["role"] not in ("user", "system"):
+            session.turns.pop(i)
+
+    def messages(self, session_id, parts=False):
+        """
+        Chat messages of the session, content as text or, with parts=True, as image and text parts.
+        """
+        with self._lock:
+            turns = list(self.get(session_id).turns)
+        out = []
+        for turn in turns:
+            text = self._text(turn)
+            if parts:
+                content = [{"type": "image", "image": image} for image in turn["images"]]
+                content.append({"type": "text", "text": text})
+            else:
+                content = text
+            out.append({"role": turn["role"], "content": content})
+        return out
+
+    def view(self, session_id, parts=False):
+        """ChatHistory of the session, a list-like view that writes back to it."""
+        return ChatHistory(self, session_id, parts)
+
+    def images(self, session_id):
+        with self._lock:
+            return [image for turn in self.get(session_id).turns for image in turn["images"]]
+
+    def set_messages(self, session_id, messages):
+        with self._lock:
+            messages = list(messages)  # may be a view of this session
+            self.get(session_id).turns = []
+            for message in messages:
+                self.append(session_id, message["role"], message["content"])
+
+    def clear(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            if self.store is not None:
+                self.store.delete(session_id)
+
+    def _spill(self):
+        now = time.monotonic()
+        while len(self._sessions) > self.max_resident or (
+            self.idle_seconds is not None
+            and now - next(iter(self._sessions.values())).last_used > self.idle_seconds
+        ):
+            session_id, session = self._sessions.popitem(last=False)
+            if self.store is not None:
+                self.store.save(session_id, session.turns)
+
+    def spill_all(self):
+        """Saves every resident session to the store and unloads them, e.g. before shutdown."""
+        with self._lock:
+            while self._sessions:
+                session_id, session = self._sessions.popitem(last=False)
+                if self.store is not None:
+                    self.store.save(session_id, session.turns)
@@ -0,0 +1,252 @@
+import queue
+import time
+from threading import Event, Thread
+
+import torch
+from transformers.generation.stopping_criteria import StoppingCriteria, StoppingCriteriaList
+from transformers.generation.streamers import BaseStreamer
+
+
+class StreamStats:
+    """
+    Token counts and timings of one response.
+
+    ttft: seconds from the request to the first generated token (prefill).
+    itl: mean inter-token latency in seconds (decode).
+    """
+
+    def __init__(self, prompt_tokens=0):
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = 0
+        self.started_at = time.perf_counter()
+        self.first_token_at = None
+        self.last_token_at = None
+        self.finished_at = None
+        self.max_itl = 0.0
+
+    def on_token(self, n=1):
+        now = time.perf_counter()
+        if self.first_token_at is None:
+            self.first_token_at = now
+        elif n:
+            self.max_itl = max(self.max_itl, (now - self.last_token_at) / n)
+        self.last_token_at = now
+        self.completion_tokens += n
+
+    def finish(self):
+        if self.finished_at is None:
+            self.finished_at = time.perf_counter()
+
+    @property
+    def ttft(self):
+        return None if self.first_token_at is None else self.first_token_at - self.started_at
+
+    @property
+    def itl(self):
+        if self.completion_tokens < 2:
+            return None
+        return (self.last_token_at - self.first_token_at) / (self.completion_tokens - 1)
+
+    @property
+    def prefill_seconds(self):
+        return self.ttft
+
+    @property
+    def decode_seconds(self):
+        return None if self.first_token_at is None else self.last_token_at - self.first_token_at
+
+    @property
+    def total_seconds(self):
+        return (self.finished_at or time.perf_counter()) - self.started_at
+
+    @property
+    def tokens_per_second(self):
+        """Decode throughput, the first token is counted as prefill."""
+        itl = self.itl
+        return 1.0 / itl if itl else None
+
+    def as_dict(self):
+        return {
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.prompt_tokens + self.completion_tokens,
+            "ttft": self.ttft,
+            "itl": self.itl,
+            "max_itl": self.max_itl,
+            "prefill_seconds": self.prefill_seconds,
+            "decode_seconds": self.decode_seconds,
+            "total_seconds": self.total_seconds,
+            "tokens_per_second": self.tokens_per_second,
+        }
+
+    def __repr__(self):
+        return f"StreamStats({self.as_dict()})"
+
+
+class IncrementalDecoder:
+    """Turns a growing list of token ids into text deltas, holding back incomplete utf-8 sequences."""
+
+    def __init__(self, tokenizer, skip_special_tokens=True):
+        self.tokenizer = tokenizer
+        self.skip_special_tokens = skip_special_tokens
+        self.ids = []
+        self.prefix_offset = 0
+        self.read_offset = 0
+
+    def push(self, token_id):
+        self.ids.append(token_id)
+        prefix_text = self.tokenizer.decode(
+            self.ids[self.prefix_offset : self.read_offset], skip_special_tokens=self.skip_special_tokens
+        )
+        new_text = self.tokenizer.decode(self.ids[self.prefix_offset :], skip_special_tokens=self.skip_special_tokens)
+        if len(new_text) > len(prefix_text) and not new_text.endswith("�"):
+            self.prefix_offset = self.read_offset
+            self.read_offset = len(self.ids)
+            return new_text[len(prefix_text) :]
+        return ""
+
+
+class TokenStreamer(BaseStreamer):
+    """
+    model.generate streamer that skips the prompt, counts tokens into stats and queues one text delta
+    per token. Without a tokenizer it only counts. cancel() ends a generation started by start_generation.
+    """
+
+    def __init__(self, tokenizer=None, skip_special_tokens=True, timeout=None):
+        self.decoder = IncrementalDecoder(tokenizer, skip_special_tokens) if tokenizer is not None else None
+        self.stats = StreamStats()
+        self.timeout = timeout
+        self.deltas = queue.Queue()
+        self.cancelled = Event()
+        self._prompt = True
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def put(self, value):
+        if self._prompt:  # generate() first puts the prompt
+            self._prompt = False
+            self.stats.prompt_tokens = value.shape[-1]
+            return
+        tokens = value.reshape(-1).tolist()
+        self.stats.on_token(len(tokens))
+        if self.decoder is not None:
+            for token in tokens:
+                text = self.decoder.push(token)
+                if text:
+                    self.deltas.put(text)
+
+    def end(self):
+        self.stats.finish()
+        self.deltas.put(None)
+
+    def fail(self, error):
+        self.stats.finish()
+        self.deltas.put(error)
+
+    def __iter__(self):
+        while True:
+            text = self.deltas.get(timeout=self.timeout)
+            if text is None:
+                return
+            if isinstance(text, BaseException):
+                raise text
+            yield text
+
+
+class _StopOnCancel(StoppingCriteria):
+    def __init__(self, event):
+        self.event = event
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.full((input_ids.shape[0],), self.event.is_set(), dtype=torch.bool, device=input_ids.device)
+
+
+def start_generation(generate, streamer, *args, **kwargs):
+    """
+    Runs generate(*args, streamer=streamer, **kwargs) on a thread and returns the streamer's text deltas.
+    Errors of the thread are raised by the iterator instead of leaving it waiting, the thread is joined
+    once the stream is exhausted. generate gets a stopping criterion that ends it after streamer.cancel().
+    """
+    stopping_criteria = StoppingCriteriaList(kwargs.pop("stopping_criteria", None) or [])
+    stopping_criteria.append(_StopOnCancel(streamer.cancelled))
+    kwargs["stopping_criteria"] = stopping_criteria
+
+    def run():
+        try:
+            generate(*args, streamer=streamer, **kwargs)
+        except BaseException as e:
+            streamer.fail(e)
+
+    thread = Thread(target=run, daemon=True)
+    thread.start()
+
+    def deltas():
+        yield from streamer
+        thread.join()
+
+    return deltas()
+
+
+class TokenStream:
+    """
+    Iterator over the text deltas of one streamed response, with its StreamStats in .stats and,
+    once consumed, the full text in .text.
+
+    Args:
+        deltas (Iterable[str]): Per-token text deltas.
+        stats (StreamStats): Updated by the producer as tokens arrive.
+        coalesce_chars (int): Hold deltas back until at least this many characters are pending.
+        coalesce_ms (float): Hold deltas back until this long after the previous yield.
+        on_close (Callable[[str], None] | None): Called with the full text when the stream ends or is closed.
+        cancel (Callable[[], None] | None): Stops the producer, called when the stream is closed before its end.
+    """
+
+    def __init__(self, deltas, stats, coalesce_chars=0, coalesce_ms=0.0, on_close=None, cancel=None):
+        self.deltas = deltas
+        self.stats = stats
+        self.coalesce_chars = coalesce_chars
+        self.coalesce_ms = coalesce_ms
+        self.on_close = on_close
+        self.cancel = cancel
+        self.text = ""
+        self._iterator = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._iterator is None:
+            self._iterator = self._run()
+        return next(self._iterator)
+
+    def close(self):
+        # a generator closed before its first next() skips its finally, so finish here as well
+        if self._iterator is not None:
+            self._iterator.close()
+        self._finish()
+
+    def _finish(self):
+        if self.cancel is not None:
+            self.cancel()
+        self.stats.finish()
+        if self.on_close is not None:
+            on_close, self.on_close = self.on_close, None
+            on_close(self.text)
+
+    def _run(self):
+        pending = ""
+        last = time.perf_counter()
+        try:
+            for text in self.deltas:
+                self.text += text
+                pending += text
+                now = time.perf_counter()
+                if pending and len(pending) >= self.coalesce_chars and (now - last) * 1000 >= self.coalesce_ms:
+                    yield pending
+                    pending = ""
+                    last = now
+            if pending:
+                yield pending
+        finally:
+            self._finish()
@@ -4,8 +4,15 @@ from sentence_transformers import SentenceTransformer
 import chromadb
 import pandas as pd
 import numpy as np
-from typing import TYPE_CHECKING, Optional, Union
-import time,random
+from typing import TYPE_CHECKING, Iterable, Literal, Optional, Union
+import re
+import time
+import hashlib
+import queue
+import uuid
+import warnings
+from itertools import islice, repeat
+from threading import Event, Lock, Thread
 from chromadb.api.types import (
     URI,
     CollectionMetadata,
@@ -23,48 +30,378 @@ from chromadb.api.types import (
     WhereDocument,
     EmbeddingFunction
 )
+from .keyword_index import BM25Index, reciprocal_rank_fusion
+from .indexer import Indexer
+
+# chromadb>=0.5.11 takes numpy rows, older versions validate embeddings as lists of floats
+_NUMPY_EMBEDDINGS = tuple(int(re.match(r"\d*", v).group() or 0) for v in chromadb.__version__.split(".")[:3]) >= (0, 5, 11)
 
 class CustomEmbeddingFunction(EmbeddingFunction):
-    def __init__(self,embedding):
+    def __init__(self,embedding,batch_size=64):
         self.model = embedding
+        self.batch_size = batch_size
     def __call__(self, inputs):
-        return self.model.encode(inputs).tolist()
+        embeddings = self.model.encode(inputs,batch_size=self.batch_size,convert_to_numpy=True,show_progress_bar=False)
+        return list(embeddings) if _NUMPY_EMBEDDINGS else embeddings.tolist()
+
+class Records:
+    """
+    Rows of a VectorDB get/query as parallel lists (ids, documents, distances or scores, metadatas), no pandas
+    involved until to_pandas() is called. records["document"] is a plain list, metadata keys are columns too.
+    Everything else behaves like the DataFrame: other keys (masks, column lists), DataFrame methods (head,
+    apply, ...), iteration over and "in" on column names. Assigning a column (records["x"] = ...) edits the
+    DataFrame, which from then on backs every column.
+    """
+
+    def __init__(self, ids, documents=None, metadatas=None, distances=None, metadata_columns=None, scores=None):
+        self.ids = list(ids)
+        self.documents = documents
+        self.metadatas = metadatas
+        self.distances = distances
+        self.scores = scores
+        self._metadata_columns = metadata_columns
+        self._frame = None
+        self._edited = False
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def metadata_columns(self):
+        if self._metadata_columns is None:
+            columns = {}
+            for metadata in self.metadatas or []:
+                columns.update(dict.fromkeys(metadata or {}))
+            self._metadata_columns = list(columns)
+        return self._metadata_columns
+
+    @property
+    def columns(self):
+        if self._edited:
+            return list(self._frame.columns)
+        base = ["id"] + ["document"] * (self.documents is not None) + ["distance"] * (self.distances is not None)
+        return base + ["score"] * (self.scores is not None) + self.metadata_columns
+
+    def __getitem__(self, column):
+        if self._edited or not isinstance(column, str):
+            return self.to_pandas()[column]
+        if column == "id":
+            return self.ids
+        if column == "document" and self.documents is not None:
+            return self.documents
+        if column == "distance" and self.distances is not None:
+            return self.distances
+        if column == "score" and self.scores is not None:
+            return self.scores
+        if column in self.metadata_columns:
+            return [(metadata or {}).get(column) for metadata in self.metadatas]
+        raise KeyError(column)
+
+    def __setitem__(self, column, value):
+        self.to_pandas()[column] = value
+        self._edited = True
+
+    def __iter__(self):
+        return iter(self.columns)
+
+    def __contains__(self, column):
+        return column in self.columns
+
+    def rows(self):
+        """List of {column: value} dicts."""
+        if self._edited:
+            return self._frame.to_dict("records")
+        columns = {column: self[column] for column in self.columns}
+        return [{column: values[i] for column, values in columns.items()} for i in range(len(self))]
+
+    def to_dict(self):
+        """{column: {row index: value}}, the same layout as DataFrame.to_dict()."""
+        if self._edited:
+            return self._frame.to_dict()
+        return {column: dict(enumerate(self[column])) for column in self.columns}
+
+    def to_pandas(self):
+        if self._frame is None:
+            self._frame = pd.DataFrame({column: self[column] for column in self.columns})
+        return self._frame
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.to_pandas(), name)
+
+    def __repr__(self):
+        return repr(self.to_pandas())
+
 
 class VectorDB:
-    def __init__(self,path="database", collection_name="data", embedding_name='sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2'):
+    def __init__(self,path="database", collection_name="data", embedding_name='sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2', keyword_index_limit:Optional[int]=100_000):
+        """
+        keyword_index_limit bounds the in-memory BM25 index behind hybrid_query, which takes about 15 KB per
+        1000-character document (1.5 GB at the default 100k): larger collections are searched dense only.
+        None for no limit.
+        """
+        self.keyword_index_limit = keyword_index_limit
         self.embedding_model = SentenceTransformer(embedding_name)
-        client = chromadb.PersistentClient(path=path)
-        self.db = client.get_or_create_collection(collection_name,embedding_function=CustomEmbeddingFunction(self.embedding_model))
+        # path=None keeps the collection in memory
+        self.client = chromadb.PersistentClient(path=path) if path is not None else chromadb.EphemeralClient()
+        self.db = self.client.get_or_create_collection(collection_name,embedding_function=CustomEmbeddingFunction(self.embedding_model))
+        self._keyword_index = None
+        self._keyword_index_count = None
+        self._keyword_index_lock = Lock()
+        self._rerankers = {}
         print("Loaded successfully")
+
+    @property
+    def keyword_index(self):
+        """
+        BM25Index of the collection's documents, None above keyword_index_limit documents. Built on first use,
+        kept in sync by this instance's add_or_update, ingest and delete, and rebuilt when the collection's
+        count changed behind its back (another process or VectorDB instance, e.g. the indexer CLI). Edits made
+        elsewhere that keep the count need refresh_keyword_index().
+        """
+        with self._keyword_index_lock:
+            count = self.db.count()
+            if self.keyword_index_limit is not None and count > self.keyword_index_limit:
+                self._keyword_index = None
+                return None
+            if self._keyword_index is None or self._keyword_index_count != count:
+                index = BM25Index()
+                page = 10000
+                for offset in range(0, count, page):
+                    result = self.db.get(limit=page, offset=offset, include=["documents"])
+                    index.add(result["ids"], result["documents"])
+                self._keyword_index = index
+                self._keyword_index_count = count
+            return self._keyword_index
+
+    def refresh_keyword_index(self):
+        """Drops the keyword index, the next hybrid_query rebuilds it from the collection."""
+        with self._keyword_index_lock:
+            self._keyword_index = None
+
+    def _index_documents(self, ids, documents=None, remove=False):
+        with self._keyword_index_lock:
+            if self._keyword_index is None:
+                return
+            if remove:
+                self._keyword_index.remove(ids)
+            elif documents is not None:
+                self._keyword_index.add(ids, documents)
+            self._keyword_index_count = self.db.count()
     
-    def generate_unique_ids(self,existing_ids, num_ids, id_length=10,time_out=60):
-        characters = '0123456789'
-        new_ids = []
-        start_time = time.time()
-        while len(new_ids) < num_ids:
-            new_id = ''.join(random.choices(characters, k=id_length))
-            if new_id not in existing_ids and new_id not in new_ids:new_ids.append(new_id)
-            if time.time() - start_time > time_out: break
-        return new_ids
-    
+    def generate_unique_ids(self,existing_ids=None, num_ids=1, id_length=None,time_out=None):
+        """Random collision-free ids (uuid4 hex), existing_ids, id_length and time_out are ignored."""
+        return [uuid.uuid4().hex for _ in range(num_ids)]
+
+    @staticmethod
+    def content_id(content):
+        """Stable id of a document, embedding, uri or image: equal contents get equal ids."""
+        if isinstance(content, str):
+            data = content.encode("utf-8")
+        elif isinstance(content, np.ndarray):
+            data = np.ascontiguousarray(content).tobytes()
+        else:
+            data = np.asarray(content, dtype=np.float32).tobytes()
+        return hashlib.sha256(data).hexdigest()[:32]
+
+    def make_ids(self, contents, id_scheme: Literal["uuid","hash"]="uuid"):
+        if id_scheme == "hash":
+            return [self.content_id(content) for content in contents]
+        if id_scheme == "uuid":
+            return self.generate_unique_ids(num_ids=len(contents))
+        raise ValueError(f"Unknown id_scheme {id_scheme}, use 'uuid' or 'hash'")
+
+    def _new_rows(self, ids):
+        """Indices of ids that are neither in the collection nor repeated earlier in ids (looked up by id, no scan)."""
+        existing = set(self.db.get(ids=list(dict.fromkeys(ids)), include=[])["ids"]) if ids else set()
+        return self._first_rows(ids, existing)
+
+    @staticmethod
+    def _first_rows(ids, seen=None):
+        """Indices of the first occurrence of each id, skipping ids in seen."""
+        seen = set() if seen is None else seen
+        keep = []
+        for i, id_ in enumerate(ids):
+            if id_ not in seen:
+                seen.add(id_)
+                keep.append(i)
+        return keep
+
+    @staticmethod
+    def _as_list(value, single):
+        if value is None or not single(value):
+            return value
+        return [value]
+
     def add_or_update(self, 
         ids: OneOrMany[ID]=None,
         embeddings: Optional[Union[OneOrMany[Embedding],OneOrMany[np.ndarray],]] = None,
         metadatas: Optional[OneOrMany[Metadata]] = None,
         documents: Optional[OneOrMany[Document]] = None,
         images: Optional[OneOrMany[Image]] = None,
-        uris: Optional[OneOrMany[URI]] = None,):
+        uris: Optional[OneOrMany[URI]] = None,
+        id_scheme: Literal["uuid","hash"] = "uuid",
+        dedup: bool = False,):
+        """
+        Upserts records. Without ids, ids are generated without reading the collection: random (id_scheme="uuid")
+        or a hash of the document / embedding / uri / image (id_scheme="hash"), repeated contents are then
+        written once.
+
+        With dedup=True, records whose id is already in the collection (or repeated in the call) are skipped,
+        ids default to content hashes, so adding the same document again is a no-op.
+
+        Returns:
+            List[str]: Ids written.
+        """
+        ids = self._as_list(ids, lambda v: isinstance(v, str))
+        documents = self._as_list(documents, lambda v: isinstance(v, str))
+        uris = self._as_list(uris, lambda v: isinstance(v, str))
+        metadatas = self._as_list(metadatas, lambda v: isinstance(v, dict))
+        embeddings = self._as_list(
+            embeddings, lambda v: np.ndim(v) == 1 if isinstance(v, np.ndarray) else len(v) > 0 and np.isscalar(v[0])
+        )
+        images = self._as_list(images, lambda v: isinstance(v, np.ndarray) and v.ndim == 3)
+        if ids is None:
+            contents = next((c for c in (documents, embeddings, uris, images) if c is not None), None)
+            if contents is None:
+                raise ValueError("ids, documents, embeddings, uris or images are required")
+            id_scheme = "hash" if dedup else id_scheme
+            ids = self.make_ids(contents, id_scheme)
+            # equal contents hash to one id, which Chroma rejects twice in one upsert
+            keep = self._first_rows(ids) if id_scheme == "hash" else None
+        else:
+            keep = None
+
+        if dedup:
+            keep = self._new_rows(ids)
+        if keep is not None:
+            if len(keep) < len(ids):
+                pick = lambda values: None if values is None else [values[i] for i in keep]
+                ids, embeddings, metadatas, documents, images, uris = map(pick, (ids, embeddings, metadatas, documents, images, uris))
+            if not ids:
+                return []
+        self.db.upsert(ids=ids,embeddings=embeddings,metadatas=metadatas,documents=documents,images=images,uris=uris)
+        self._index_documents(ids, documents)
+        return ids
+
+    def ingest(self,
+        documents: Iterable[Document],
+        ids: Optional[Iterable[ID]] = None,
+        metadatas: Optional[Iterable[Metadata]] = None,
+        batch_size: int = 1024,
+        encode_batch_size: int = 64,
+        prefetch: int = 2,
+        normalize_embeddings: bool = False,
+        id_scheme: Literal["uuid","hash"] = "uuid",
+        dedup: bool = False,):
+        """
+        Streams documents into the collection. Batches are embedded on a background thread while the
+        previous batch is upserted, embeddings are passed to Chroma as float32 arrays.
+
+        Args:
+            documents (Iterable[str]): Any iterable, e.g. a generator reading files, consumed once.
+            ids (Iterable[str] | None): Ids in the same order, generated per id_scheme when None.
+            metadatas (Iterable[dict] | None): Metadata in the same order.
+            batch_size (int): Documents per upsert, capped at the client's maximum batch size.
+            encode_batch_size (int): Batch size of SentenceTransformer.encode.
+            prefetch (int): Embedded batches that may wait for the writer.
+            normalize_embeddings (bool): L2-normalise the embeddings.
+            id_scheme (str): "uuid" for random ids, "hash" for ids derived from the document text.
+            dedup (bool): Skip documents whose id is already stored (content hash ids by default) before
+                embedding them, re-ingesting the same documents is then a no-op.
+
+        Returns:
+            dict: documents (written), skipped, seconds and documents_per_second.
+        """
+        get_max_batch_size = getattr(self.client, "get_max_batch_size", None)
+        if get_max_batch_size is not None:
+            batch_size = min(batch_size, get_max_batch_size())
+        rows = zip(documents, repeat(None) if ids is None else ids, repeat(None) if metadatas is None else metadatas)
+        batches = queue.Queue(maxsize=max(prefetch, 1))
+        stop = Event()
+        skipped = [0]
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    batches.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    pass
+
+        def embed():
+            try:
+                while not stop.is_set():
+                    batch = list(islice(rows, batch_size))
+                    if not batch:
+                        break
+                    if ids is None:
+                        generated = self.make_ids([row[0] for row in batch], "hash" if dedup else id_scheme)
+                        batch = [(row[0], id_, row[2]) for row, id_ in zip(batch, generated)]
+                        if id_scheme == "hash" and not dedup:
+                            total = len(batch)
+                            batch = [batch[i] for i in self._first_rows(generated)]
+                            skipped[0] += total - len(batch)
+                    if dedup:
+                        total = len(batch)
+                        batch = [batch[i] for i in self._new_rows([row[1] for row in batch])]
+                        skipped[0] += total - len(batch)
+                        if not batch:
+                            continue
+                    docs = [row[0] for row in batch]
+                    batch_ids = [row[1] for row in batch]
+                    batch_metadatas = [row[2] for row in batch] if metadatas is not None else None
+                    embeddings = self.embedding_model.encode(
+                        docs,
+                        batch_size=encode_batch_size,
+                        convert_to_numpy=True,
+                        normalize_embeddings=normalize_embeddings,
+                        show_progress_bar=False,
+                    )
+                    put((batch_ids, docs, batch_metadatas, embeddings))
+                put(None)
+            except BaseException as e:
+                put(e)
+
+        start = time.perf_counter()
+        count = 0
+        thread = Thread(target=embed, daemon=True)
+        thread.start()
         try:
-            if ids==None:
-                if embeddings != None:
-                    ids=self.generate_unique_ids(list(self.get(on_dict=True)["id"].values()),len(embeddings))
-                elif documents != None:
-                    ids=self.generate_unique_ids(list(self.get(on_dict=True)["id"].values()),len(documents))
-            self.db.upsert(ids=ids,embeddings=embeddings,metadatas=metadatas,documents=documents,images=images,uris=uris)
-        except Exception as e:
-            raise e
-            
+            while True:
+                item = batches.get()
+                if item is None:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                batch_ids, docs, batch_metadatas, embeddings = item
+                if not _NUMPY_EMBEDDINGS:
+                    embeddings = embeddings.tolist()
+                self.db.upsert(ids=batch_ids, embeddings=embeddings, metadatas=batch_metadatas, documents=docs)
+                self._index_documents(batch_ids, docs)
+                count += len(docs)
+        finally:
+            stop.set()
+            thread.join()
+        seconds = time.perf_counter() - start
+        return {
+            "documents": count,
+            "skipped": skipped[0],
+            "seconds": seconds,
+            "documents_per_second": count / seconds if seconds else 0.0,
+        }
             
+    def index_directory(self, root, manifest_path="index_manifest.json", **kwargs):
+        """
+        Incrementally indexes the text, markdown and PDF files under root: only new or changed chunks are
+        embedded, chunks of changed or deleted files are removed. kwargs go to Indexer (chunk_size, overlap, workers, ...).
+
+        Returns:
+            dict: See Indexer.sync.
+        """
+        return Indexer(self, manifest_path, **kwargs).sync(root)
+
     def query(self,
         query_embeddings: Optional[Union[OneOrMany[Embedding],OneOrMany[np.ndarray],]] = None,
         query_texts: Optional[OneOrMany[Document]] = None,
@@ -76,23 +413,119 @@ class VectorDB:
         include: Include = ["metadatas", "documents", "distances"],
         on_dict:bool=False,
         metadata_columns:list[str]=None):
+        """Nearest records of the (first) query as Records, or as {column: {row: value}} with on_dict=True."""
+        out = self.query_batch(query_embeddings=query_embeddings,query_texts=query_texts,query_images=query_images,query_uris=query_uris,n_results=n_results,where=where,where_document=where_document,include=include,metadata_columns=metadata_columns)[0]
+        return out if not on_dict else out.to_dict()
+
+    def query_batch(self,
+        query_embeddings: Optional[Union[OneOrMany[Embedding],OneOrMany[np.ndarray],]] = None,
+        query_texts: Optional[OneOrMany[Document]] = None,
+        query_images: Optional[OneOrMany[Image]] = None,
+        query_uris: Optional[OneOrMany[URI]] = None,
+        n_results: int = 10,
+        where: Optional[Where] = None,
+        where_document: Optional[WhereDocument] = None,
+        include: Include = ["metadatas", "documents", "distances"],
+        metadata_columns:list[str]=None):
+        """Runs many queries in one call (one embedding batch, one Chroma request), returns one Records per query."""
         result = self.db.query(query_embeddings=query_embeddings,query_texts=query_texts,query_images=query_images,query_uris=query_uris,n_results=n_results,where=where,where_document=where_document,include=include)
-        data_df={
-            "id":result["ids"][0],
-            "document":result["documents"][0],
-            "distance":result["distances"][0],
-        }
-        if metadata_columns != None:out=pd.concat([pd.DataFrame(data_df),pd.DataFrame(result["metadatas"][0])[metadata_columns]],axis=1)
+        column = lambda name, i: result[name][i] if result.get(name) is not None else None
+        return [
+            Records(ids, column("documents", i), column("metadatas", i), column("distances", i), metadata_columns)
+            for i, ids in enumerate(result["ids"])
+        ]
+
+    def hybrid_query(self,
+        query_text: str,
+        n_results: int = 10,
+        where: Optional[Where] = None,
+        where_document: Optional[WhereDocument] = None,
+        include: Include = ["metadatas", "documents"],
+        query_embedding: Optional[Union[Embedding,np.ndarray]] = None,
+        candidates: int = 50,
+        rrf_k: int = 60,
+        reranker = None,
+        rerank_top_k: int = 20,
+        metadata_columns: list[str] = None):
+        """
+        Dense search and BM25 keyword search (see keyword_index) fused with reciprocal-rank fusion, so exact
+        terms such as product codes are found without raising n_results. With a reranker the best rerank_top_k
+        fused records are re-scored by a cross-encoder.
+
+        Args:
+            query_text (str): The question.
+            n_results (int): Records returned.
+            where, where_document: Filters applied to both searches.
+            include (List[str]): "documents" and / or "metadatas".
+            query_embedding (Embedding | None): Embedding of query_text when already computed.
+            candidates (int): Records taken from each search before fusion.
+            rrf_k (int): Rank smoothing of the fusion, 60 is the usual value.
+            reranker (str | CrossEncoder | None): sentence-transformers CrossEncoder or its model name.
+            rerank_top_k (int): Fused records scored by the reranker.
+
+        Returns:
+            Records: With a score column, the fused score, or the reranker's score with a reranker.
+        """
+        if query_embedding is not None:
+            dense = self.db.query(query_embeddings=[query_embedding],n_results=candidates,where=where,where_document=where_document,include=[])
         else:
-            try:out=pd.concat([pd.DataFrame(data_df),pd.DataFrame(result["metadatas"][0])],axis=1).drop(columns=0)
-            except:out=pd.concat([pd.DataFrame(data_df),pd.DataFrame(result["metadatas"][0])],axis=1)
-        return out if not on_dict else out.to_dict()
+            dense = self.db.query(query_texts=[query_text],n_results=candidates,where=where,where_document=where_document,include=[])
+        filtered = where is not None or where_document is not None
+        keyword_index = self.keyword_index
+        if keyword_index is None:
+            warnings.warn(f"Collection is larger than keyword_index_limit={self.keyword_index_limit}, hybrid_query searches dense only")
+            keyword = []
+        else:
+            keyword = [id_ for id_, _ in keyword_index.search(query_text, candidates * 20 if filtered else candidates)]
+        if filtered and keyword:
+            allowed = set(self.db.get(ids=keyword,where=where,where_document=where_document,include=[])["ids"])
+            keyword = [id_ for id_ in keyword if id_ in allowed][:candidates]
+
+        fused = reciprocal_rank_fusion([dense["ids"][0], keyword], k=rrf_k)
+        fused = fused[: max(n_results, rerank_top_k) if reranker is not None else n_results]
+        ids = [id_ for id_, _ in fused]
+        scores = [score for _, score in fused]
+        fetch = list(include) + ["documents"] * (reranker is not None and "documents" not in include)
+        result = self.db.get(ids=ids, include=fetch) if ids else {"ids": []}
+        position = {id_: i for i, id_ in enumerate(result["ids"])}
+        missing = [id_ for id_ in ids if id_ not in position]
+        if missing:
+            # keyword hits deleted through another process or instance
+            self._index_documents(missing, remove=True)
+            scores = [score for id_, score in zip(ids, scores) if id_ in position]
+            ids = [id_ for id_ in ids if id_ in position]
+        column = lambda name: [result[name][position[id_]] for id_ in ids] if name in fetch else None
+        documents, metadatas = column("documents"), column("metadatas")
+
+        if reranker is not None and ids:
+            rerank_scores = self._cross_encoder(reranker).predict([(query_text, document or "") for document in documents], show_progress_bar=False)
+            order = sorted(range(len(ids)), key=lambda i: rerank_scores[i], reverse=True)[:n_results]
+            pick = lambda values: None if values is None else [values[i] for i in order]
+            ids, documents, metadatas = pick(ids), pick(documents), pick(metadatas)
+            scores = [float(rerank_scores[i]) for i in order]
+        if "documents" not in include:
+            documents = None
+        return Records(ids, documents, metadatas, metadata_columns=metadata_columns, scores=scores)
+
+    def _cross_encoder(self, reranker):
+        if not isinstance(reranker, str):
+            return reranker
+        if reranker not in self._rerankers:
+            from sentence_transformers import CrossEncoder
+            self._rerankers[reranker] = CrossEncoder(reranker)
+        return self._rerankers[reranker]
     
     def delete(self,
         ids: Optional[IDs] = None,
         where: Optional[Where] = None,
         where_document: Optional[WhereDocument] = None,):
+        ids = self._as_list(ids, lambda v: isinstance(v, str))
+        if self._keyword_index is not None and (where is not None or where_document is not None):
+            ids = self.db.get(ids=ids,where=where,where_document=where_document,include=[])["ids"]
+            if not ids:
+                return
         self.db.delete(ids=ids,where=where,where_document=where_document)
+        self._index_documents(ids if ids is not None else [], remove=True)
     
     def get(self,  
         ids: Optional[OneOrMany[ID]] = None,
@@ -103,11 +536,7 @@ class VectorDB:
         include: Include = ["metadatas", "documents"],
         on_dict:bool=False,metadata_columns:list[str]=None):
         result=self.db.get(ids=ids,where=where,limit=limit,offset=offset,where_document=where_document,include=include)
-        data_df={"id":result["ids"],"document":result["documents"]}
-        if metadata_columns != None:out=pd.concat([pd.DataFrame(data_df),pd.DataFrame(result["metadatas"])[metadata_columns]],axis=1)
-        else:
-            try:out=pd.concat([pd.DataFrame(data_df),pd.DataFrame(result["metadatas"])],axis=1).drop(columns=0)
-            except:out=pd.concat([pd.DataFrame(data_df),pd.DataFrame(result["metadatas"])],axis=1)
+        out=Records(result["ids"],result.get("documents"),result.get("metadatas"),metadata_columns=metadata_columns)
         return out if not on_dict else out.to_dict()
         
     
@@ -5,7 +5,8 @@ from typing import Any, Dict, List, Union,Literal
 from datasets import load_dataset, Audio
 from transformers import pipeline
 import evaluate
-import torch,torchaudio
+import torch
+from ..tools.audio_frontend import load_audio
 import warnings
 
 if torch.cuda.is_available():
@@ -202,11 +203,7 @@ class Whisper:
         except:model=self.base_model
 
         if type(audio)==str:
-            waveform, original_sample_rate = torchaudio.load(audio)
-            target_sample_rate = 16000
-            if original_sample_rate != target_sample_rate:
-                resampler = torchaudio.transforms.Resample(orig_freq=original_sample_rate, new_freq=target_sample_rate)
-                waveform = resampler(waveform)
+            waveform, _ = load_audio(audio, target_sr=16000)
             audio = waveform.numpy()
             
         if self.device=="cuda":
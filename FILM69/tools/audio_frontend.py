@@ -0,0 +1,76 @@
+from functools import lru_cache
+
+import torch
+import torchaudio
+
+
+@lru_cache(maxsize=64)
+def _get_resampler(orig_sr, target_sr, dtype, device):
+    return torchaudio.transforms.Resample(orig_sr, target_sr, dtype=dtype).to(device)
+
+
+def get_resampler(orig_sr, target_sr, dtype=torch.float32, device="cpu"):
+    """
+    Memoised torchaudio Resample, the sinc kernel is built once per (orig_sr, target_sr, dtype, device).
+    """
+    return _get_resampler(int(orig_sr), int(target_sr), dtype, str(torch.device(device)))
+
+
+def to_mono(audio):
+    """Down-mixes a channels x samples tensor to 1 x samples, 1-D input is returned as is."""
+    if audio.ndim > 1 and audio.shape[0] > 1:
+        audio = torch.mean(audio, dim=0, keepdim=True)
+    return audio
+
+
+def resample(audio, orig_sr, target_sr):
+    if orig_sr == target_sr:
+        return audio
+    if not audio.is_floating_point():
+        audio = audio.float()
+    return get_resampler(orig_sr, target_sr, audio.dtype, audio.device)(audio)
+
+
+def resample_batch(clips, orig_srs, target_sr):
+    """
+    Resamples a list of mono clips, one padded call per distinct source rate.
+
+    Args:
+        clips (List[torch.Tensor]): 1-D or 1 x samples tensors.
+        orig_srs (int | List[int]): Sample rate of every clip, or one rate for all.
+        target_sr (int): Output sample rate.
+
+    Returns:
+        List[torch.Tensor]: 1-D resampled clips, in input order.
+    """
+    if isinstance(orig_srs, int):
+        orig_srs = [orig_srs] * len(clips)
+
+    groups = {}
+    for i, (clip, sr) in enumerate(zip(clips, orig_srs)):
+        groups.setdefault(int(sr), []).append(i)
+
+    out = [None] * len(clips)
+    for sr, group in groups.items():
+        group_clips = [to_mono(clips[i]).reshape(-1) for i in group]
+        if sr == target_sr:
+            for i, clip in zip(group, group_clips):
+                out[i] = clip
+            continue
+        lengths = [clip.shape[-1] for clip in group_clips]
+        padded = torch.nn.utils.rnn.pad_sequence(group_clips, batch_first=True)
+        resampled = resample(padded, sr, target_sr)
+        for i, clip, length in zip(group, resampled, lengths):
+            out[i] = clip[: -(-target_sr * length // sr)]  # ceil, as torchaudio sizes its output
+    return out
+
+
+def load_audio(path, target_sr=None, mono=True):
+    """Loads an audio file as channels x samples, optionally down-mixed and resampled, returns (audio, sr)."""
+    audio, sr = torchaudio.load(path)
+    if mono:
+        audio = to_mono(audio)
+    if target_sr is not None and sr != target_sr:
+        audio = resample(audio, sr, target_sr)
+        sr = target_sr
+    return audio, sr
@@ -123,6 +123,9 @@ class F5TTS:
         file_wave=None,
         file_spect=None,
         seed=-1,
+        fuse_cfg=False,
+        cfg_schedule=None,
+        cfg_schedule_t=0.8,
     ):
         if seed == -1:
             seed = random.randint(0, sys.maxsize)
@@ -148,6 +151,9 @@ class F5TTS:
             speed=speed,
             fix_duration=fix_duration,
             device=self.device,
+            fuse_cfg=fuse_cfg,
+            cfg_schedule=cfg_schedule,
+            cfg_schedule_t=cfg_schedule_t,
         )
 
         if file_wave is not None:
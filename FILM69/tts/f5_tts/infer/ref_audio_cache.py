@@ -0,0 +1,131 @@
+# On-disk LRU cache for reference audio preprocessing, shared across processes and restarts
+# entry layout in cache_dir: <key>.wav (clipped reference, what callers get as ref_audio path) + <key>.pt (tensors/text)
+
+import hashlib
+import os
+import tempfile
+from collections import OrderedDict
+from threading import Lock
+
+import torch
+
+
+def content_hash(*parts):
+    md5 = hashlib.md5()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode("utf-8")
+        elif not isinstance(part, (bytes, bytearray, memoryview)):
+            part = repr(part).encode("utf-8")
+        md5.update(part)
+    return md5.hexdigest()
+
+
+def file_hash(path, *parts):
+    with open(path, "rb") as f:
+        return content_hash(f.read(), *parts)
+
+
+class RefAudioCache:
+    """
+    Persistent cache of preprocessed reference audio keyed by content hash.
+
+    Args:
+        cache_dir (str | None): Directory of the cache, defaults to $FILM69_REF_AUDIO_CACHE or ~/.cache/film69/ref_audio.
+        max_bytes (int): Disk budget, least recently used entries are removed beyond it.
+        max_memory_entries (int): Entries also kept loaded in this process.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=2 * 1024**3, max_memory_entries=32):
+        self.cache_dir = cache_dir or os.environ.get(
+            "FILM69_REF_AUDIO_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "film69", "ref_audio")
+        )
+        self.max_bytes = max_bytes
+        self.max_memory_entries = max_memory_entries
+        self._memory = OrderedDict()
+        self._lock = Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def wav_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.wav")
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pt")
+
+    def key_of_path(self, path):
+        """Returns the cache key if path is a reference wav stored in this cache, else None."""
+        if not isinstance(path, (str, os.PathLike)):
+            return None
+        directory, name = os.path.split(os.path.abspath(path))
+        if directory != os.path.abspath(self.cache_dir) or not name.endswith(".wav"):
+            return None
+        return name[: -len(".wav")]
+
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                entry = self._memory[key]
+            else:
+                try:
+                    entry = torch.load(self._entry_path(key), map_location="cpu", weights_only=True)
+                except (FileNotFoundError, EOFError, RuntimeError):
+                    return None
+                self._remember(key, entry)
+        try:
+            os.utime(self._entry_path(key))  # recency for LRU eviction
+        except FileNotFoundError:
+            pass
+        return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            self._remember(key, entry)
+            # write then rename, so concurrent processes never read a partial file
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            os.close(fd)
+            try:
+                torch.save(entry, tmp_path)
+                os.replace(tmp_path, self._entry_path(key))
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            self._evict()
+
+    def update(self, key, **fields):
+        entry = dict(self.get(key) or {})
+        entry.update(fields)
+        self.put(key, entry)
+        return entry
+
+    def _evict(self):
+        entries = {}
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            key, ext = os.path.splitext(name)
+            if ext not in (".pt", ".wav"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                continue
+            size, last_used = entries.get(key, (0, 0.0))
+            entries[key] = (size + stat.st_size, max(last_used, stat.st_mtime))
+            total += stat.st_size
+
+        for key, (size, _) in sorted(entries.items(), key=lambda item: item[1][1]):
+            if total <= self.max_bytes:
+                break
+            for path in (self._entry_path(key), self.wav_path(key)):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            self._memory.pop(key, None)
+            total -= size
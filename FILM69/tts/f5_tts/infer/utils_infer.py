@@ -1,14 +1,13 @@
 # A unified script for inference process
 # Make adjustments inside functions, and consider both gradio and cli scripts if need to change func output format
+import io
 import os
 import sys
 
 os.environ["PYTORCH_ENABLE_MPS_FALLBACK"] = "1"  # for MPS device compatibility
 sys.path.append(f"{os.path.dirname(os.path.abspath(__file__))}/../../third_party/BigVGAN/")
 
-import hashlib
 import re
-import tempfile
 from importlib.resources import files
 
 import matplotlib
@@ -23,16 +22,19 @@ from tqdm import autonotebook as tqdm
 # import tqdm
 from huggingface_hub import snapshot_download, hf_hub_download
 from pydub import AudioSegment, silence
+from torch.nn.utils.rnn import pad_sequence
 from transformers import pipeline
 from vocos import Vocos
 
+from FILM69.tools.audio_frontend import resample, to_mono
+from FILM69.tts.f5_tts.infer.ref_audio_cache import RefAudioCache, content_hash, file_hash
 from FILM69.tts.f5_tts.model import CFM
 from FILM69.tts.f5_tts.model.utils import (
     get_tokenizer,
     convert_char_to_pinyin,
 )
 
-_ref_audio_cache = {}
+_ref_audio_cache = None  # RefAudioCache, created on first use
 
 device = (
     "cuda"
@@ -57,6 +59,11 @@ cross_fade_duration = 0.15
 ode_method = "euler"
 nfe_step = 32  # 16, 32
 cfg_strength = 2.0
+fuse_cfg = False
+cfg_schedule = None  # None, "skip" or "cache"
+cfg_schedule_t = 0.8
+batch_size = 1  # chunks per ODE solve
+max_batch_frames = None
 sway_sampling_coef = -1.0
 speed = 1.0
 fix_duration = None
@@ -288,9 +295,30 @@ def remove_silence_edges(audio, silence_threshold=-42):
 # preprocess reference audio and text
 
 
+def get_ref_audio_cache():
+    global _ref_audio_cache
+    if _ref_audio_cache is None:
+        _ref_audio_cache = RefAudioCache()
+    return _ref_audio_cache
+
+
 def preprocess_ref_audio_text(ref_audio_orig, ref_text, clip_short=True, show_info=print, device=device):
-    show_info("Converting audio...")
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as f:
+    cache = get_ref_audio_cache()
+
+    # Compute a hash of the reference audio file, preprocessing result is cached on disk under it
+    if hasattr(ref_audio_orig, "read"):
+        # file object (upload, BytesIO): read it once, hash and decode the same bytes
+        ref_audio_orig = io.BytesIO(ref_audio_orig.read())
+        audio_hash = content_hash(ref_audio_orig.getvalue(), f"clip_short={clip_short}")
+    else:
+        audio_hash = file_hash(ref_audio_orig, f"clip_short={clip_short}")
+    ref_audio = cache.wav_path(audio_hash)
+    entry = cache.get(audio_hash)
+
+    if entry is not None and os.path.exists(ref_audio):
+        show_info("Using cached reference audio...")
+    else:
+        show_info("Converting audio...")
         aseg = AudioSegment.from_file(ref_audio_orig)
 
         if clip_short:
@@ -325,25 +353,22 @@ def preprocess_ref_audio_text(ref_audio_orig, ref_text, clip_short=True, show_in
                 show_info("Audio is over 15s, clipping short. (3)")
 
         aseg = remove_silence_edges(aseg) + AudioSegment.silent(duration=50)
-        aseg.export(f.name, format="wav")
-        ref_audio = f.name
-
-    # Compute a hash of the reference audio file
-    with open(ref_audio, "rb") as audio_file:
-        audio_data = audio_file.read()
-        audio_hash = hashlib.md5(audio_data).hexdigest()
+        aseg.export(ref_audio, format="wav")
+        # clipped waveform as torchaudio.load would decode it: channels x samples, scaled to [-1, 1)
+        samples = np.array(aseg.get_array_of_samples(), dtype=np.float32).reshape(-1, aseg.channels).T
+        audio = torch.from_numpy(samples / (1 << (8 * aseg.sample_width - 1)))
+        entry = cache.update(audio_hash, audio=audio, sr=aseg.frame_rate)
 
     if not ref_text.strip():
-        global _ref_audio_cache
-        if audio_hash in _ref_audio_cache:
+        if "ref_text" in entry:
             # Use cached asr transcription
             show_info("Using cached reference text...")
-            ref_text = _ref_audio_cache[audio_hash]
+            ref_text = entry["ref_text"]
         else:
             show_info("No reference text provided, transcribing reference audio...")
             ref_text = transcribe(ref_audio)
             # Cache the transcribed text (not caching custom ref_text, enabling users to do manual tweak)
-            _ref_audio_cache[audio_hash] = ref_text
+            cache.update(audio_hash, ref_text=ref_text)
     else:
         show_info("Using custom reference text...")
 
@@ -359,6 +384,53 @@ def preprocess_ref_audio_text(ref_audio_orig, ref_text, clip_short=True, show_in
     return ref_audio, ref_text
 
 
+# load reference audio, decoded waveform comes from the cache for preprocessed references
+
+
+def load_ref_audio(ref_audio):
+    cache = get_ref_audio_cache()
+    key = cache.key_of_path(ref_audio)
+    entry = cache.get(key) if key is not None else None
+    if entry is not None and "audio" in entry:
+        return entry["audio"], entry["sr"]
+    return torchaudio.load(ref_audio)
+
+
+# rms-normalised, resampled reference and its mel spectrogram, cached by audio content and mel settings
+
+
+def prepare_ref_audio(audio, sr, model_obj, target_rms=0.1, device=None):
+    audio = to_mono(audio)
+
+    mel_spec = model_obj.mel_spec
+    cache = get_ref_audio_cache()
+    key = content_hash(
+        audio.detach().cpu().numpy().tobytes(),
+        sr,
+        target_rms,
+        mel_spec.extractor.__name__,
+        mel_spec.n_fft,
+        mel_spec.hop_length,
+        mel_spec.win_length,
+        mel_spec.n_mel_channels,
+        mel_spec.target_sample_rate,
+    )
+    entry = cache.get(key)
+    if entry is not None and "cond" in entry:
+        return entry["audio"].to(device), entry["rms"], entry["cond"].to(device)
+
+    rms = torch.sqrt(torch.mean(torch.square(audio)))
+    if rms < target_rms:
+        audio = audio * target_rms / rms
+    audio = resample(audio, sr, target_sample_rate).to(device)
+
+    with torch.inference_mode():
+        cond = mel_spec(audio)[0].permute(1, 0)  # 1 d n -> n d
+
+    cache.put(key, dict(audio=audio.cpu(), rms=rms.cpu(), cond=cond.cpu()))
+    return audio, rms, cond
+
+
 # infer process: chunk text -> infer batches [i.e. infer_batch_process()]
 
 
@@ -380,9 +452,14 @@ def infer_process(
     speed=speed,
     fix_duration=fix_duration,
     device=device,
+    fuse_cfg=fuse_cfg,
+    cfg_schedule=cfg_schedule,
+    cfg_schedule_t=cfg_schedule_t,
+    batch_size=batch_size,
+    max_batch_frames=max_batch_frames,
 ):
     # Split the input text into batches
-    if type(ref_audio) == str:  audio, sr = torchaudio.load(ref_audio)
+    if type(ref_audio) == str:  audio, sr = load_ref_audio(ref_audio)
     else: audio = torch.tensor(np.array([ref_audio]))
         
     max_chars = int(len(ref_text.encode("utf-8")) / (audio.shape[-1] / sr) * (25 - audio.shape[-1] / sr))
@@ -408,6 +485,11 @@ def infer_process(
         speed=speed,
         fix_duration=fix_duration,
         device=device,
+        fuse_cfg=fuse_cfg,
+        cfg_schedule=cfg_schedule,
+        cfg_schedule_t=cfg_schedule_t,
+        batch_size=batch_size,
+        max_batch_frames=max_batch_frames,
     )
 
 
@@ -430,106 +512,249 @@ def infer_batch_process(
     speed=1,
     fix_duration=None,
     device=None,
+    fuse_cfg=False,
+    cfg_schedule=None,
+    cfg_schedule_t=0.8,
+    batch_size=1,
+    max_batch_frames=None,
 ):
-    audio, sr = ref_audio
-    if audio.shape[0] > 1:
-        audio = torch.mean(audio, dim=0, keepdim=True)
+    return infer_multi_process(
+        [(ref_audio, ref_text, gen_text_batches)],
+        model_obj,
+        vocoder,
+        mel_spec_type=mel_spec_type,
+        progress=progress,
+        target_rms=target_rms,
+        cross_fade_duration=cross_fade_duration,
+        nfe_step=nfe_step,
+        cfg_strength=cfg_strength,
+        sway_sampling_coef=sway_sampling_coef,
+        speed=speed,
+        fix_duration=fix_duration,
+        device=device,
+        fuse_cfg=fuse_cfg,
+        cfg_schedule=cfg_schedule,
+        cfg_schedule_t=cfg_schedule_t,
+        batch_size=batch_size,
+        max_batch_frames=max_batch_frames,
+    )[0]
+
+
+# infer chunks of several requests together: duration-bucketed batches -> one sample() call per bucket
 
-    rms = torch.sqrt(torch.mean(torch.square(audio)))
-    if rms < target_rms:
-        audio = audio * target_rms / rms
-    if sr != target_sample_rate:
-        resampler = torchaudio.transforms.Resample(sr, target_sample_rate)
-        audio = resampler(audio)
-    audio = audio.to(device)
 
-    generated_waves = []
-    spectrograms = []
+def bucket_by_duration(durations, batch_size=1, max_batch_frames=None):
+    """
+    Groups item indices into batches of similar duration to keep padding low.
+
+    Args:
+        durations (List[int]): Mel frame length of each item.
+        batch_size (int): Maximum number of items per batch.
+        max_batch_frames (int | None): Maximum padded frames (batch * longest) per batch.
+
+    Returns:
+        List[List[int]]: Item indices of each batch.
+    """
+    buckets = []
+    bucket = []
+    for idx in sorted(range(len(durations)), key=lambda i: durations[i]):
+        padded_frames = durations[idx] * (len(bucket) + 1)  # sorted, so current item is the longest
+        if bucket and (
+            len(bucket) >= batch_size or (max_batch_frames is not None and padded_frames > max_batch_frames)
+        ):
+            buckets.append(bucket)
+            bucket = []
+        bucket.append(idx)
+    if bucket:
+        buckets.append(bucket)
+    return buckets
+
+
+def infer_multi_process(
+    requests,
+    model_obj,
+    vocoder,
+    mel_spec_type="vocos",
+    progress=tqdm,
+    target_rms=0.1,
+    cross_fade_duration=0.15,
+    nfe_step=32,
+    cfg_strength=2.0,
+    sway_sampling_coef=-1,
+    speed=1,
+    fix_duration=None,
+    device=None,
+    fuse_cfg=False,
+    cfg_schedule=None,
+    cfg_schedule_t=0.8,
+    batch_size=8,
+    max_batch_frames=None,
+):
+    """
+    Synthesises the text chunks of several requests with batched ODE solves.
 
-    if len(ref_text[-1].encode("utf-8")) == 1:
-        ref_text = ref_text + " "
-    for i, gen_text in enumerate(progress.tqdm(gen_text_batches)):
-        # Prepare the text
-        text_list = [ref_text + gen_text]
-        final_text_list = convert_char_to_pinyin(text_list)
+    Args:
+        requests (List[Tuple]): (ref_audio, ref_text, gen_text_batches) per request, ref_audio being (audio, sr).
+        batch_size (int): Maximum number of chunks solved together.
+        max_batch_frames (int | None): Maximum padded mel frames per batch.
 
+    Returns:
+        List[Tuple]: (final_wave, sample_rate, combined_spectrogram) per request.
+    """
+    items = []
+    refs = []
+    for req_idx, (ref_audio, ref_text, gen_text_batches) in enumerate(requests):
+        audio, rms, cond = prepare_ref_audio(*ref_audio, model_obj, target_rms=target_rms, device=device)
+        refs.append((cond, rms))
+
+        if len(ref_text[-1].encode("utf-8")) == 1:
+            ref_text = ref_text + " "
         ref_audio_len = audio.shape[-1] // hop_length
-        if fix_duration is not None:
-            duration = int(fix_duration * target_sample_rate / hop_length)
-        else:
-            # Calculate duration
-            ref_text_len = len(ref_text.encode("utf-8"))
-            gen_text_len = len(gen_text.encode("utf-8"))
-            duration = ref_audio_len + int(ref_audio_len / ref_text_len * gen_text_len / speed)
+        for chunk_idx, gen_text in enumerate(gen_text_batches):
+            # Prepare the text
+            final_text = convert_char_to_pinyin([ref_text + gen_text])[0]
+
+            if fix_duration is not None:
+                duration = int(fix_duration * target_sample_rate / hop_length)
+            else:
+                # Calculate duration
+                ref_text_len = len(ref_text.encode("utf-8"))
+                gen_text_len = len(gen_text.encode("utf-8"))
+                duration = ref_audio_len + int(ref_audio_len / ref_text_len * gen_text_len / speed)
+            # same lower bound and clamp as CFM.sample, so the batch output can be split per item
+            duration = min(max(len(final_text) + 1, cond.shape[0] + 1, duration), 4096)
+
+            items.append(
+                dict(
+                    request=req_idx,
+                    chunk=chunk_idx,
+                    text=final_text,
+                    duration=duration,
+                    ref_audio_len=ref_audio_len,
+                )
+            )
+
+    generated_waves = [[None] * len(gen_text_batches) for _, _, gen_text_batches in requests]
+    spectrograms = [[None] * len(gen_text_batches) for _, _, gen_text_batches in requests]
+
+    buckets = bucket_by_duration([item["duration"] for item in items], batch_size, max_batch_frames)
+    for bucket in progress.tqdm(buckets):
+        batch = [items[i] for i in bucket]
+        cond = pad_sequence([refs[item["request"]][0] for item in batch], batch_first=True)
+        lens = torch.tensor([refs[item["request"]][0].shape[0] for item in batch], device=cond.device)
+        durations = torch.tensor([item["duration"] for item in batch], device=cond.device)
 
         # inference
         with torch.inference_mode():
             generated, _ = model_obj.sample(
-                cond=audio,
-                text=final_text_list,
-                duration=duration,
+                cond=cond,
+                text=[item["text"] for item in batch],
+                duration=durations,
+                lens=lens,
                 steps=nfe_step,
                 cfg_strength=cfg_strength,
                 sway_sampling_coef=sway_sampling_coef,
+                fuse_cfg=fuse_cfg,
+                cfg_schedule=cfg_schedule,
+                cfg_schedule_t=cfg_schedule_t,
             )
-
             generated = generated.to(torch.float32)
-            generated = generated[:, ref_audio_len:, :]
-            generated_mel_spec = generated.permute(0, 2, 1)
-            if mel_spec_type == "vocos":
-                generated_wave = vocoder.decode(generated_mel_spec)
-            elif mel_spec_type == "bigvgan":
-                generated_wave = vocoder(generated_mel_spec)
-            if rms < target_rms:
-                generated_wave = generated_wave * rms / target_rms
-
-            # wav -> numpy
-            generated_wave = generated_wave.squeeze().cpu().numpy()
-
-            generated_waves.append(generated_wave)
-            spectrograms.append(generated_mel_spec[0].cpu().numpy())
-
-    # Combine all generated waves with cross-fading
-    if cross_fade_duration <= 0:
-        # Simply concatenate
-        final_wave = np.concatenate(generated_waves)
-    else:
-        final_wave = generated_waves[0]
-        for i in range(1, len(generated_waves)):
-            prev_wave = final_wave
-            next_wave = generated_waves[i]
-
-            # Calculate cross-fade samples, ensuring it does not exceed wave lengths
-            cross_fade_samples = int(cross_fade_duration * target_sample_rate)
-            cross_fade_samples = min(cross_fade_samples, len(prev_wave), len(next_wave))
-
-            if cross_fade_samples <= 0:
-                # No overlap possible, concatenate
-                final_wave = np.concatenate([prev_wave, next_wave])
-                continue
-
-            # Overlapping parts
-            prev_overlap = prev_wave[-cross_fade_samples:]
-            next_overlap = next_wave[:cross_fade_samples]
-
-            # Fade out and fade in
-            fade_out = np.linspace(1, 0, cross_fade_samples)
-            fade_in = np.linspace(0, 1, cross_fade_samples)
-
-            # Cross-faded overlap
-            cross_faded_overlap = prev_overlap * fade_out + next_overlap * fade_in
-
-            # Combine
-            new_wave = np.concatenate(
-                [prev_wave[:-cross_fade_samples], cross_faded_overlap, next_wave[cross_fade_samples:]]
-            )
 
-            final_wave = new_wave
+            for item, item_generated in zip(batch, generated):
+                rms = refs[item["request"]][1]
+                item_generated = item_generated[item["ref_audio_len"] : item["duration"], :]
+                generated_mel_spec = item_generated.permute(1, 0).unsqueeze(0)
+                if mel_spec_type == "vocos":
+                    generated_wave = vocoder.decode(generated_mel_spec)
+                elif mel_spec_type == "bigvgan":
+                    generated_wave = vocoder(generated_mel_spec)
+                if rms < target_rms:
+                    generated_wave = generated_wave * rms / target_rms
+
+                # wav -> numpy
+                generated_waves[item["request"]][item["chunk"]] = generated_wave.squeeze().cpu().numpy()
+                spectrograms[item["request"]][item["chunk"]] = generated_mel_spec[0].cpu().numpy()
+
+    return [
+        (
+            CrossFadeStitcher(cross_fade_duration).stitch(waves),
+            target_sample_rate,
+            np.concatenate(spects, axis=1),  # Create a combined spectrogram
+        )
+        for waves, spects in zip(generated_waves, spectrograms)
+    ]
+
+
+# combine generated waves with cross-fading
+
 
-    # Create a combined spectrogram
-    combined_spectrogram = np.concatenate(spectrograms, axis=1)
+class CrossFadeStitcher:
+    """
+    Joins chunk waves with linear cross-fades of cross_fade_duration.
+
+    stitch() writes all chunks into one preallocated buffer; push()/flush() give the same samples incrementally,
+    holding back only each chunk's tail until the next chunk's overlap is known.
+    """
 
-    return final_wave, target_sample_rate, combined_spectrogram
+    def __init__(self, cross_fade_duration=0.15, sample_rate=target_sample_rate):
+        self.cross_fade_samples = max(int(cross_fade_duration * sample_rate), 0)
+        self._fades = {}
+        self._tail = None
+
+    def _fade(self, samples):
+        if samples not in self._fades:
+            self._fades[samples] = (
+                np.linspace(1, 0, samples, dtype=np.float32),  # fade out
+                np.linspace(0, 1, samples, dtype=np.float32),  # fade in
+            )
+        return self._fades[samples]
+
+    def stitch(self, waves):
+        if not waves:
+            return np.zeros(0, dtype=np.float32)
+
+        # overlap never exceeds the cross-fade, what is already stitched, or the next chunk
+        overlaps = []
+        total = 0
+        for wave in waves:
+            overlaps.append(min(self.cross_fade_samples, total, len(wave)))
+            total += len(wave) - overlaps[-1]
+        final_wave = np.empty(total, dtype=np.result_type(*waves))
+
+        pos = 0
+        for wave, overlap in zip(waves, overlaps):
+            if overlap:
+                fade_out, fade_in = self._fade(overlap)
+                cross_faded = final_wave[pos - overlap : pos]
+                cross_faded *= fade_out
+                cross_faded += wave[:overlap] * fade_in
+            final_wave[pos : pos + len(wave) - overlap] = wave[overlap:]
+            pos += len(wave) - overlap
+        return final_wave
+
+    def push(self, wave):
+        """Adds the next chunk, returns the samples that are now final."""
+        tail = self._tail
+        if tail is not None and len(tail):
+            overlap = min(len(tail), len(wave))
+            joined = np.empty(len(tail) + len(wave) - overlap, dtype=np.result_type(tail, wave))
+            joined[: len(tail)] = tail
+            if overlap:
+                fade_out, fade_in = self._fade(overlap)
+                cross_faded = joined[len(tail) - overlap : len(tail)]
+                cross_faded *= fade_out
+                cross_faded += wave[:overlap] * fade_in
+            joined[len(tail) :] = wave[overlap:]
+            wave = joined
+        keep = min(self.cross_fade_samples, len(wave))
+        self._tail = wave[len(wave) - keep :]
+        return wave[: len(wave) - keep]
+
+    def flush(self):
+        """Returns the held back tail and resets the stitcher."""
+        tail = self._tail if self._tail is not None else np.zeros(0, dtype=np.float32)
+        self._tail = None
+        return tail
 
 
 # remove silence from generated wav
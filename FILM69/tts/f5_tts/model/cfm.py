@@ -96,7 +96,15 @@ class CFM(nn.Module):
         duplicate_test=False,
         t_inter=0.1,
         edit_mask=None,
+        fuse_cfg=False,  # run conditional and null pass as one forward over a doubled batch
+        cfg_schedule: str | None = None,  # "skip" | "cache", null pass handling once t >= cfg_schedule_t
+        cfg_schedule_t=0.8,
     ):
+        # "skip": drop guidance on late steps, only the conditional pass runs
+        # "cache": reuse the last null prediction computed before t reached cfg_schedule_t
+        if cfg_schedule not in (None, "skip", "cache"):
+            raise ValueError(f"Unknown cfg_schedule: {cfg_schedule}")
+
         self.eval()
         # raw wave
 
@@ -156,20 +164,49 @@ class CFM(nn.Module):
 
         # neural ode
 
+        use_cfg = cfg_strength >= 1e-5
+        if use_cfg and fuse_cfg:
+            # null pass as extra batch items: zeroed cond audio and all-filler text (-1 + 1 = 0, same as drop_text)
+            fused_cond = torch.cat((step_cond, torch.zeros_like(step_cond)), dim=0)
+            fused_text = torch.cat((text, torch.full_like(text, -1)), dim=0)
+            fused_mask = torch.cat((mask, mask), dim=0) if exists(mask) else None
+
+        null_cache = {}  # last null prediction, for cfg_schedule="cache"
+
         def fn(t, x):
             # at each step, conditioning is fixed
             # step_cond = torch.where(cond_mask, cond, torch.zeros_like(cond))
 
-            # predict flow
-            pred = self.transformer(
-                x=x, cond=step_cond, text=text, time=t, mask=mask, drop_audio_cond=False, drop_text=False
-            )
-            if cfg_strength < 1e-5:
-                return pred
-
-            null_pred = self.transformer(
-                x=x, cond=step_cond, text=text, time=t, mask=mask, drop_audio_cond=True, drop_text=True
-            )
+            late_step = exists(cfg_schedule) and bool(t >= cfg_schedule_t)
+            if not use_cfg or (late_step and (cfg_schedule == "skip" or "null_pred" in null_cache)):
+                # predict flow
+                pred = self.transformer(
+                    x=x, cond=step_cond, text=text, time=t, mask=mask, drop_audio_cond=False, drop_text=False
+                )
+                if not use_cfg or cfg_schedule == "skip":
+                    return pred
+                return pred + (pred - null_cache["null_pred"]) * cfg_strength
+
+            if fuse_cfg:
+                pred, null_pred = self.transformer(
+                    x=torch.cat((x, x), dim=0),
+                    cond=fused_cond,
+                    text=fused_text,
+                    time=t,
+                    mask=fused_mask,
+                    drop_audio_cond=False,
+                    drop_text=False,
+                ).chunk(2, dim=0)
+            else:
+                pred = self.transformer(
+                    x=x, cond=step_cond, text=text, time=t, mask=mask, drop_audio_cond=False, drop_text=False
+                )
+                null_pred = self.transformer(
+                    x=x, cond=step_cond, text=text, time=t, mask=mask, drop_audio_cond=True, drop_text=True
+                )
+
+            if cfg_schedule == "cache":
+                null_cache["null_pred"] = null_pred
             return pred + (pred - null_pred) * cfg_strength
 
         # noise input
@@ -1,15 +1,20 @@
+import io
 import json,os
 from importlib.resources import files
 
+import numpy as np
+import soundfile as sf
 import torch
 import torch.nn.functional as F
-import torchaudio
+from datasets import Audio
 from datasets import Dataset as Dataset_
 from datasets import load_from_disk
 from torch import nn
 from torch.utils.data import Dataset, Sampler
 from tqdm.autonotebook import tqdm
 
+from FILM69.tools.audio_frontend import load_audio, resample
+from FILM69.tts.f5_tts.model.mel_store import MelStore, mel_settings
 from FILM69.tts.f5_tts.model.modules import MelSpec
 from FILM69.tts.f5_tts.model.utils import default
 
@@ -26,6 +31,7 @@ class HFDataset(Dataset):
         audio_column="audio",
         text_column="text",
         duration_column=None,
+        mel_store: MelStore | str | None = None,
     ):
         self.audio_column = audio_column
         self.text_column = text_column
@@ -43,21 +49,63 @@ class HFDataset(Dataset):
             target_sample_rate=target_sample_rate,
             mel_spec_type=mel_spec_type,
         )
+        self.mel_store = MelStore(mel_store) if isinstance(mel_store, str) else mel_store
+        if self.mel_store is not None:
+            self.mel_store.check(num_items=len(self.data), **mel_settings(self.mel_spectrogram))
+            # with a store, items never decode audio: only the text column is read
+            self._texts = self.data.select_columns([text_column])
 
     def get_frame_len(self, index):
-        row = self.data[index]
-        audio = row[self.audio_column]["array"]
-        sample_rate = row[self.audio_column]["sampling_rate"]
-        # return audio.shape[-1] / sample_rate * self.target_sample_rate / self.hop_length
-        if self.duration_column == None:
-            return (audio.shape[-1] / sample_rate) * self.target_sample_rate / self.hop_length
+        return self.get_frame_lens()[index]
+
+    def get_frame_lens(self, num_proc=None):
+        """Frame length of every row as a NumPy array, built once without decoding audio and cached beside the dataset."""
+        if getattr(self, "_frame_lens", None) is not None:
+            return self._frame_lens
+
+        if self.mel_store is not None:
+            frame_lens = self.mel_store.frame_lens.astype(np.float64)
+        elif self.duration_column is not None:
+            frame_lens = np.asarray(self.data[self.duration_column], dtype=np.float64)
+            frame_lens = frame_lens * self.target_sample_rate / self.hop_length
         else:
-            self.data[index][self.duration_column] * self.target_sample_rate / self.hop_length
-        
+            cache_path = None
+            if getattr(self.data, "cache_files", None):
+                cache_dir = os.path.dirname(self.data.cache_files[0]["filename"])
+                cache_path = os.path.join(
+                    cache_dir, f"frame_lens_{self.data._fingerprint}_{self.target_sample_rate}_{self.hop_length}.npy"
+                )
+            if cache_path is not None and os.path.exists(cache_path):
+                frame_lens = np.load(cache_path)
+            else:
+                durations = np.asarray(
+                    self.data.cast_column(self.audio_column, Audio(decode=False)).map(
+                        _audio_durations,
+                        batched=True,
+                        num_proc=default(num_proc, min(os.cpu_count() or 1, 16)) if len(self.data) > 10_000 else None,
+                        input_columns=[self.audio_column],
+                        remove_columns=self.data.column_names,
+                        desc="Indexing audio durations",
+                    )["duration"],
+                    dtype=np.float64,
+                )
+                for index in np.flatnonzero(np.isnan(durations)):  # header unreadable, decode the row
+                    audio = self.data[int(index)][self.audio_column]
+                    durations[index] = audio["array"].shape[-1] / audio["sampling_rate"]
+                frame_lens = durations * self.target_sample_rate / self.hop_length
+                if cache_path is not None:
+                    np.save(cache_path, frame_lens)
+
+        self._frame_lens = frame_lens
+        return frame_lens
+
     def __len__(self):
         return len(self.data)
 
     def __getitem__(self, index):
+        if self.mel_store is not None:
+            return self._stored_item(index)
+
         row = self.data[index]
         audio = row[self.audio_column]["array"]
 
@@ -72,24 +120,52 @@ class HFDataset(Dataset):
         if duration > 30 or duration < 0.3:
             return self.__getitem__((index + 1) % len(self.data))
 
-        audio_tensor = torch.from_numpy(audio).float()
+        mel_spec = self.get_mel_spec(index, row)
+
+        text = row[self.text_column]
 
-        if sample_rate != self.target_sample_rate:
-            resampler = torchaudio.transforms.Resample(sample_rate, self.target_sample_rate)
-            audio_tensor = resampler(audio_tensor)
+        return dict(
+            mel_spec=mel_spec,
+            text=text,
+        )
+
+    def _stored_item(self, index):
+        # same duration filter as above, durations from the stored frame counts; failed extractions are skipped
+        for _ in range(len(self.mel_store)):
+            duration = self.mel_store.frame_lens[index] * self.hop_length / self.target_sample_rate
+            if self.mel_store.has(index) and 0.3 <= duration <= 30:
+                break
+            index = (index + 1) % len(self.mel_store)
+        return dict(
+            mel_spec=self.mel_store[index],
+            text=self._texts[index][self.text_column],
+        )
+
+    def get_mel_spec(self, index, row=None):
+        row = default(row, self.data[index])
+        audio = row[self.audio_column]["array"]
+        sample_rate = row[self.audio_column]["sampling_rate"]
+
+        audio_tensor = torch.from_numpy(audio).float()
+        audio_tensor = resample(audio_tensor, sample_rate, self.target_sample_rate)
 
         audio_tensor = audio_tensor.unsqueeze(0)  # 't -> 1 t')
 
         mel_spec = self.mel_spectrogram(audio_tensor)
 
-        mel_spec = mel_spec.squeeze(0)  # '1 d t -> d t'
+        return mel_spec.squeeze(0)  # '1 d t -> d t'
 
-        text = row[self.text_column]
 
-        return dict(
-            mel_spec=mel_spec,
-            text=text,
-        )
+def _audio_durations(audios):
+    # read lengths from the encoded file headers, nan if soundfile cannot parse it
+    durations = []
+    for audio in audios:
+        try:
+            info = sf.info(io.BytesIO(audio["bytes"]) if audio.get("bytes") else audio["path"])
+            durations.append(info.frames / info.samplerate)
+        except Exception:
+            durations.append(float("nan"))
+    return {"duration": durations}
 
 
 class CustomDataset(Dataset):
@@ -105,6 +181,7 @@ class CustomDataset(Dataset):
         mel_spec_type="vocos",
         preprocessed_mel=False,
         mel_spec_module: nn.Module | None = None,
+        mel_store: MelStore | str | None = None,
     ):
         self.data = custom_dataset
         self.durations = durations
@@ -113,9 +190,20 @@ class CustomDataset(Dataset):
         self.n_fft = n_fft
         self.win_length = win_length
         self.mel_spec_type = mel_spec_type
-        self.preprocessed_mel = preprocessed_mel
+        self.mel_store = MelStore(mel_store) if isinstance(mel_store, str) else mel_store
+        if self.mel_store is not None:
+            self.mel_store.check(
+                num_items=len(self.data),
+                n_mel_channels=n_mel_channels,
+                hop_length=hop_length,
+                n_fft=n_fft,
+                win_length=win_length,
+                target_sample_rate=target_sample_rate,
+                mel_spec_type=mel_spec_type,
+            )
+        self.preprocessed_mel = preprocessed_mel or self.mel_store is not None
 
-        if not preprocessed_mel:
+        if not self.preprocessed_mel:
             self.mel_spectrogram = default(
                 mel_spec_module,
                 MelSpec(
@@ -129,12 +217,20 @@ class CustomDataset(Dataset):
             )
 
     def get_frame_len(self, index):
+        if self.mel_store is not None:
+            return self.mel_store.index[index, 2]
         if (
             self.durations is not None
         ):  # Please make sure the separately provided durations are correct, otherwise 99.99% OOM
             return self.durations[index] * self.target_sample_rate / self.hop_length
         return self.data[index]["duration"] * self.target_sample_rate / self.hop_length
 
+    def get_frame_lens(self):
+        if self.mel_store is not None:
+            return self.mel_store.frame_lens.astype(np.float64)
+        durations = self.durations if self.durations is not None else self.data["duration"]
+        return np.asarray(durations, dtype=np.float64) * self.target_sample_rate / self.hop_length
+
     def __len__(self):
         return len(self.data)
 
@@ -145,35 +241,33 @@ class CustomDataset(Dataset):
             text = row["text"]
             duration = row["duration"]
 
-            # filter by given length
-            if 0.3 <= duration <= 30:
+            # filter by given length, and items whose mel extraction failed
+            if 0.3 <= duration <= 30 and (self.mel_store is None or self.mel_store.has(index)):
                 break  # valid
 
             index = (index + 1) % len(self.data)
 
-        if self.preprocessed_mel:
+        if self.mel_store is not None:
+            mel_spec = self.mel_store[index]
+        elif self.preprocessed_mel:
             mel_spec = torch.tensor(row["mel_spec"])
         else:
-            audio, source_sample_rate = torchaudio.load(audio_path)
-
-            # make sure mono input
-            if audio.shape[0] > 1:
-                audio = torch.mean(audio, dim=0, keepdim=True)
-
-            # resample if necessary
-            if source_sample_rate != self.target_sample_rate:
-                resampler = torchaudio.transforms.Resample(source_sample_rate, self.target_sample_rate)
-                audio = resampler(audio)
-
-            # to mel spectrogram
-            mel_spec = self.mel_spectrogram(audio)
-            mel_spec = mel_spec.squeeze(0)  # '1 d t -> d t'
+            mel_spec = self.get_mel_spec(index, row)
 
         return {
             "mel_spec": mel_spec,
             "text": text,
         }
 
+    def get_mel_spec(self, index, row=None):
+        row = default(row, self.data[index])
+        # mono, resampled if necessary
+        audio, _ = load_audio(row["audio_path"], target_sr=self.target_sample_rate)
+
+        # to mel spectrogram
+        mel_spec = self.mel_spectrogram(audio)
+        return mel_spec.squeeze(0)  # '1 d t -> d t'
+
 
 # Dynamic Batch Sampler
 class DynamicBatchSampler(Sampler[list[int]]):
@@ -194,37 +288,47 @@ class DynamicBatchSampler(Sampler[list[int]]):
         self.random_seed = random_seed
         self.epoch = 0
 
-        indices, batches = [], []
         data_source = self.sampler.data_source
+        indices = np.fromiter(iter(self.sampler), dtype=np.int64)
+        if hasattr(data_source, "get_frame_lens"):
+            frame_lens = np.asarray(data_source.get_frame_lens(), dtype=np.float64)[indices]
+        else:
+            frame_lens = np.array(
+                [
+                    data_source.get_frame_len(idx)
+                    for idx in tqdm(
+                        indices, desc="Sorting with sampler... if slow, check whether dataset is provided with duration"
+                    )
+                ],
+                dtype=np.float64,
+            )
+        # items without frames, e.g. whose mel extraction failed in a mel store, can never be loaded
+        valid = frame_lens > 0
+        indices, frame_lens = indices[valid], frame_lens[valid]
+
+        order = np.argsort(frame_lens, kind="stable")
+        indices, frame_lens = indices[order], frame_lens[order]
+
+        # sorted, so items longer than the threshold are all at the end and never fit a batch
+        num_fit = int(np.searchsorted(frame_lens, frames_threshold, side="right"))
+        has_oversized = num_fit < len(indices)
+        indices, frame_lens = indices[:num_fit], frame_lens[:num_fit]
+
+        # greedy packing: each batch takes as many following items as fit, found by bisecting the running sum
+        cum_frames = np.concatenate(([0.0], np.cumsum(frame_lens)))
+        batches = []
+        start = 0
+        while start < num_fit:
+            end = int(np.searchsorted(cum_frames, cum_frames[start] + frames_threshold, side="right")) - 1
+            if max_samples > 0:
+                end = min(end, start + max_samples)
+            end = max(end, start + 1)
+            batches.append(indices[start:end].tolist())
+            start = end
+
+        if drop_last and batches and not has_oversized:  # an oversized item already closed the last batch
+            batches.pop()
 
-        for idx in tqdm(
-            self.sampler, desc="Sorting with sampler... if slow, check whether dataset is provided with duration"
-        ):
-            indices.append((idx, data_source.get_frame_len(idx)))
-        indices.sort(key=lambda elem: elem[1])
-
-        batch = []
-        batch_frames = 0
-        for idx, frame_len in tqdm(
-            indices, desc=f"Creating dynamic batches with {frames_threshold} audio frames per gpu"
-        ):
-            if batch_frames + frame_len <= self.frames_threshold and (max_samples == 0 or len(batch) < max_samples):
-                batch.append(idx)
-                batch_frames += frame_len
-            else:
-                if len(batch) > 0:
-                    batches.append(batch)
-                if frame_len <= self.frames_threshold:
-                    batch = [idx]
-                    batch_frames = frame_len
-                else:
-                    batch = []
-                    batch_frames = 0
-
-        if not drop_last and len(batch) > 0:
-            batches.append(batch)
-
-        del indices
         self.batches = batches
 
     def set_epoch(self, epoch: int) -> None:
@@ -260,10 +364,12 @@ def load_dataset(
     audio_column="audio",
     text_column="text",
     duration_column=None,
+    mel_store: MelStore | str | None = None,
 ) -> CustomDataset | HFDataset:
     """
     dataset_type    - "CustomDataset" if you want to use tokenizer name and default data path to load for train_dataset
                     - "CustomDatasetPath" if you just want to pass the full path to a preprocessed dataset without relying on tokenizer
+    mel_store       - path of a store written by mel_store.build_mel_store, mels are then read instead of extracted
     """
 
     print("Loading dataset ...")
@@ -289,6 +395,7 @@ def load_dataset(
             durations=durations,
             preprocessed_mel=preprocessed_mel,
             mel_spec_module=mel_spec_module,
+            mel_store=mel_store,
             **mel_spec_kwargs,
         )
 
@@ -302,7 +409,7 @@ def load_dataset(
             data_dict = json.load(f)
         durations = data_dict["duration"]
         train_dataset = CustomDataset(
-            train_dataset, durations=durations, preprocessed_mel=preprocessed_mel, **mel_spec_kwargs
+            train_dataset, durations=durations, preprocessed_mel=preprocessed_mel, mel_store=mel_store, **mel_spec_kwargs
         )
 
     elif dataset_type == "HFDataset":
@@ -319,6 +426,8 @@ def load_dataset(
             audio_column=audio_column,
             text_column=text_column,
             duration_column=duration_column,
+            mel_store=mel_store,
+            **mel_spec_kwargs,
         )
 
     return train_dataset
@@ -338,7 +447,7 @@ def collate_fn(batch):
         padded_spec = F.pad(spec, padding, value=0)
         padded_mel_specs.append(padded_spec)
 
-    mel_specs = torch.stack(padded_mel_specs)
+    mel_specs = torch.stack(padded_mel_specs).float()  # mel store items are float16
 
     text = [item["text"] for item in batch]
     text_lengths = torch.LongTensor([len(item) for item in text])
@@ -0,0 +1,159 @@
+# Precomputed mel-spectrogram feature store
+# shards of one flat float16 array each (mel_00000.f16, ...), every item stored as a contiguous d x t block,
+# plus index.npy (int64 rows of shard, offset, frames) and meta.json (mel settings)
+
+import json
+import os
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader, Dataset
+from tqdm.autonotebook import tqdm
+
+INDEX_FILE = "index.npy"
+META_FILE = "meta.json"
+
+
+def _shard_name(shard):
+    return f"mel_{shard:05d}.f16"
+
+
+def _mel_spec_type(name):
+    # older stores saved the extractor's function name
+    return "bigvgan" if "bigvgan" in name else "vocos"
+
+
+def mel_settings(mel_spectrogram):
+    """Settings of a MelSpec that a stored mel depends on, as saved in meta.json."""
+    return dict(
+        n_mel_channels=mel_spectrogram.n_mel_channels,
+        hop_length=mel_spectrogram.hop_length,
+        n_fft=mel_spectrogram.n_fft,
+        win_length=mel_spectrogram.win_length,
+        target_sample_rate=mel_spectrogram.target_sample_rate,
+        mel_spec_type=_mel_spec_type(mel_spectrogram.extractor.__name__),
+    )
+
+
+class MelStore:
+    """
+    Read-only view over a mel store written by build_mel_store. Items are zero-copy slices of memory-mapped shards.
+
+    Args:
+        path (str): Directory of the store.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META_FILE), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.n_mel_channels = self.meta["n_mel_channels"]
+        self.index = np.load(os.path.join(path, INDEX_FILE))
+        self._shards = {}  # opened lazily, so each dataloader worker maps its own view
+
+    def _shard(self, shard):
+        if shard not in self._shards:
+            # copy-on-write mapping: writable for torch.from_numpy, never written back to disk
+            self._shards[shard] = np.memmap(os.path.join(self.path, _shard_name(shard)), dtype=np.float16, mode="c")
+        return self._shards[shard]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_shards"] = {}
+        return state
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def frame_lens(self):
+        return self.index[:, 2]
+
+    def has(self, index):
+        """False for items whose extraction failed while building the store."""
+        return self.index[index, 0] >= 0
+
+    def check(self, num_items=None, **settings):
+        """
+        Raises ValueError when the store was built with other mel settings (keys of mel_settings) or for
+        another number of items than the dataset reading it.
+        """
+        stored = dict(self.meta, mel_spec_type=_mel_spec_type(self.meta.get("mel_spec_type", "")))
+        if num_items is not None:
+            settings["num_items"] = num_items
+        mismatched = {k: (stored.get(k), v) for k, v in settings.items() if stored.get(k) != v}
+        if mismatched:
+            details = ", ".join(f"{k}: store {a}, dataset {b}" for k, (a, b) in mismatched.items())
+            raise ValueError(f"Mel store {self.path} does not match the dataset ({details}), rebuild it with build_mel_store")
+
+    def __getitem__(self, index):
+        shard, offset, frames = (int(v) for v in self.index[index])
+        if shard < 0:
+            raise KeyError(f"No mel stored for item {index}")
+        data = self._shard(shard)[offset : offset + self.n_mel_channels * frames]
+        return torch.from_numpy(data).view(self.n_mel_channels, frames)  # d t, float16
+
+
+class _MelExtraction(Dataset):
+    def __init__(self, dataset):
+        self.dataset = dataset
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def __getitem__(self, index):
+        try:
+            mel = self.dataset.get_mel_spec(index)
+        except Exception as e:
+            print(f"Warning: failed to extract mel for item {index}: {e}")
+            mel = None
+        return index, mel
+
+
+def build_mel_store(dataset, path, num_workers=8, shard_bytes=2 * 1024**3):
+    """
+    Computes the mel spectrogram of every item once and writes them to a sharded float16 store.
+
+    Args:
+        dataset (HFDataset | CustomDataset): Dataset exposing get_mel_spec(index).
+        path (str): Output directory.
+        num_workers (int): Dataloader workers extracting features in parallel.
+        shard_bytes (int): Size after which a new shard file is started.
+
+    Returns:
+        MelStore: The written store.
+    """
+    os.makedirs(path, exist_ok=True)
+    mel_spectrogram = dataset.mel_spectrogram
+    index = np.full((len(dataset), 3), -1, dtype=np.int64)
+    index[:, 2] = 0
+
+    loader = DataLoader(
+        _MelExtraction(dataset),
+        batch_size=None,
+        num_workers=num_workers,
+        persistent_workers=False,
+    )
+
+    shard, offset = 0, 0
+    f = open(os.path.join(path, _shard_name(shard)), "wb")
+    try:
+        for i, mel in tqdm(loader, total=len(dataset), desc="Building mel store"):
+            if mel is None:
+                continue
+            data = mel.squeeze(0).to(torch.float16).contiguous().numpy()  # d t
+            if offset and (offset + data.size) * 2 > shard_bytes:
+                f.close()
+                shard, offset = shard + 1, 0
+                f = open(os.path.join(path, _shard_name(shard)), "wb")
+            f.write(data.tobytes())
+            index[i] = (shard, offset, data.shape[-1])
+            offset += data.size
+    finally:
+        f.close()
+
+    np.save(os.path.join(path, INDEX_FILE), index)
+    with open(os.path.join(path, META_FILE), "w", encoding="utf-8") as f:
+        json.dump(dict(mel_settings(mel_spectrogram), num_items=len(dataset)), f, indent=2)
+
+    return MelStore(path)
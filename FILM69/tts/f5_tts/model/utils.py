@@ -2,15 +2,15 @@ from __future__ import annotations
 
 import os
 import random
-from collections import defaultdict
+import re
+from collections import OrderedDict, defaultdict
+from functools import lru_cache
 from importlib.resources import files
 
+import numpy as np
 import torch
 from torch.nn.utils.rnn import pad_sequence
 
-import jieba
-from pypinyin import lazy_pinyin, Style
-
 
 # seed everything
 
@@ -85,14 +85,81 @@ def list_str_to_tensor(text: list[str], padding_value=-1) -> int["b nt"]:  # noq
 
 
 # char tokenizer, based on custom dataset's extracted .txt file
+
+
+class _VocabLookup(dict):
+    def __missing__(self, key):
+        return 0  # unknown char, same as vocab_char_map.get(c, 0)
+
+
+class VocabTable:
+    """
+    Array backed {char: idx} lookup. Single characters are indexed by code point in a numpy table,
+    multi-character tokens (pinyin) fall back to a dict, unknowns map to 0.
+    """
+
+    def __init__(self, vocab_char_map: dict[str, int]):
+        self.vocab_size = len(vocab_char_map)
+        self.lookup = _VocabLookup(vocab_char_map)
+        chars = {c: i for c, i in vocab_char_map.items() if len(c) == 1}
+        self.table = np.zeros(max(map(ord, chars), default=0) + 1, dtype=np.int64)
+        if chars:
+            self.table[np.fromiter(map(ord, chars), dtype=np.int64)] = np.fromiter(chars.values(), dtype=np.int64)
+
+    def encode(self, text: str | list[str]) -> np.ndarray:
+        if isinstance(text, str):
+            points = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.int64)
+            ids = self.table[np.minimum(points, len(self.table) - 1)]
+            ids[points >= len(self.table)] = 0
+            return ids
+        return np.fromiter(map(self.lookup.__getitem__, text), dtype=np.int64, count=len(text))
+
+
+_vocab_tables = OrderedDict()  # id(vocab_char_map) -> (vocab_char_map, VocabTable), the last few maps used
+
+
+def get_vocab_table(vocab_char_map: dict[str, int]) -> VocabTable:
+    """
+    VocabTable of vocab_char_map, built once per map. The entry holds the map, so its id cannot be reused while
+    cached; a map that changed size is rebuilt, edits keeping the size need a new dict (or a copy).
+    """
+    key = id(vocab_char_map)
+    cached = _vocab_tables.get(key)
+    if cached is None or cached[1].vocab_size != len(vocab_char_map):
+        cached = _vocab_tables[key] = (vocab_char_map, VocabTable(vocab_char_map))
+        while len(_vocab_tables) > 8:
+            _vocab_tables.popitem(last=False)
+    else:
+        _vocab_tables.move_to_end(key)
+    return cached[1]
+
+
 def list_str_to_idx(
     text: list[str] | list[list[str]],
     vocab_char_map: dict[str, int],  # {char: idx}
     padding_value=-1,
 ) -> int["b nt"]:  # noqa: F722
-    list_idx_tensors = [torch.tensor([vocab_char_map.get(c, 0) for c in t]) for t in text]  # pinyin or char style
-    text = pad_sequence(list_idx_tensors, padding_value=padding_value, batch_first=True)
-    return text
+    table = get_vocab_table(vocab_char_map)
+    list_idx = [table.encode(t) for t in text]  # pinyin or char style
+    out = np.full((len(list_idx), max((len(ids) for ids in list_idx), default=0)), padding_value, dtype=np.int64)
+    for i, ids in enumerate(list_idx):
+        out[i, : len(ids)] = ids
+    return torch.from_numpy(out)
+
+
+def tokenize_batch(
+    text_list: list[str],
+    vocab_char_map: dict[str, int] | None,
+    polyphone=True,
+    padding_value=-1,
+) -> int["b nt"]:  # noqa: F722
+    """
+    Tokenises raw texts into one padded id tensor, pinyin conversion then vocab lookup,
+    utf-8 bytes when vocab_char_map is None (byte tokenizer).
+    """
+    if vocab_char_map is None:
+        return list_str_to_tensor(text_list, padding_value=padding_value)
+    return list_str_to_idx(convert_char_to_pinyin(text_list, polyphone=polyphone), vocab_char_map, padding_value)
 
 
 # Get tokenizer
@@ -145,45 +212,104 @@ def get_tokenizer(dataset_name, tokenizer: str = "pinyin"):
 
 # convert char to pinyin
 
-jieba.initialize()
-print("Word segmentation module jieba initialized.\n")
+# jieba takes ~1s to load its dictionary and pypinyin ~0.3s to import, both are loaded on first use.
+# jieba only changes the segmentation of Han characters, text without any is segmented by
+# _segment_without_han, which follows jieba's rules for everything else.
+_jieba = None
+_han = re.compile("[\u4E00-\u9FD5]")
+_jieba_block = re.compile(r"([a-zA-Z0-9+#&\._%\-]+)")  # jieba re_han_default, minus the Han range
+_jieba_space = re.compile(r"(\r\n|\s)")
+_jieba_alnum = re.compile(r"([a-zA-Z0-9]+(?:\.\d+)?%?)")
+_jieba_dict_words = re.compile(r"(AT&T|[cC]#|[cC]\+\+)")  # the only entries of jieba's dictionary within _jieba_block
+_custom_trans = str.maketrans({";": ",", "“": '"', "”": '"', "‘": "'", "’": "'"})  # add custom trans here, to address oov
+
+
+def get_jieba():
+    global _jieba
+    if _jieba is None:
+        import jieba
+
+        jieba.initialize()
+        print("Word segmentation module jieba initialized.\n")
+        _jieba = jieba
+    return _jieba
+
+
+def _segment_without_han(text):
+    for blk in _jieba_block.split(text):
+        if not blk:
+            continue
+        if _jieba_block.match(blk):
+            # dictionary words are kept whole, the runs between them go through finalseg's alnum split
+            for i, part in enumerate(_jieba_dict_words.split(blk)):
+                if i % 2:
+                    yield part
+                elif len(part) == 1:
+                    yield part
+                else:
+                    yield from filter(None, _jieba_alnum.split(part))
+        else:
+            for part in _jieba_space.split(blk):
+                if _jieba_space.match(part):
+                    yield part
+                else:
+                    yield from part
+
+
+def segment_text(text):
+    if _han.search(text):
+        return get_jieba().cut(text)
+    return _segment_without_han(text)
+
+
+def is_chinese(c):
+    return (
+        "\u3100" <= c <= "\u9fff"  # common chinese characters
+    )
+
+
+@lru_cache(maxsize=65536)
+def _pinyin(seg):
+    from pypinyin import lazy_pinyin, Style
+
+    return tuple(lazy_pinyin(seg, style=Style.TONE3, tone_sandhi=True))
+
+
+@lru_cache(maxsize=65536)
+def _convert_segment(seg, polyphone):
+    # tokens of a segment that is not pure alphabets and symbols
+    char_list = []
+    if polyphone and len(bytes(seg, "UTF-8")) == 3 * len(seg):  # if pure east asian characters
+        seg_ = _pinyin(seg)
+        for i, c in enumerate(seg):
+            if is_chinese(c):
+                char_list.append(" ")
+            char_list.append(seg_[i])
+    else:  # if mixed characters, alphabets and symbols
+        for c in seg:
+            if ord(c) < 256:
+                char_list.extend(c)
+            elif is_chinese(c):
+                char_list.append(" ")
+                char_list.extend(_pinyin(c))
+            else:
+                char_list.append(c)
+    return tuple(char_list)
 
 
 def convert_char_to_pinyin(text_list, polyphone=True):
     final_text_list = []
-    custom_trans = str.maketrans(
-        {";": ",", "“": '"', "”": '"', "‘": "'", "’": "'"}
-    )  # add custom trans here, to address oov
-
-    def is_chinese(c):
-        return (
-            "\u3100" <= c <= "\u9fff"  # common chinese characters
-        )
 
     for text in text_list:
         char_list = []
-        text = text.translate(custom_trans)
-        for seg in jieba.cut(text):
-            seg_byte_len = len(bytes(seg, "UTF-8"))
-            if seg_byte_len == len(seg):  # if pure alphabets and symbols
-                if char_list and seg_byte_len > 1 and char_list[-1] not in " :'\"":
+        text = text.translate(_custom_trans)
+        for seg in segment_text(text):
+            if seg.isascii():  # if pure alphabets and symbols
+                if char_list and len(seg) > 1 and char_list[-1] not in " :'\"":
                     char_list.append(" ")
                 char_list.extend(seg)
-            elif polyphone and seg_byte_len == 3 * len(seg):  # if pure east asian characters
-                seg_ = lazy_pinyin(seg, style=Style.TONE3, tone_sandhi=True)
-                for i, c in enumerate(seg):
-                    if is_chinese(c):
-                        char_list.append(" ")
-                    char_list.append(seg_[i])
-            else:  # if mixed characters, alphabets and symbols
-                for c in seg:
-                    if ord(c) < 256:
-                        char_list.extend(c)
-                    elif is_chinese(c):
-                        char_list.append(" ")
-                        char_list.extend(lazy_pinyin(c, style=Style.TONE3, tone_sandhi=True))
-                    else:
-                        char_list.append(c)
+            else:
+                char_list.extend(_convert_segment(seg, polyphone))
         final_text_list.append(char_list)
 
     return final_text_list
@@ -0,0 +1,58 @@
+"""Micro-benchmark of audio chunk framing: struct.pack over Python floats vs buffer based encoders"""
+
+import argparse
+import struct
+import time
+
+import numpy as np
+
+from FILM69.tts.f5_tts.socket_server import AUDIO_FORMATS, encode_audio
+
+SAMPLE_RATE = 24000
+
+
+def struct_pack(chunk):
+    return struct.pack(f"{len(chunk)}f", *chunk)
+
+
+def measure(encode, chunks, repeats):
+    wire_bytes = 0
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for chunk in chunks:
+            wire_bytes += memoryview(encode(chunk)).nbytes
+    return time.perf_counter() - start, wire_bytes // repeats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=10.0, help="Audio length to frame")
+    parser.add_argument("--chunk_s", type=float, default=0.5, help="Chunk length, as play_steps_in_s")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    wave = (0.3 * np.sin(np.arange(int(args.seconds * SAMPLE_RATE)) * 2 * np.pi * 220 / SAMPLE_RATE)).astype(np.float32)
+    wave += 0.01 * rng.standard_normal(len(wave)).astype(np.float32)
+    chunk_size = int(args.chunk_s * SAMPLE_RATE)
+    chunks = [wave[i : i + chunk_size] for i in range(0, len(wave), chunk_size)]
+
+    encoders = [("struct.pack float32 (old)", struct_pack)]
+    encoders += [(audio_format, lambda chunk, f=audio_format: encode_audio(chunk, f)) for audio_format in AUDIO_FORMATS]
+
+    print(f"{args.seconds:.0f}s of audio in {len(chunks)} chunks of {args.chunk_s}s")
+    baseline = None
+    for name, encode in encoders:
+        elapsed, wire_bytes = measure(encode, chunks, args.repeats)
+        per_pass = elapsed / args.repeats
+        baseline = baseline or per_pass
+        print(
+            f"{name:<26} {per_pass * 1000:9.2f} ms/pass  "
+            f"{wire_bytes / per_pass / 2**20:9.1f} MiB/s out  "
+            f"{args.seconds / per_pass:12.0f} audio s/s  "
+            f"{wire_bytes / args.seconds / 1024:7.1f} KiB/audio s  x{baseline / per_pass:.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""CPU benchmark of CFM.sample wall time per NFE step, fused vs unfused cfg"""
+
+import argparse
+import time
+
+import torch
+
+from FILM69.tts.f5_tts.model import CFM, DiT
+
+
+def benchmark(model, cond, text, duration, steps, repeats, **sample_kwargs):
+    calls = 0
+    forward = model.transformer.forward
+
+    def counted_forward(*args, **kwargs):
+        nonlocal calls
+        calls += 1
+        return forward(*args, **kwargs)
+
+    model.transformer.forward = counted_forward
+    try:
+        model.sample(cond=cond, text=text, duration=duration, steps=steps, seed=0, **sample_kwargs)  # warm up
+        calls = 0
+        start = time.perf_counter()
+        for _ in range(repeats):
+            model.sample(cond=cond, text=text, duration=duration, steps=steps, seed=0, **sample_kwargs)
+        elapsed = time.perf_counter() - start
+    finally:
+        model.transformer.forward = forward
+
+    return elapsed / (repeats * steps), calls / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--heads", type=int, default=4)
+    parser.add_argument("--batch", type=int, default=1)
+    parser.add_argument("--ref_frames", type=int, default=200)
+    parser.add_argument("--duration", type=int, default=500)
+    parser.add_argument("--text_length", type=int, default=100)
+    parser.add_argument("--steps", type=int, default=16)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.threads is not None:
+        torch.set_num_threads(args.threads)
+    torch.manual_seed(0)
+
+    n_mel_channels = 100
+    transformer = DiT(
+        dim=args.dim, depth=args.depth, heads=args.heads, ff_mult=2, text_dim=128, conv_layers=2, mel_dim=n_mel_channels
+    )
+    model = CFM(transformer=transformer, mel_spec_kwargs=dict(n_mel_channels=n_mel_channels)).eval()
+
+    cond = torch.randn(args.batch, args.ref_frames, n_mel_channels)
+    text = torch.randint(0, 256, (args.batch, args.text_length))
+
+    configs = [
+        ("unfused", dict()),
+        ("fused", dict(fuse_cfg=True)),
+        ("unfused + skip@0.8", dict(cfg_schedule="skip", cfg_schedule_t=0.8)),
+        ("fused + skip@0.8", dict(fuse_cfg=True, cfg_schedule="skip", cfg_schedule_t=0.8)),
+        ("fused + cache@0.5", dict(fuse_cfg=True, cfg_schedule="cache", cfg_schedule_t=0.5)),
+        ("no cfg", dict(cfg_strength=0.0)),
+    ]
+
+    print(f"DiT dim={args.dim} depth={args.depth} batch={args.batch} frames={args.duration} steps={args.steps}")
+    baseline = None
+    for name, kwargs in configs:
+        kwargs.setdefault("cfg_strength", 2.0)
+        per_step, calls = benchmark(model, cond, text, args.duration, args.steps, args.repeats, **kwargs)
+        baseline = baseline or per_step
+        print(
+            f"{name:<22} {per_step * 1000:8.2f} ms/step  "
+            f"{calls:5.0f} forwards/sample  x{baseline / per_step:.2f} vs unfused"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Load generator for socket_server.py: time-to-first-audio and concurrent throughput"""
+
+import argparse
+import asyncio
+import statistics
+import time
+
+from FILM69.tts.f5_tts.socket_server import (
+    AUDIO_FORMATS,
+    FRAME_AUDIO,
+    FRAME_END,
+    FRAME_ERROR,
+    FRAME_FORMAT,
+    FRAME_TEXT,
+    decode_audio,
+    read_frame,
+    write_frame,
+)
+
+SAMPLE_RATE = 24000
+
+
+async def run_client(host, port, text, requests, audio_format="float32"):
+    reader, writer = await asyncio.open_connection(host, port)
+    results = []
+    try:
+        write_frame(writer, FRAME_FORMAT, audio_format.encode("utf-8"))
+        await writer.drain()
+        _, accepted = await read_frame(reader)
+        audio_format = accepted.decode("utf-8")
+
+        for _ in range(requests):
+            start = time.perf_counter()
+            first_audio = None
+            samples = 0
+            wire_bytes = 0
+            write_frame(writer, FRAME_TEXT, text.encode("utf-8"))
+            await writer.drain()
+            while True:
+                frame_type, payload = await read_frame(reader)
+                if frame_type == FRAME_AUDIO:
+                    if first_audio is None:
+                        first_audio = time.perf_counter() - start
+                    samples += len(decode_audio(payload, audio_format))
+                    wire_bytes += len(payload)
+                elif frame_type == FRAME_END:
+                    break
+                elif frame_type == FRAME_ERROR:
+                    raise RuntimeError(payload.decode("utf-8"))
+            results.append((first_audio, time.perf_counter() - start, samples / SAMPLE_RATE, wire_bytes))
+    finally:
+        writer.close()
+    return results
+
+
+async def main_async(args):
+    start = time.perf_counter()
+    per_client = await asyncio.gather(
+        *[run_client(args.host, args.port, args.text, args.requests, args.format) for _ in range(args.clients)]
+    )
+    wall = time.perf_counter() - start
+
+    results = [r for client in per_client for r in client]
+    ttfa = [r[0] for r in results if r[0] is not None]
+    latency = [r[1] for r in results]
+    audio_seconds = sum(r[2] for r in results)
+    wire_bytes = sum(r[3] for r in results)
+
+    print(f"clients={args.clients} requests/client={args.requests} total={len(results)} format={args.format}")
+    print(f"time to first audio  mean {statistics.mean(ttfa):.3f}s  p50 {statistics.median(ttfa):.3f}s  max {max(ttfa):.3f}s")
+    print(f"request latency      mean {statistics.mean(latency):.3f}s  max {max(latency):.3f}s")
+    print(f"throughput           {len(results) / wall:.2f} req/s  {audio_seconds / wall:.2f} audio s/s (RTF x{audio_seconds / wall:.2f})")
+    print(f"wire                 {wire_bytes / max(audio_seconds, 1e-9) / 1024:.1f} KiB per audio second")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9998)
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=2, help="Sequential requests per client")
+    parser.add_argument("--format", default="float32", choices=AUDIO_FORMATS)
+    parser.add_argument(
+        "--text",
+        default="I don't really care what you call me. I've been a silent spectator, watching species evolve, "
+        "empires rise and fall. But always remember, I am mighty and enduring.",
+    )
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
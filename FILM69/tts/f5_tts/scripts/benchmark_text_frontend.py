@@ -0,0 +1,61 @@
+"""Micro-benchmark of the text front-end: pinyin conversion and vocab lookup of a batch of texts"""
+
+import argparse
+import time
+
+import torch
+from torch.nn.utils.rnn import pad_sequence
+
+from FILM69.tts.f5_tts.model.utils import convert_char_to_pinyin, get_tokenizer, list_str_to_idx
+
+TEXTS = [
+    "I don't really care what you call me. I've been a silent spectator, watching species evolve.",
+    "สวัสดีครับ วันนี้อากาศดีมาก เราไปเที่ยวทะเลกันไหม",
+    "对，这就是我，万人敬仰的太乙真人，虽然有点婴儿肥，但也掩不住我逼人的帅气。",
+]
+
+
+def list_str_to_idx_dict(text, vocab_char_map, padding_value=-1):
+    list_idx_tensors = [torch.tensor([vocab_char_map.get(c, 0) for c in t]) for t in text]
+    return pad_sequence(list_idx_tensors, padding_value=padding_value, batch_first=True)
+
+
+def measure(fn, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vocab", required=True, help="Path to vocab.txt")
+    parser.add_argument("--batch", type=int, default=32)
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    convert_char_to_pinyin(TEXTS[:2])
+    print(f"first call without Han text   {time.perf_counter() - start:.3f}s")
+    start = time.perf_counter()
+    convert_char_to_pinyin(TEXTS[2:])
+    print(f"first call with Han text      {time.perf_counter() - start:.3f}s (loads jieba)")
+
+    vocab_char_map, _ = get_tokenizer(args.vocab, "custom")
+    batch = [TEXTS[i % len(TEXTS)] * 4 for i in range(args.batch)]
+    pinyin = convert_char_to_pinyin(batch)
+
+    print(f"convert_char_to_pinyin        {measure(lambda: convert_char_to_pinyin(batch), args.repeats) * 1000:8.2f} ms/batch")
+    old = measure(lambda: list_str_to_idx_dict(pinyin, vocab_char_map), args.repeats)
+    new = measure(lambda: list_str_to_idx(pinyin, vocab_char_map), args.repeats)
+    print(f"list_str_to_idx dict.get      {old * 1000:8.2f} ms/batch")
+    print(f"list_str_to_idx table         {new * 1000:8.2f} ms/batch  x{old / new:.1f}")
+    raw = [list(t) for t in batch]
+    old = measure(lambda: list_str_to_idx_dict(batch, vocab_char_map), args.repeats)
+    new = measure(lambda: list_str_to_idx(batch, vocab_char_map), args.repeats)
+    print(f"char tokens dict.get / table  {old * 1000:8.2f} / {new * 1000:.2f} ms/batch  x{old / new:.1f}")
+    assert torch.equal(list_str_to_idx(raw, vocab_char_map), list_str_to_idx(batch, vocab_char_map))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,80 @@
 import argparse
+import asyncio
 import gc
-import socket
 import struct
-import torch
-import torchaudio
 import traceback
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from importlib.resources import files
-from threading import Thread
 
+import numpy as np
+import torch
 from cached_path import cached_path
 
-from infer.utils_infer import infer_batch_process, preprocess_ref_audio_text, load_vocoder, load_model
-from model.backbones.dit import DiT
+from FILM69.tts.f5_tts.infer.utils_infer import (
+    CrossFadeStitcher,
+    chunk_text,
+    infer_multi_process,
+    load_ref_audio,
+    preprocess_ref_audio_text,
+    load_vocoder,
+    load_model,
+)
+from FILM69.tts.f5_tts.model.backbones.dit import DiT
+
+
+# length-prefixed binary protocol, every message in both directions is [u8 type][u32 length][payload]
+# client -> server: optional FORMAT (audio format name, server answers with the FORMAT it picked), then TEXT requests
+# server -> client: a TEXT request is answered by AUDIO frames then one END (or ERROR)
+
+FRAME_AUDIO = 1  # samples in the negotiated audio format
+FRAME_END = 2
+FRAME_ERROR = 3  # utf-8 message
+FRAME_TEXT = 4  # utf-8 text to synthesise
+FRAME_FORMAT = 5  # utf-8 audio format name
+
+AUDIO_FORMATS = ("float32", "pcm16", "pcm16+zlib")  # little-endian samples, zlib over the pcm16 bytes
+
+_frame_header = struct.Struct("!BI")
+
+
+async def read_frame(reader):
+    header = await reader.readexactly(_frame_header.size)
+    frame_type, length = _frame_header.unpack(header)
+    return frame_type, await reader.readexactly(length)
+
+
+def write_frame(writer, frame_type, payload=b""):
+    payload = memoryview(payload).cast("B")
+    writer.write(_frame_header.pack(frame_type, payload.nbytes))
+    if payload.nbytes:
+        writer.write(payload)
+
+
+def encode_audio(wave, audio_format="float32"):
+    """Serialises a float wave without going through Python floats, returns a bytes-like object."""
+    if audio_format == "float32":
+        return memoryview(np.ascontiguousarray(wave, dtype="<f4"))
+    pcm = (np.clip(wave, -1.0, 1.0) * 32767).astype("<i2")
+    if audio_format == "pcm16":
+        return memoryview(pcm)
+    if audio_format == "pcm16+zlib":
+        return zlib.compress(pcm, 1)
+    raise ValueError(f"Unknown audio format: {audio_format}")
+
+
+def decode_audio(payload, audio_format="float32"):
+    if audio_format == "float32":
+        return np.frombuffer(payload, dtype="<f4")
+    if audio_format == "pcm16+zlib":
+        payload = zlib.decompress(payload)
+    elif audio_format != "pcm16":
+        raise ValueError(f"Unknown audio format: {audio_format}")
+    return np.frombuffer(payload, dtype="<i2").astype(np.float32) / 32767
 
 
 class TTSStreamingProcessor:
-    def __init__(self, ckpt_file, vocab_file, ref_audio, ref_text, device=None, dtype=torch.float32):
+    def __init__(self, ckpt_file, vocab_file, ref_audio, ref_text, device=None, dtype=torch.float32, max_chars=None):
         self.device = device or (
             "cuda"
             if torch.cuda.is_available()
@@ -43,10 +102,15 @@ class TTSStreamingProcessor:
 
         # Set sampling rate for streaming
         self.sampling_rate = 24000  # Consistency with client
-
-        # Set reference audio and text
-        self.ref_audio = ref_audio
-        self.ref_text = ref_text
+        self.cross_fade_duration = 0.15
+
+        # Preprocess the reference audio and text once, every request reuses them
+        ref_audio, self.ref_text = preprocess_ref_audio_text(ref_audio, ref_text)
+        self.ref_audio = load_ref_audio(ref_audio)
+        audio, sr = self.ref_audio
+        self.max_chars = max_chars or int(
+            len(self.ref_text.encode("utf-8")) / (audio.shape[-1] / sr) * (25 - audio.shape[-1] / sr)
+        )
 
         # Warm up the model
         self._warm_up()
@@ -54,102 +118,169 @@ class TTSStreamingProcessor:
     def _warm_up(self):
         """Warm up the model with a dummy input to ensure it's ready for real-time processing."""
         print("Warming up the model...")
-        ref_audio, ref_text = preprocess_ref_audio_text(self.ref_audio, self.ref_text)
-        audio, sr = torchaudio.load(ref_audio)
-        gen_text = "Warm-up text for the model."
-
-        # Pass the vocoder as an argument here
-        infer_batch_process((audio, sr), ref_text, [gen_text], self.model, self.vocoder, device=self.device)
+        self.generate_batch(["Warm-up text for the model."])
         print("Warm-up completed.")
 
-    def generate_stream(self, text, play_steps_in_s=0.5):
-        """Generate audio in chunks and yield them in real-time."""
-        # Preprocess the reference audio and text
-        ref_audio, ref_text = preprocess_ref_audio_text(self.ref_audio, self.ref_text)
-
-        # Load reference audio
-        audio, sr = torchaudio.load(ref_audio)
-
-        # Run inference for the input text
-        audio_chunk, final_sample_rate, _ = infer_batch_process(
-            (audio, sr),
-            ref_text,
-            [text],
+    def generate_batch(self, texts):
+        """Synthesise one text chunk per item in a single batched solve, returns a float32 wave per item."""
+        results = infer_multi_process(
+            [(self.ref_audio, self.ref_text, [text]) for text in texts],
             self.model,
             self.vocoder,
-            device=self.device,  # Pass vocoder here
+            progress=_NoProgress,
+            cross_fade_duration=0,
+            device=self.device,
+            batch_size=len(texts),
         )
-
-        # Break the generated audio into chunks and send them
-        chunk_size = int(final_sample_rate * play_steps_in_s)
-
-        if len(audio_chunk) < chunk_size:
-            packed_audio = struct.pack(f"{len(audio_chunk)}f", *audio_chunk)
-            yield packed_audio
-            return
-
-        for i in range(0, len(audio_chunk), chunk_size):
-            chunk = audio_chunk[i : i + chunk_size]
-
-            # Check if it's the final chunk
-            if i + chunk_size >= len(audio_chunk):
-                chunk = audio_chunk[i:]
-
-            # Send the chunk if it is not empty
-            if len(chunk) > 0:
-                packed_audio = struct.pack(f"{len(chunk)}f", *chunk)
-                yield packed_audio
-
-
-def handle_client(client_socket, processor):
-    try:
+        return [wave.astype(np.float32) for wave, _, _ in results]
+
+    def generate_stream(self, text):
+        """Generate audio chunk by chunk and yield each float32 wave as soon as it is ready."""
+        stitcher = CrossFadeStitcher(self.cross_fade_duration, self.sampling_rate)
+        for chunk in chunk_text(text, max_chars=self.max_chars):
+            wave = stitcher.push(self.generate_batch([chunk])[0])
+            if len(wave):
+                yield wave
+        wave = stitcher.flush()
+        if len(wave):
+            yield wave
+
+
+class _NoProgress:
+    @staticmethod
+    def tqdm(iterable):
+        return iterable
+
+
+class TTSStreamingServer:
+    """asyncio front-end: one coroutine per client, micro-batches pending text chunks across all clients."""
+
+    def __init__(self, processor, batch_size=4, batch_wait=0.01):
+        self.processor = processor
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.executor = ThreadPoolExecutor(max_workers=1)  # one model, one solver thread
+        self.queue = None
+
+    async def _scheduler(self):
+        loop = asyncio.get_running_loop()
         while True:
-            # Receive data from the client
-            data = client_socket.recv(1024).decode("utf-8")
-            if not data:
-                break
-
+            jobs = [await self.queue.get()]
+            deadline = loop.time() + self.batch_wait
+            while len(jobs) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    jobs.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            jobs = [(text, future) for text, future in jobs if not future.cancelled()]
+            if not jobs:
+                continue
             try:
-                # The client sends the text input
-                text = data.strip()
-
-                # Generate and stream audio chunks
-                for audio_chunk in processor.generate_stream(text):
-                    client_socket.sendall(audio_chunk)
-
-                # Send end-of-audio signal
-                client_socket.sendall(b"END_OF_AUDIO")
-
-            except Exception as inner_e:
-                print(f"Error during processing: {inner_e}")
-                traceback.print_exc()  # Print the full traceback to diagnose the issue
-                break
-
-    except Exception as e:
-        print(f"Error handling client: {e}")
-        traceback.print_exc()
-    finally:
-        client_socket.close()
-
-
-def start_server(host, port, processor):
-    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    server.bind((host, port))
-    server.listen(5)
-    print(f"Server listening on {host}:{port}")
-
-    while True:
-        client_socket, addr = server.accept()
-        print(f"Accepted connection from {addr}")
-        client_handler = Thread(target=handle_client, args=(client_socket, processor))
-        client_handler.start()
+                waves = await loop.run_in_executor(
+                    self.executor, self.processor.generate_batch, [text for text, _ in jobs]
+                )
+            except Exception as e:
+                traceback.print_exc()
+                for _, future in jobs:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), wave in zip(jobs, waves):
+                if not future.done():
+                    future.set_result(wave)
+
+    def _submit(self, text):
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((text, future))
+        return future
+
+    async def synthesize(self, text):
+        """Async generator of chunk waves; chunk i+1 is queued before chunk i is handed to the caller."""
+        chunks = chunk_text(text, max_chars=self.processor.max_chars)
+        if not chunks:
+            return
+        future = self._submit(chunks[0])
+        try:
+            for i in range(len(chunks)):
+                wave = await future
+                if i + 1 < len(chunks):
+                    future = self._submit(chunks[i + 1])
+                yield wave
+        finally:
+            future.cancel()
+
+    async def _cross_faded(self, text):
+        stitcher = CrossFadeStitcher(self.processor.cross_fade_duration, self.processor.sampling_rate)
+        async for wave in self.synthesize(text):
+            wave = stitcher.push(wave)
+            if len(wave):
+                yield wave
+        wave = stitcher.flush()
+        if len(wave):
+            yield wave
+
+    async def handle_client(self, reader, writer):
+        peer = writer.get_extra_info("peername")
+        print(f"Accepted connection from {peer}")
+        audio_format = "float32"
+        try:
+            while True:
+                try:
+                    frame_type, payload = await read_frame(reader)
+                except asyncio.IncompleteReadError:
+                    break
+
+                if frame_type == FRAME_FORMAT:
+                    requested = payload.decode("utf-8")
+                    audio_format = requested if requested in AUDIO_FORMATS else "float32"
+                    write_frame(writer, FRAME_FORMAT, audio_format.encode("utf-8"))
+                    await writer.drain()
+                    continue
+                if frame_type != FRAME_TEXT:
+                    write_frame(writer, FRAME_ERROR, f"Unexpected frame type: {frame_type}".encode("utf-8"))
+                    await writer.drain()
+                    continue
+
+                try:
+                    async for wave in self._cross_faded(payload.decode("utf-8").strip()):
+                        write_frame(writer, FRAME_AUDIO, encode_audio(wave, audio_format))
+                        await writer.drain()
+                    write_frame(writer, FRAME_END)
+                except Exception as e:
+                    print(f"Error during processing: {e}")
+                    traceback.print_exc()
+                    write_frame(writer, FRAME_ERROR, str(e).encode("utf-8"))
+                await writer.drain()
+        except (ConnectionResetError, BrokenPipeError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host, port):
+        self.queue = asyncio.Queue()
+        scheduler = asyncio.create_task(self._scheduler())
+        server = await asyncio.start_server(self.handle_client, host, port)
+        print(f"Server listening on {host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            scheduler.cancel()
+
+
+def start_server(host, port, processor, batch_size=4, batch_wait=0.01):
+    asyncio.run(TTSStreamingServer(processor, batch_size, batch_wait).serve(host, port))
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
 
     parser.add_argument("--host", default="0.0.0.0")
-    parser.add_argument("--port", default=9998)
+    parser.add_argument("--port", type=int, default=9998)
 
     parser.add_argument(
         "--ckpt_file",
@@ -175,6 +306,9 @@ if __name__ == "__main__":
 
     parser.add_argument("--device", default=None, help="Device to run the model on")
     parser.add_argument("--dtype", default=torch.float32, help="Data type to use for model inference")
+    parser.add_argument("--max_chars", type=int, default=None, help="Max bytes per text chunk, smaller = faster first audio")
+    parser.add_argument("--batch_size", type=int, default=4, help="Max text chunks solved together across clients")
+    parser.add_argument("--batch_wait", type=float, default=0.01, help="Seconds to wait for more chunks to batch")
 
     args = parser.parse_args()
 
@@ -187,10 +321,11 @@ if __name__ == "__main__":
             ref_text=args.ref_text,
             device=args.device,
             dtype=args.dtype,
+            max_chars=args.max_chars,
         )
 
         # Start the server
-        start_server(args.host, args.port, processor)
+        start_server(args.host, args.port, processor, args.batch_size, args.batch_wait)
 
     except KeyboardInterrupt:
         gc.collect()
@@ -7,6 +7,7 @@ import shutil
 from FILM69.tts.f5_tts.model import CFM, UNetT, DiT, Trainer
 from FILM69.tts.f5_tts.model.utils import get_tokenizer
 from FILM69.tts.f5_tts.model.dataset import load_dataset
+from FILM69.tts.f5_tts.model.mel_store import build_mel_store
 from importlib.resources import files
 from datasets import load_dataset as _load_dataset,Audio as _Audio,concatenate_datasets
 import numpy as np
@@ -80,6 +81,25 @@ class TTS:
         self.audio_column=audio_column
         self.duration_column=duration_column
         
+    def build_mel_store(self,output,num_workers=8,target_sample_rate=24000,n_mel_channels=100,hop_length=256,win_length=1024,n_fft=1024,mel_spec_type="vocos"):
+        # the mel settings must be the ones later given to train()
+        dataset=load_dataset(
+            self.datasets,
+            dataset_type="HFDataset",
+            mel_spec_kwargs=dict(
+                n_fft=n_fft,
+                hop_length=hop_length,
+                win_length=win_length,
+                n_mel_channels=n_mel_channels,
+                target_sample_rate=target_sample_rate,
+                mel_spec_type=mel_spec_type,
+            ),
+            text_column=self.text_column,
+            audio_column=self.audio_column,
+            duration_column=self.duration_column,
+            )
+        return build_mel_store(dataset,output,num_workers=num_workers)
+        
     def vocab_check(self,datasets,file_vocab):
         with open(file_vocab, "r", encoding="utf-8-sig") as f:
             data = f.read()
@@ -204,6 +224,7 @@ class TTS:
         mel_spec_type = "vocos",  # 'vocos' or 'bigvgan'
         
         check_vocab=True,
+        mel_store=None,
         ):
         if save_step != None:
             save_per_updates=save_step
@@ -336,6 +357,7 @@ class TTS:
             text_column=self.text_column,
             audio_column=self.audio_column,
             duration_column=self.duration_column,
+            mel_store=mel_store,
             )
         
     def start_train(self, resumable_with_seed=666):
@@ -72,6 +72,8 @@ ubuntu=[
 RAG=[
     "pymilvus",
     "chromadb",
+    "pypdf",
+    "pythainlp",
 ]
 
 UI=[
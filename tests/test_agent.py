@@ -0,0 +1,103 @@
+import asyncio
+import gc
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+pytest.importorskip("langgraph")
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.tools import tool
+
+from FILM69.agent.agent import Agent
+
+DELAY = 0.2
+
+
+@tool
+async def slow_sum(numbers: list[int]) -> int:
+    "Adds numbers, slowly."
+    await asyncio.sleep(DELAY)
+    return sum(numbers)
+
+
+class StubChatModel:
+    """Calls slow_sum with the numbers of the user message, then answers with the tool's result."""
+
+    def bind_tools(self, tools):
+        assert [t.name for t in tools] == ["slow_sum"]
+        return self
+
+    async def ainvoke(self, messages):
+        last = messages[-1]
+        if isinstance(last, ToolMessage):
+            turns = sum(isinstance(message, HumanMessage) for message in messages)
+            return AIMessage(content=f"{last.content} after {turns} turns")
+        numbers = [int(word) for word in last.content.split()]
+        return AIMessage(content="", tool_calls=[{"name": "slow_sum", "args": {"numbers": numbers}, "id": uuid.uuid4().hex}])
+
+
+def answer(events):
+    return events[-1]["chatbot"]["messages"][-1].content
+
+
+@pytest.fixture
+def agent():
+    return Agent(model=StubChatModel(), tools=[slow_sum])
+
+
+def test_ainvoke_and_astream(agent):
+    async def run():
+        events = await agent.ainvoke("1 2 3", thread_id="a")
+        streamed = [event async for event in agent.astream("4 5", thread_id="a")]
+        return events, streamed
+
+    events, streamed = asyncio.run(run())
+    assert [list(event) for event in events] == [["chatbot"], ["tools"], ["chatbot"]]
+    assert answer(events) == "6 after 1 turns"
+    assert answer(streamed) == "9 after 2 turns"
+
+
+def test_sync_bridge(agent):
+    assert answer(agent.invoke("2 2", thread_id="s")) == "4 after 1 turns"
+    events = list(agent.stream("3 3", thread_id="s"))
+    assert answer(events) == "6 after 2 turns"
+
+
+def test_sync_call_from_agent_loop_is_refused(agent):
+    async def blocking():
+        agent.invoke("1", thread_id="x")
+
+    with pytest.raises(RuntimeError):
+        agent._runner.submit(blocking()).result(10)
+
+
+def test_concurrent_thread_ids(agent):
+    agent.invoke("0", thread_id="warmup")
+    count = 8
+
+    async def run():
+        return await asyncio.gather(*(agent.ainvoke(f"{i} {i}", thread_id=f"t{i}") for i in range(count)))
+
+    start = time.perf_counter()
+    results = asyncio.run(run())
+    assert time.perf_counter() - start < count * DELAY / 2
+    assert [answer(events) for events in results] == [f"{2 * i} after 1 turns" for i in range(count)]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(count) as pool:
+        results = list(pool.map(lambda i: agent.invoke(f"{i}", thread_id=f"t{i}"), range(count)))
+    assert time.perf_counter() - start < count * DELAY / 2
+    assert [answer(events) for events in results] == [f"{i} after 2 turns" for i in range(count)]
+
+
+def test_same_thread_id_runs_in_turn(agent):
+    async def run():
+        return await asyncio.gather(*(agent.ainvoke("1", thread_id="same") for _ in range(3)))
+
+    results = asyncio.run(run())
+    assert sorted(answer(events) for events in results) == [f"1 after {n} turns" for n in (1, 2, 3)]
+    gc.collect()
+    assert len(agent._thread_locks) == 0
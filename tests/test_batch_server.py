@@ -0,0 +1,67 @@
+import threading
+import time
+
+import pytest
+import torch
+
+from FILM69.llm.batch_server import ContinuousBatchingServer
+
+
+def greedy(model, prompt, max_new_tokens):
+    # plain argmax loop, generate() would suppress the eos id the server is not given
+    ids = list(prompt)
+    with torch.inference_mode():
+        for _ in range(max_new_tokens):
+            ids.append(int(model(torch.tensor([ids])).logits[0, -1].argmax()))
+    return ids[len(prompt):]
+
+
+def collect(request, timeout=60):
+    result = {}
+
+    def run():
+        try:
+            result["ids"] = request.result()
+        except Exception as e:
+            result["error"] = e
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "request never finished"
+    if "error" in result:
+        raise result["error"]
+    return result["ids"]
+
+
+def test_requests_admitted_while_decoding(model):
+    prompts = [[(7 * i + j) % 120 + 1 for j in range(5 + 3 * (i % 3))] for i in range(6)]
+    server = ContinuousBatchingServer(model, max_batch_size=4).start()
+    try:
+        requests = []
+        for prompt in prompts:
+            requests.append(server.submit(prompt, max_new_tokens=12, temperature=0))
+            time.sleep(0.01)
+        outputs = [collect(request) for request in requests]
+    finally:
+        server.stop()
+    assert server.steps > 0
+    for prompt, output in zip(prompts, outputs):
+        assert output == greedy(model, prompt, 12)
+
+
+def test_stop_ends_running_and_queued_requests(model):
+    server = ContinuousBatchingServer(model, max_batch_size=1).start()
+    requests = [server.submit([1, 2, 3], max_new_tokens=10_000, temperature=0) for _ in range(3)]
+    time.sleep(0.05)
+    server.stop()
+    for request in requests:
+        with pytest.raises(RuntimeError):
+            collect(request, timeout=10)
+
+
+def test_image_inputs_are_rejected(model):
+    server = ContinuousBatchingServer(model)
+    with pytest.raises(ValueError):
+        server.submit([1, 2, 3], model_inputs={"pixel_values": torch.zeros(1, 3, 4, 4)})
+    assert server.pending.empty()
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+import torch
+from PIL import Image
+
+import transformers
+from FILM69.llm.fast_model.image_cache import CachedImageProcessor
+
+PROCESSORS = ["MllamaImageProcessor", "Gemma3ImageProcessor", "Qwen2VLImageProcessor"]
+
+
+def images():
+    rng = np.random.default_rng(0)
+    return [
+        Image.fromarray(rng.integers(0, 255, (300, 500, 3), dtype=np.uint8)),
+        Image.fromarray(rng.integers(0, 255, (200, 200, 3), dtype=np.uint8)),
+    ]
+
+
+def assert_same(output, reference):
+    assert list(output.keys()) == list(reference.keys())
+    for name in reference.keys():
+        if isinstance(reference[name], torch.Tensor):
+            assert output[name].shape == reference[name].shape, name
+            assert torch.allclose(output[name].float(), reference[name].float(), atol=1e-4), name
+        else:
+            assert output[name] == reference[name], name
+
+
+@pytest.mark.parametrize("name", PROCESSORS)
+@pytest.mark.parametrize("nested", [False, True])
+def test_cached_output_matches_processor(name, nested):
+    processor = getattr(transformers, name)()
+    cached = CachedImageProcessor(getattr(transformers, name)())
+    first, second = images()
+    inputs = [[first, second]] if nested else [first, second]
+    reference = processor(inputs, return_tensors="pt")
+
+    assert_same(cached(inputs, return_tensors="pt"), reference)
+    # second call is merged from cached per-image outputs
+    assert_same(cached(inputs, return_tensors="pt"), reference)
+    # Mllama reads a flat list as one sample too, its per-image num_tiles lists do not merge into that
+    merged = nested or name != "MllamaImageProcessor"
+    assert (cached.axes[nested] is not False) == merged
+    assert cached.hits == (2 if merged else 0)
+
+    more = [[first, second, first]] if nested else [first, second, first]
+    assert_same(cached(more, return_tensors="pt"), processor(more, return_tensors="pt"))
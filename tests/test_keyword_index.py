@@ -0,0 +1,24 @@
+from FILM69.llm import keyword_index
+from FILM69.llm.keyword_index import BM25Index, tokenize
+
+
+def test_code_glued_to_thai_is_its_own_term():
+    for text in ("รุ่นAB-123ราคา", "AB-123ราคาถูก", "สินค้า AB-123."):
+        terms = tokenize(text)
+        assert "ab-123" in terms
+        assert not [term for term in terms if "ab" in term and term != "ab-123" and term != "ab"]
+        assert all(term.isascii() or not any(c.isascii() for c in term) for term in terms)
+
+
+def test_search_finds_code_inside_thai_text():
+    index = BM25Index()
+    index.add(["a", "b", "c"], ["สินค้ารุ่นAB-123ราคาถูก", "สินค้ารุ่นAB-124ราคาถูก", "ราคาถูกมาก"])
+    assert index.search("AB-123", 1)[0][0] == "a"
+
+
+def test_thai_fallback_keeps_marks_with_their_consonant(monkeypatch):
+    monkeypatch.setattr(keyword_index, "_thai_word_tokenize", None)
+    assert tokenize("รุ่นใหม่") == ["รุ่น", "นใ", "ให", "หม่"]
+    terms = tokenize("รุ่นใหม่ ราคาถูก น้ำ")
+    marks = "\u0E31\u0E34\u0E35\u0E36\u0E37\u0E38\u0E39\u0E3A\u0E47\u0E48\u0E49\u0E4A\u0E4B\u0E4C\u0E4D\u0E4E"
+    assert all(term[0] not in marks for term in terms)
@@ -0,0 +1,35 @@
+from FILM69.llm.session import SessionManager
+
+
+def test_chat_history_view_writes_back():
+    sessions = SessionManager(store=False)
+    history = sessions.view("default")
+    history.append({"role": "user", "content": "hi"})
+    history.append({"role": "assistant", "content": "hello"})
+    history += [{"role": "user", "content": "bye"}]
+    assert history == [
+        {"role": "user", "content": "hi"},
+        {"role": "assistant", "content": "hello"},
+        {"role": "user", "content": "bye"},
+    ]
+    del history[-1]
+    history[-1] = {"role": "assistant", "content": "hey"}
+    assert sessions.messages("default") == [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "hey"}]
+    assert len(history) == 2 and "document" not in history and history[0]["content"] == "hi"
+    sessions.set_messages("default", history)
+    assert len(sessions.view("default")) == 2
+    history.clear()
+    assert sessions.messages("default") == []
+
+
+def test_truncation_keeps_the_prefix_for_the_next_turns():
+    sessions = SessionManager(max_tokens=100, store=False)
+    sessions.append("s", "system", "s" * 10)
+    prefixes = []
+    for turn in range(20):
+        sessions.append("s", "user" if turn % 2 == 0 else "assistant", str(turn % 10) * 10)
+        prefixes.append(sessions.messages("s")[1]["content"])
+        assert sum(len(m["content"]) for m in sessions.messages("s")) <= 100
+    assert sessions.messages("s")[0]["role"] == "system"
+    # the first kept turn changes only when the budget is hit, not on every turn
+    assert sum(a != b for a, b in zip(prefixes, prefixes[1:])) <= 4
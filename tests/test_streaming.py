@@ -0,0 +1,53 @@
+import torch
+
+from FILM69.llm.streaming import TokenStream, TokenStreamer, start_generation
+
+
+class CharTokenizer:
+    def decode(self, ids, skip_special_tokens=True):
+        return "".join(chr(97 + i % 26) for i in ids)
+
+
+def stream(model, max_new_tokens, closed):
+    streamer = TokenStreamer(CharTokenizer())
+    deltas = start_generation(
+        model.generate, streamer, torch.tensor([[1, 2, 3]]), max_new_tokens=max_new_tokens, do_sample=False
+    )
+    return TokenStream(deltas, streamer.stats, on_close=closed.append, cancel=streamer.cancel), streamer
+
+
+def wait_ended(streamer, timeout=30):
+    # the generate thread puts None on the streamer's queue once generate() returns
+    while True:
+        item = streamer.deltas.get(timeout=timeout)
+        assert not isinstance(item, BaseException)
+        if item is None:
+            return
+
+
+def test_close_before_iterating_saves_and_stops(model):
+    closed = []
+    tokens, streamer = stream(model, 5000, closed)
+    tokens.close()
+    tokens.close()
+    assert closed == [""]
+    wait_ended(streamer)
+    assert streamer.stats.completion_tokens < 5000
+
+
+def test_close_mid_stream_saves_text_and_stops(model):
+    closed = []
+    tokens, streamer = stream(model, 5000, closed)
+    first = [next(tokens) for _ in range(3)]
+    tokens.close()
+    assert closed == ["".join(first)]
+    wait_ended(streamer)
+    assert streamer.stats.completion_tokens < 5000
+
+
+def test_exhausted_stream_saves_full_text(model):
+    closed = []
+    tokens, streamer = stream(model, 8, closed)
+    text = "".join(tokens)
+    assert closed == [text] and tokens.text == text
+    assert streamer.stats.completion_tokens == 8
@@ -0,0 +1,72 @@
+import asyncio
+import contextlib
+
+import pytest
+
+pytest.importorskip("langchain_mcp_adapters")
+
+import langchain_mcp_adapters.tools
+from langchain_core.messages import AIMessage
+from langchain_core.tools import StructuredTool
+
+from FILM69.agent import tools as agent_tools
+from FILM69.agent.tools import MCPClientPool, ParallelToolNode
+
+
+class FakeServer:
+    """Stands in for MultiServerMCPClient: every session serves an echo tool that fails once the session is gone."""
+
+    sessions = []
+
+    def __init__(self, connections):
+        pass
+
+    @contextlib.asynccontextmanager
+    async def session(self, name):
+        session = {"open": True, "number": len(self.sessions) + 1, "lost": asyncio.Event()}
+        self.sessions.append(session)
+        holder = asyncio.current_task()
+        watcher = asyncio.ensure_future(self._drop(session, holder))
+        try:
+            yield session
+        finally:
+            session["open"] = False
+            watcher.cancel()
+
+    @staticmethod
+    async def _drop(session, holder):
+        await session["lost"].wait()
+        holder.cancel()
+
+
+async def load_tools(session):
+    async def echo(text: str) -> str:
+        if not session["open"]:
+            raise ConnectionError("session closed")
+        return f"{text} via session {session['number']}"
+
+    return [StructuredTool.from_function(coroutine=echo, name="echo", description="Echoes text.")]
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    FakeServer.sessions = []
+    monkeypatch.setattr(agent_tools, "MultiServerMCPClient", FakeServer)
+    monkeypatch.setattr(langchain_mcp_adapters.tools, "load_mcp_tools", load_tools)
+    return MCPClientPool()
+
+
+def test_tool_node_follows_a_reconnected_server(pool):
+    server = {"name": "s", "url": "http://localhost:1/sse"}
+    state = {"messages": [AIMessage(content="", tool_calls=[{"name": "echo", "args": {"text": "hi"}, "id": "1"}])]}
+
+    async def run():
+        node = ParallelToolNode(await pool.get_tools(server), mcp_pool=pool)
+        first = (await node(state))["messages"][0].content
+        FakeServer.sessions[0]["lost"].set()
+        await asyncio.sleep(0.05)
+        second = (await node(state))["messages"][0].content
+        return first, second
+
+    assert asyncio.run(run()) == ("hi via session 1", "hi via session 2")
+    assert len(FakeServer.sessions) == 2
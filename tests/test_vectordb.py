@@ -0,0 +1,79 @@
+import hashlib
+
+import numpy as np
+import pytest
+
+pytest.importorskip("chromadb")
+
+from FILM69.llm import vectordb
+from FILM69.llm.vectordb import Records, VectorDB
+
+
+class HashEmbedding:
+    """Bag of hashed words, stands in for a SentenceTransformer."""
+
+    def __init__(self, name):
+        pass
+
+    def encode(self, texts, convert_to_numpy=True, **kwargs):
+        out = np.zeros((len(texts), 64), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for word in text.lower().split():
+                out[i, int(hashlib.md5(word.encode()).hexdigest(), 16) % 64] += 1
+        return out / np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-6)
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(vectordb, "SentenceTransformer", HashEmbedding)
+    return str(tmp_path)
+
+
+def test_hybrid_query_sees_writes_of_another_instance(db_path):
+    db = VectorDB(path=db_path)
+    db.add_or_update(ids=["a", "b"], documents=["product AB-123 manual", "product AB-124 manual"])
+    assert db.hybrid_query("AB-123", n_results=1)["id"] == ["a"]
+
+    other = VectorDB(path=db_path)
+    other.delete(ids=["a"])
+    other.add_or_update(ids=["c"], documents=["product XY-9 manual"])
+
+    assert "a" not in db.hybrid_query("AB-123", n_results=5)["id"]
+    assert db.hybrid_query("XY-9", n_results=1)["id"] == ["c"]
+
+
+def test_hybrid_query_drops_hits_deleted_elsewhere(db_path):
+    db = VectorDB(path=db_path)
+    db.add_or_update(ids=["a", "b"], documents=["product AB-123 manual", "product AB-124 manual"])
+    db.keyword_index
+    other = VectorDB(path=db_path)
+    other.delete(ids=["a"])
+    other.add_or_update(ids=["c"], documents=["something else"])  # same count, the index is not rebuilt
+    records = db.hybrid_query("AB-123", n_results=5)
+    assert "a" not in records["id"] and len(records["score"]) == len(records)
+    assert "a" not in db.keyword_index
+
+
+def test_hybrid_query_beyond_keyword_index_limit(db_path):
+    db = VectorDB(path=db_path, keyword_index_limit=1)
+    db.add_or_update(ids=["a", "b"], documents=["product AB-123 manual", "product AB-124 manual"])
+    with pytest.warns(UserWarning):
+        records = db.hybrid_query("AB-123", n_results=2)
+    assert sorted(records["id"]) == ["a", "b"]
+    assert db.keyword_index is None
+
+
+def test_records_behave_like_a_dataframe():
+    records = Records(["a", "b"], ["doc a", "doc b"], [{"page": 1}, {"page": 2}], [0.1, 0.2])
+    assert records["document"] == ["doc a", "doc b"] and records["page"] == [1, 2]
+    assert list(records) == ["id", "document", "distance", "page"]
+    assert "document" in records and "missing" not in records
+    assert list(records[[False, True]]["id"]) == ["b"]
+    assert list(records[records.to_pandas()["page"] > 1]["document"]) == ["doc b"]
+    assert list(records[["id", "page"]].columns) == ["id", "page"]
+
+    records["distance"] = records.to_pandas()["distance"].apply(lambda d: f"{d:.1f}")
+    records["label"] = ["x", "y"]
+    assert list(records["distance"]) == ["0.1", "0.2"]
+    assert "label" in records and records.rows()[1]["label"] == "y"
+    assert records.to_dict()["label"] == {0: "x", 1: "y"}